@@ -1,184 +1,686 @@
-import pdb
 import os
-import io
 import csv
 import time
-import pandas as pd
-import boto3
-from typing import Callable
+import hashlib
+import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager, nullcontext
+from itertools import islice
+from typing import Callable, Iterable
 from database import Database
 from dotenv import load_dotenv
+from anomalias import CAMPOS_ALERTA, DetectorAnomalias
+from cenarios import CENARIOS, chave_checkpoint, chave_rng, fatiar
+from envio_s3 import EnviadorS3
+from instrumentacao import MonitorRSS, registrar_span, span
+from leituras import CAMPOS, LoteLeituras, dias_locais, formatar_ts
+from pipeline import PipelineConcorrente
 from simulador_sensores import SimuladorSensor
-import datetime
 
 load_dotenv()
 BASE_URL = os.getenv("BASE_URL")
 
 
+def _gerar_bloco(simulador: SimuladorSensor, tarefa: tuple) -> tuple[LoteLeituras, float]:
+    # Roda no worker: a duracao volta junto com o bloco, pois os spans do worker nao chegam ao processo principal
+    inicio = time.perf_counter()
+    lote = simulador.gerar_bloco(*tarefa)
+    return lote, time.perf_counter() - inicio
+
+
+def _medir_bloco(gerar: Callable[[], LoteLeituras], nome: str) -> LoteLeituras:
+    with span(nome) as medida:
+        lote = gerar()
+        medida.linhas, medida.bytes = len(lote), lote.nbytes
+    return lote
+
+
+def _receber_bloco(futuro, sensor: str) -> LoteLeituras:
+    """
+    Espera o bloco de um worker: o tempo de espera vai para o span 'fila_geracao' e a geracao
+    em si, medida no worker, para o span gerar_<sensor>.
+    """
+    with span('fila_geracao'):
+        lote, segundos = futuro.result()
+    registrar_span(f"gerar_{sensor}", segundos, len(lote), lote.nbytes)
+    return lote
+
+
+def _mapear_em_ordem(executor: ProcessPoolExecutor, simulador: SimuladorSensor, tarefas: list[tuple], janela: int):
+    """
+    Distribui as tarefas no pool e devolve os blocos na ordem das tarefas,
+    com no maximo `janela` blocos em andamento para limitar a memoria.
+    """
+    pendentes = deque()
+    for tarefa in tarefas:
+        pendentes.append((executor.submit(_gerar_bloco, simulador, tarefa), tarefa[0]))
+        if len(pendentes) >= janela:
+            yield _receber_bloco(*pendentes.popleft())
+    while pendentes:
+        yield _receber_bloco(*pendentes.popleft())
+
+
+def gerar_blocos(simulador: SimuladorSensor, tarefas: list[tuple], workers: int = 1):
+    """
+    Gera os blocos das tarefas (argumentos de SimuladorSensor.gerar_bloco), na ordem das tarefas,
+    no proprio processo (workers=1) ou num pool de processos.
+    """
+    with ProcessPoolExecutor(max_workers=workers) if workers > 1 else nullcontext() as executor:
+        if executor is None:
+            for tarefa in tarefas:
+                yield _medir_bloco(lambda: simulador.gerar_bloco(*tarefa), f"gerar_{tarefa[0]}")
+        else:
+            yield from _mapear_em_ordem(executor, simulador, tarefas, janela=2 * workers)
+
+
 class AlgasSimulador:
-    def __init__(self):
-        os.mkdir('output') if not os.path.exists('output') else None
-        os.mkdir('output/plot') if not os.path.exists('output/plot') else None
-        os.mkdir('output/csv') if not os.path.exists('output/csv') else None
+    def __init__(self, cenarios: list[dict] | None = None, shard: tuple[int, int] | None = None):
+        """
+        :param cenarios: Devices simulados (padrao: cenarios.CENARIOS; ver cenarios.carregar_registro).
+        :param shard: (i, N) para processar so a fatia i de N dos devices. Banco, arquivos locais,
+            manifesto e objetos no S3 levam o sufixo da fatia, entao as N fatias podem rodar na
+            mesma maquina ou no mesmo bucket sem sobrescrever umas as outras.
+        """
+        self.cenarios = fatiar(CENARIOS if cenarios is None else cenarios, shard)
+        self.sufixo = f"-shard{shard[0]}de{shard[1]}" if shard else ""
 
-        self.db = Database(db_name="algas")
-        self.db.create_table()
+        # Banco e pastas de saida so sao criados quando uma etapa precisa deles
+        self._db: Database | None = None
+        self._saida_pronta = False
 
         self.simulador = SimuladorSensor(
-            self.db,
+            None,
             n_dados=500,
             intervalo_ms=1000 * 60 * 30,
             alerta="nenhum")
 
-    def send_to_s3(self, records: list[dict]):
+        self._enviadores: dict[str, EnviadorS3] = {}
+
+    @property
+    def db(self) -> Database:
+        if self._db is None:
+            self._db = Database(db_name=f"algas{self.sufixo}")
+            self._db.create_table()
+        return self._db
+
+    @db.setter
+    def db(self, db: Database):
+        self._db = db
+
+    def preparar_saida(self):
+        """
+        Cria as pastas de output/ na primeira vez que uma etapa grava nelas.
+        """
+        if not self._saida_pronta:
+            for pasta in ('output/plot', 'output/csv', 'output/parquet'):
+                os.makedirs(pasta, exist_ok=True)
+            self._saida_pronta = True
+
+    def enviador(self, bucket_name: str = '') -> EnviadorS3:
+        """
+        Retorna o EnviadorS3 do bucket, criado uma unica vez e compartilhando o mesmo cliente.
+        """
+        bucket_name = bucket_name or os.getenv("AWS_S3_BUCKET_NAME", "raw-wattech10")
+        if bucket_name not in self._enviadores:
+            cliente = next(iter(self._enviadores.values())).cliente if self._enviadores else None
+            self._enviadores[bucket_name] = EnviadorS3(
+                bucket_name, cliente=cliente, manifesto=f"output/manifesto_s3{self.sufixo}.json")
+        return self._enviadores[bucket_name]
+
+    @contextmanager
+    def _linha_do_tempo(self):
+        """
+        Fixa a origem da linha do tempo durante uma execucao (SimuladorSensor.inicio_padrao_ms,
+        se nenhuma foi definida): todos os blocos, workers e o prefixo no S3 usam a mesma
+        meia-noite, mesmo que a execucao atravesse a virada do dia.
+        """
+        origem = self.simulador.inicio_ms
+        if origem is None:
+            self.simulador.inicio_ms = self.simulador.inicio_padrao_ms()
+        try:
+            yield
+        finally:
+            self.simulador.inicio_ms = origem
+
+    def prefixo_do_periodo(self) -> str:
+        """
+        Prefixo das keys no S3 com os dias (locais) que as leituras da execucao cobrem:
+        'AAAA-MM-DD' se cabem num dia, senao 'AAAA-MM-DD_AAAA-MM-DD' (primeiro e ultimo).
+        """
+        primeiro, ultimo = dias_locais(np.array(self.simulador.periodo_ms())).astype(str).tolist()
+        return primeiro if primeiro == ultimo else f"{primeiro}_{ultimo}"
+
+    def send_to_s3(self, arquivos: Iterable[str], raiz: str, formato: str = "parquet") -> dict | None:
+        """
+        Envia ao S3, sob o prefixo dos dias da execucao (prefixo_do_periodo), os arquivos que a
+        execucao ja gravou localmente, sem serializar os lotes de novo. A key e o caminho
+        relativo a `raiz`.
+
+        Falhas de envio sao exibidas e nao interrompem a execucao.
+
+        :param arquivos: Caminhos locais (ex.: EscritorParquet.arquivos ou o CSV consolidado).
+        :param raiz: Pasta local que corresponde ao prefixo do dia no bucket.
+        :param formato: "parquet" ou "csv" (so para as mensagens).
+        :return: Resumo do envio (ver EnviadorS3.enviar_arquivos), ou None se falhou.
+        """
         try:
-            df = pd.DataFrame(records)
-            if 'created_at' in df.columns:
-                df['created_at'] = pd.to_datetime(
-                    df['created_at']).dt.strftime("%Y-%m-%d %H:%M:%S")
-
-            csv_buffer = io.BytesIO()
-            df.to_csv(csv_buffer, index=False)
-            csv_buffer.seek(0)
-            s3_client = boto3.client(
-                's3',
-                aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-                aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-                region_name=os.getenv("AWS_REGION", "us-east-1")
-            )
-
-            timestamp = (datetime.date.today()-datetime.timedelta(days=1)).strftime("%Y-%m-%d")
-            object_key = f"{timestamp}/dados.csv"
-            bucket_name = os.getenv("AWS_S3_BUCKET_NAME", "raw-wattech10")
-
-            s3_client.upload_fileobj(
-                csv_buffer,
-                bucket_name,
-                object_key
-            )
+            timestamp = self.prefixo_do_periodo()
+            enviador = self.enviador()
+            resumo = enviador.enviar_arquivos([
+                (caminho, f"{timestamp}/{os.path.relpath(caminho, raiz).replace(os.sep, '/')}")
+                for caminho in arquivos
+            ])
+            if resumo['falhas']:
+                raise RuntimeError(f"{resumo['falhas']} arquivo(s) nao enviados")
 
             print(
-                f"\033[32mParquet file uploaded to S3: s3://{bucket_name}/{object_key}\033[0m")
+                f"\033[32m{formato.capitalize()} files uploaded to S3: s3://{enviador.bucket}/{timestamp}/ "
+                f"({resumo['enviados']} enviados, {resumo['pulados']} sem mudanca)\033[0m")
+            return resumo
 
         except Exception as e:
-            print(f"\033[31mError uploading parquet to S3: {e}\033[0m")
+            print(f"\033[31mError uploading {formato} to S3: {e}\033[0m")
+            return None
+
+    def _carga(self, adiar_indices: bool | None, linhas: int):
+        """
+        Contexto da carga no banco: carga_em_massa (indices recriados no final) quando
+        `adiar_indices` pede ou, com None, quando as `linhas` da execucao sao muitas frente a tabela.
+        """
+        if adiar_indices is None:
+            adiar_indices = self.db.compensa_adiar_indices(linhas)
+        return self.db.carga_em_massa() if adiar_indices else nullcontext()
 
     def simular_dados_sensor(
         self,
         sensor_func: Callable,
         device:str,
-        location:str
+        location:str,
+        tamanho_bloco: int = 50_000,
+        blocos: Iterable[LoteLeituras] | None = None,
+        sensor_writer=None
     ):
         """
-        Executa a simulacao de dados para uma funcao de sensor.
+        Executa a simulacao de dados para uma funcao de sensor, em blocos.
+
+        Cada bloco e gravado no CSV do gerador e repassado adiante no pipeline.
 
         :param sensor_func: Funcao de simulacao de sensor a ser executada.
-        :param cenario: Identificacao do cenArio.
-        :return: Dados simulados do sensor.
+        :param device: Device do cenario.
+        :param location: Local do cenario.
+        :param tamanho_bloco: Quantidade maxima de leituras por bloco.
+        :param blocos: Blocos ja gerados para o cenario (ex.: por um pool de processos).
+        :param sensor_writer: csv.writer do CSV do gerador, compartilhado pelos devices do mesmo
+            gerador (ver gerar_cenarios); sem ele o CSV e criado so com este device.
+        :return: Gerador de LoteLeituras do cenario.
         """
-        sensor_csv_filename = f"output/csv/cenario_{
-            sensor_func.__name__}_sensores.csv"
+        with ExitStack() as pilha:
+            if sensor_writer is None:
+                sensor_writer = self._abrir_csv_cenario(pilha, sensor_func.__name__)
+            if blocos is None:
+                blocos = self.simulador.gerar_blocos(sensor_func.__name__, device, location, tamanho_bloco)
+            for lote in blocos:
+                with span('csv_cenario', len(lote), lote.nbytes):
+                    sensor_writer.writerows(lote.linhas())
+                yield lote
+
+    def _abrir_csv_cenario(self, pilha: ExitStack, sensor: str):
+        """
+        Cria output/csv/cenario_<sensor>_sensores.csv (fechado junto com `pilha`) e retorna o writer.
+        """
+        self.preparar_saida()
+        sensor_csvfile = pilha.enter_context(
+            open(f"output/csv/cenario_{sensor}{self.sufixo}_sensores.csv", 'w', newline=''))
+        sensor_writer = csv.writer(sensor_csvfile)
+        sensor_writer.writerow(['sensor_model',
+                                'measure_unit',
+                                'device',
+                                'location',
+                                'data_type',
+                                'data',
+                                'created_at'])
+        return sensor_writer
+
+    def gerar_cenarios(
+        self,
+        cenarios: list[dict],
+        tamanho_bloco: int = 50_000,
+        semente: int | None = None,
+        workers: int = 1
+    ):
+        """
+        Encadeia os blocos de todos os cenarios num unico fluxo, na ordem dos cenarios.
 
-        with open(sensor_csv_filename, 'w', newline='') as sensor_csvfile:
-            sensor_writer = csv.writer(sensor_csvfile)
-            sensor_writer.writerow(['sensor_model',
-                                    'measure_unit',
-                                    'device',
-                                    'location',
-                                    'data_type',
-                                    'data',
-                                    'created_at'])
+        Cada bloco usa um RNG derivado de (semente, device, bloco), entao o resultado
+        de cada device e o mesmo com qualquer quantidade de workers ou de shards. Os devices
+        de um mesmo gerador vao para o mesmo CSV de cenario, aberto uma unica vez.
 
-            print(f"Iniciando simulacao para o sensor {sensor_func.__name__}...")
-            dados = sensor_func(device, location)
+        :param cenarios: Lista de cenarios (sensor_func, device, location).
+        :param tamanho_bloco: Quantidade maxima de leituras por bloco.
+        :param semente: Semente da execucao.
+        :param workers: Quantidade de processos geradores (1 gera no proprio processo).
+        :return: Gerador de LoteLeituras.
+        """
+        janelas = self.simulador.janelas(tamanho_bloco)
+        tarefas = [
+            (cenario['sensor_func'].__name__, cenario['device'], cenario['location'],
+             inicio, n, semente,
+             chave_rng(chave_checkpoint({**cenario, 'sensor': cenario['sensor_func'].__name__})), bloco)
+            for cenario in cenarios
+            for bloco, (inicio, n) in enumerate(janelas)
+        ]
+
+        fonte = gerar_blocos(self.simulador, tarefas, workers)
+        writers = {}
+        with ExitStack() as pilha:
+            for cenario in cenarios:
+                sensor = cenario['sensor_func'].__name__
+                if sensor not in writers:
+                    writers[sensor] = self._abrir_csv_cenario(pilha, sensor)
+                yield from self.simular_dados_sensor(
+                    **cenario, tamanho_bloco=tamanho_bloco, blocos=islice(fonte, len(janelas)),
+                    sensor_writer=writers[sensor])
+        print(f"Simulacao concluida: {len(cenarios)} devices em {len(writers)} CSVs de cenario.")
+
+    def gerar_sites(self, sites: list[str], tamanho_bloco: int = 50_000, semente: int | None = None,
+                    grafo=None):
+        """
+        Fonte do pipeline com os sites gerados juntos e correlacionados pelo grafo de influencia
+        (ver SimuladorGrafo), no lugar de um cenario independente por device.
+
+        :param sites: Nomes dos sites (viram a location das leituras).
+        :param tamanho_bloco: Quantidade maxima de leituras por sensor em cada bloco.
+        :param semente: Semente do RNG da simulacao.
+        :param grafo: SimuladorGrafo ja montado (padrao: um sobre o grafo da WatTech).
+        :return: Gerador de LoteLeituras.
+        """
+        from simulador_grafo import SimuladorGrafo
 
-            for record in dados:
-                sensor_writer.writerow(record.values())
+        grafo = grafo if grafo is not None else SimuladorGrafo(self.simulador)
+        self.simulador.rng = np.random.default_rng(semente)
+        print(f"Executando simulacao correlacionada de {len(sites)} sites...")
+        # Mesmas janelas de SimuladorGrafo.gerar_blocos, com cada bloco medido como na geracao por cenario
+        for inicio, n in self.simulador.janelas(tamanho_bloco):
+            yield _medir_bloco(lambda: grafo.gerar(sites, inicio, n), 'gerar_grafo')
 
-            print(f"Simulacao do cenArio {sensor_func.__name__} concluída.")
+    def _fonte(self, tamanho_bloco: int, semente: int, workers: int,
+               sites: list[str] | None = None) -> tuple[Iterable[LoteLeituras], int]:
+        """
+        Fonte dos blocos de run e run_sobreposto: os sites correlacionados pelo grafo, se
+        informados, ou os cenarios do registro.
 
-        return dados
+        :return: (gerador de LoteLeituras, total de linhas previsto).
+        """
+        if sites:
+            from simulador_grafo import SimuladorGrafo
+
+            grafo = SimuladorGrafo(self.simulador)
+            linhas = len(sites) * grafo.series_por_site * self.simulador.n_dados
+            return self.gerar_sites(sites, tamanho_bloco, semente, grafo), linhas
 
-    def enviar_csv_para_s3(self, bucket_name='', prefixo='csv/'):
-        s3 = boto3.client('s3')
-        folder_path = 'output/csv'
+        cenarios = [
+            {"sensor_func": getattr(self.simulador, cenario["sensor"]),
+             "device": cenario["device"],
+             "location": cenario["location"]}
+            for cenario in self.cenarios
+        ]
+        linhas = len(cenarios) * self.simulador.n_dados
+        return self.gerar_cenarios(cenarios, tamanho_bloco, semente, workers), linhas
+
+    def persistir_no_banco(self, lotes: Iterable[LoteLeituras]):
+        """
+        Etapa do pipeline que grava cada bloco na tabela sensores e o repassa adiante.
+        """
+        for lote in lotes:
+            self.db.inserir_lote(lote)
+            yield lote
+
+    def detectar_anomalias(self, lotes: Iterable[LoteLeituras], detector: DetectorAnomalias | None = None,
+                           caminho: str | None = None):
+        """
+        Etapa do pipeline que passa cada bloco pelo detector de anomalias, anexa os alertas
+        ao CSV de alertas e repassa o bloco adiante.
+        """
+        detector = detector if detector is not None else DetectorAnomalias()
+        caminho = caminho or f"output/csv/alertas{self.sufixo}.csv"
+        self.preparar_saida()
+        with open(caminho, 'w', newline='') as arquivo:
+            writer = csv.DictWriter(arquivo, fieldnames=CAMPOS_ALERTA)
+            writer.writeheader()
+            for lote in lotes:
+                with span('detectar_anomalias', len(lote), lote.nbytes):
+                    alertas = detector.processar(lote)
+                    # O detector devolve ts em epoch ms; no CSV ele sai no texto local dos demais CSVs
+                    for alerta, ts in zip(alertas, formatar_ts([alerta['ts'] for alerta in alertas]).tolist()):
+                        alerta['ts'] = ts
+                    writer.writerows(alertas)
+                yield lote
+
+        resumo = detector.metricas.resumo()
+        print(f"Deteccao de anomalias: {resumo['alertas']} alertas em {resumo['leituras']} leituras "
+              f"({resumo['leituras_por_s']:.0f} leituras/s)")
+
+    def escrever_csv(self, lotes: Iterable[LoteLeituras], caminho: str | None = None, sep: str = ';'):
+        """
+        Etapa do pipeline que anexa cada bloco ao CSV consolidado e o repassa adiante.
+        """
+        caminho = caminho or f"output/csv/dados{self.sufixo}.csv"
+        self.preparar_saida()
+        with open(caminho, 'w', newline='') as arquivo:
+            writer = csv.writer(arquivo, delimiter=sep)
+            writer.writerow(CAMPOS)
+            for lote in lotes:
+                with span('csv_consolidado', len(lote), lote.nbytes):
+                    writer.writerows(lote.linhas())
+                yield lote
+
+    def enviar_csv_para_s3(self, bucket_name='', prefixo='csv/', pasta='output/csv'):
+        """
+        Envia os CSVs da pasta ao S3 em paralelo, pulando os que nao mudaram desde o ultimo envio.
 
-        if not os.path.exists(folder_path):
-            print(f"Pasta {folder_path} nao existe.")
+        :param bucket_name: Bucket de destino (padrao: AWS_S3_BUCKET_NAME).
+        :param prefixo: Prefixo das keys no bucket.
+        :param pasta: Pasta local com os CSVs.
+        :return: Resumo do envio (ver EnviadorS3.enviar_arquivos).
+        """
+        if not os.path.exists(pasta):
+            print(f"Pasta {pasta} nao existe.")
             return
 
-        for filename in os.listdir(folder_path):
-            pdb.set_trace()
-            if filename.endswith(".csv"):
-                local_path = os.path.join(folder_path, filename)
-                s3_key = f"{prefixo}{filename}"
-                try:
-                    s3.upload_file(local_path, bucket_name, s3_key)
-                    print(f"Arquivo enviado para S3: {s3_key}")
-                except Exception as e:
-                    print(f"Erro ao enviar {filename} para S3: {e}")
+        resumo = self.enviador(bucket_name).enviar_pasta(pasta, prefixo, extensoes=(".csv",))
+        print(f"Arquivos enviados para S3: {resumo['enviados']} enviados, {resumo['pulados']} sem mudanca, "
+              f"{resumo['falhas']} falhas em {resumo['segundos']:.1f}s")
+        return resumo
 
-    def run(self):
+    def escrever_parquet(self, lotes: Iterable[LoteLeituras], raiz: str = "output/parquet",
+                         prefixo_arquivo: str | None = None, arquivos: list[str] | None = None):
         """
-        Executa a simulacao de dados para todos os cenArios de sensores.
+        Etapa do pipeline que grava cada bloco em Parquet particionado por dia e sensorModel
+        e o repassa adiante. Ao final, os caminhos gravados sao acrescentados a `arquivos`.
         """
-        cenarios = [
-        # FLUKE 1735 — medidor trifAsico para cargas grandes
-        {"sensor_func": self.simulador.fluke_1735, "device": "Ar-Condicionado 18.000 BTU", "location": "Sala de Reunioes"},
-        {"sensor_func": self.simulador.fluke_1735, "device": "Ar-Condicionado 15.000 BTU", "location": "Auditorio"},
-        {"sensor_func": self.simulador.fluke_1735, "device": "Ar-Condicionado 12.000 BTU", "location": "Sala de Servidores"},
-        {"sensor_func": self.simulador.fluke_1735, "device": "Aquecedor de Ambiente", "location": "Deposito"},
-
-        # SHELLY EM — monitoramento de circuito geral ou setorial
-        {"sensor_func": self.simulador.shelly_em, "device": "Disjuntor Geral", "location": "Quadro de Distribuicao"},
-        {"sensor_func": self.simulador.shelly_em, "device": "Circuito de Iluminacao", "location": "Corredor Principal"},
-        {"sensor_func": self.simulador.shelly_em, "device": "Circuito de Tomadas", "location": "Sala de Engenharia"},
-        {"sensor_func": self.simulador.shelly_em, "device": "Painel de Energia", "location": "Subestacao Interna"},
-
-        # SONOFF POW R3 — medicao direta em cargas de tomada
-        {"sensor_func": self.simulador.sonoff_pow_r3, "device": "Lâmpada Incandescente - 100 W", "location": "Escritorio"},
-        {"sensor_func": self.simulador.sonoff_pow_r3, "device": "Multiprocessador", "location": "Copa"},
-        {"sensor_func": self.simulador.sonoff_pow_r3, "device": "Ventilador Pequeno", "location": "Sala de Atendimento"},
-        {"sensor_func": self.simulador.sonoff_pow_r3, "device": "Impressora", "location": "Area Administrativa"},
-
-        # PZEM-004T — sensor monofAsico de energia para cargas médias
-        {"sensor_func": self.simulador.pzem_004t, "device": "Aquecedor de Ambiente", "location": "Sala Técnica"},
-        {"sensor_func": self.simulador.pzem_004t, "device": "Ar-Condicionado 10.000 BTU", "location": "Escritorio"},
-        {"sensor_func": self.simulador.pzem_004t, "device": "Circulador de Ar Grande", "location": "Galpao de Producao"},
-        {"sensor_func": self.simulador.pzem_004t, "device": "TV em Cores - 20", "location": "Sala de Espera"},
-
-        # HMS M21 — medidor modular de energia, versAtil para cargas diversas
-        {"sensor_func": self.simulador.hms_m21, "device": "TV em Cores - 29", "location": "Sala de Descanso"},
-        {"sensor_func": self.simulador.hms_m21, "device": "TV em Cores - 14", "location": "Recepcao"},
-        {"sensor_func": self.simulador.hms_m21, "device": "Lâmpada Incandescente - 60 W", "location": "Corredor"},
-        {"sensor_func": self.simulador.hms_m21, "device": "Multiprocessador", "location": "Copa"},
-
-        # CT CLAMP — transformador de corrente, ideal para monitoramento de ramais e cargas pesadas
-        {"sensor_func": self.simulador.ct_clamp, "device": "Ar-Condicionado 12.000 BTU", "location": "Recepcao"},
-        {"sensor_func": self.simulador.ct_clamp, "device": "Ar-Condicionado 7.500 BTU", "location": "Sala de Supervisao"},
-        {"sensor_func": self.simulador.ct_clamp, "device": "Circulador de Ar Pequeno/Médio", "location": "Oficina"},
-        {"sensor_func": self.simulador.ct_clamp, "device": "Ventilador Pequeno", "location": "Area de Producao"}
-    ]
-
-
-        df_dados = pd.DataFrame()
-
-        for cenario in cenarios:
-            print(f"Executando simulacao para o sensor {cenario['sensor_func'].__name__}...")
-            dados = self.simular_dados_sensor(**cenario)
-            df_dados = pd.concat([df_dados, pd.DataFrame(dados)])
-
-        df_dados.to_csv("output/csv/dados.csv", index=False, sep=';')
+        from parquet_sensores import EscritorParquet
+
+        prefixo_arquivo = prefixo_arquivo or f"part{self.sufixo}"
+        with EscritorParquet(raiz, prefixo_arquivo=prefixo_arquivo) as escritor:
+            for lote in lotes:
+                escritor.escrever(lote)
+                yield lote
+        if arquivos is not None:
+            arquivos.extend(escritor.arquivos)
+
+    def serializar_parquet(self, lotes: Iterable[LoteLeituras], raiz: str = "output/parquet",
+                           linhas_por_arquivo: int = 500_000):
+        """
+        Etapa do pipeline sobreposto que grava os blocos em Parquet particionado, fechando
+        cada arquivo ao atingir `linhas_por_arquivo`, e repassa os caminhos ja fechados.
+        """
+        from parquet_sensores import EscritorParquet
+
+        self.preparar_saida()
+        with EscritorParquet(raiz, prefixo_arquivo=f"part{self.sufixo}",
+                             linhas_por_arquivo=linhas_por_arquivo) as escritor:
+            for lote in lotes:
+                escritor.escrever(lote)
+                while escritor.concluidos:
+                    yield escritor.concluidos.popleft()
+        yield from escritor.concluidos
+
+    def serializar_csv(self, lotes: Iterable[LoteLeituras], pasta: str = "output/csv",
+                       linhas_por_arquivo: int = 500_000, sep: str = ';'):
+        """
+        Etapa do pipeline sobreposto que grava os blocos em CSVs de ate ~`linhas_por_arquivo`
+        linhas (dados-0000.csv, dados-0001.csv, ...), no mesmo formato do escrever_csv, e
+        repassa os caminhos ja fechados.
+        """
+        self.preparar_saida()
+        parte, linhas, arquivo = 0, 0, None
+        try:
+            for lote in lotes:
+                if arquivo is None:
+                    caminho = os.path.join(pasta, f"dados{self.sufixo}-{parte:04d}.csv")
+                    arquivo = open(caminho, 'w', newline='')
+                    writer = csv.writer(arquivo, delimiter=sep)
+                    writer.writerow(CAMPOS)
+                with span('csv_consolidado', len(lote), lote.nbytes):
+                    writer.writerows(lote.linhas())
+                linhas += len(lote)
+                if linhas >= linhas_por_arquivo:
+                    arquivo.close()
+                    arquivo, linhas, parte = None, 0, parte + 1
+                    yield caminho
+            if arquivo is not None:
+                arquivo.close()
+                arquivo = None
+                yield caminho
+        finally:
+            if arquivo is not None:
+                arquivo.close()
+
+    def persistir_incremental(self, lotes: Iterable[tuple[str, LoteLeituras]],
+                              persistidos: dict[str, int | None]):
+        """
+        Etapa do pipeline incremental: grava no banco so as leituras posteriores ao
+        checkpoint persistido de cada device, avancando o checkpoint na mesma transacao.
 
+        :param lotes: Pares (chave do checkpoint, lote).
+        :param persistidos: chave -> ultimo_persistido_ts.
+        :return: Gerador dos lotes (completos) para as etapas seguintes.
+        """
+        for chave, lote in lotes:
+            persistido = persistidos.get(chave)
+            novos = lote if persistido is None else lote.selecionar(np.flatnonzero(lote.ts > persistido))
+            if len(novos):
+                self.db.inserir_lote(novos, checkpoint=chave)
+            yield lote
+
+    def run_incremental(
+        self,
+        ate_ms: int | None = None,
+        semente: int = 2025,
+        tamanho_bloco: int = 50_000,
+        workers: int = 1,
+        raiz: str = "output/parquet",
+        prefixo_s3: str = "parquet/"
+    ) -> dict[str, int]:
+        """
+        Gera, persiste e envia apenas o intervalo entre o checkpoint de cada device e `ate_ms`.
+
+        As leituras ficam numa linha do tempo absoluta (indice = ts / passo) e cada janela
+        usa um RNG derivado de (semente, device, indice inicial), entao repetir uma execucao
+        interrompida regenera exatamente os mesmos dados. O nome dos arquivos Parquet deriva
+        dos checkpoints de partida, entao a repeticao sobrescreve as mesmas keys; o envio pula
+        arquivos que ja estao no S3 e o banco pula leituras ja persistidas. O checkpoint de
+        geracao so avanca depois que o envio termina sem falhas.
+
+        :param ate_ms: Fim (exclusivo) do intervalo; padrao: agora.
+        :param semente: Semente fixa entre execucoes (necessaria para a idempotencia).
+        :param tamanho_bloco: Quantidade maxima de leituras por bloco.
+        :param workers: Quantidade de processos geradores.
+        :param raiz: Pasta local do Parquet particionado.
+        :param prefixo_s3: Prefixo das keys no bucket.
+        :return: chave -> ultimo ts gerado nesta execucao.
+        """
+        from parquet_sensores import EscritorParquet
+
+        passo = self.simulador.intervalo_ms
+        fim = (ate_ms if ate_ms is not None else int(time.time() * 1000)) // passo * passo
+        checkpoints = self.db.ler_checkpoints()
+
+        tarefas, chaves, inicios, ultimos = [], [], [], {}
+        for cenario in self.cenarios:
+            chave = chave_checkpoint(cenario)
+            gerado, _ = checkpoints.get(chave, (None, None))
+            inicio_ts = gerado + passo if gerado is not None else self.simulador.meia_noite_de_ontem_ms()
+            inicios.append(f"{chave}={inicio_ts}")
+            i0, i1 = -(-inicio_ts // passo), fim // passo
+            for inicio in range(i0, i1, tamanho_bloco):
+                n = min(tamanho_bloco, i1 - inicio)
+                tarefas.append((cenario['sensor'], cenario['device'], cenario['location'],
+                                inicio, n, semente, chave_rng(chave), inicio))
+                chaves.append(chave)
+            if i1 > i0:
+                ultimos[chave] = (i1 - 1) * passo
+
+        if not tarefas:
+            print("Nenhum dado novo desde o ultimo checkpoint.")
+            return {}
+
+        id_execucao = hashlib.sha1("|".join(sorted(inicios)).encode()).hexdigest()[:12]
+        print(f"Execucao incremental {id_execucao}: {len(ultimos)} devices, {len(tarefas)} blocos ate {fim}")
+
+        persistidos = {chave: persistido for chave, (_, persistido) in checkpoints.items()}
+        origem, self.simulador.inicio_ms = self.simulador.inicio_ms, 0
         try:
-            self.send_to_s3(df_dados.to_dict("records"))
-            print("\033[32mDados enviados para o S3 com sucesso!\033[0m")
-        except ValueError as e:
-            print(f"\033[31m{e} sem acesso ao S3 !!!\033[0m")
-        except Exception as e:
-            print(f"Erro ao enviar dados para o S3: {e}")
+            blocos = zip(chaves, gerar_blocos(self.simulador, tarefas, workers))
+            blocos = self.persistir_incremental(blocos, persistidos)
+            with EscritorParquet(raiz, prefixo_arquivo=f"part-{id_execucao}") as escritor:
+                for lote in blocos:
+                    escritor.escrever(lote)
+        finally:
+            self.simulador.inicio_ms = origem
+
+        # Envia so os arquivos desta execucao, para o custo nao crescer com o historico
+        resumo = self.enviador().enviar_arquivos([
+            (caminho, f"{prefixo_s3}{os.path.relpath(caminho, raiz).replace(os.sep, '/')}")
+            for caminho in escritor.arquivos
+        ])
+        if resumo['falhas']:
+            print(f"\033[31m{resumo['falhas']} arquivo(s) nao enviados; checkpoints mantidos para nova tentativa.\033[0m")
+            return {}
+
+        self.db.marcar_gerado(ultimos)
+        print(f"\033[32mIncremental concluido: {resumo['enviados']} arquivos enviados, "
+              f"{resumo['pulados']} ja presentes no S3.\033[0m")
+        return ultimos
+
+    def run(
+        self,
+        tamanho_bloco: int = 50_000,
+        semente: int | None = None,
+        workers: int = 1,
+        formato: str = "parquet",
+        detectar: bool = False,
+        adiar_indices: bool | None = None,
+        sites: list[str] | None = None
+    ):
+        """
+        Executa a simulacao de dados para todos os cenArios de sensores.
+
+        Os cenarios sao gerados em blocos que atravessam, em fluxo, o banco e a saida
+        consolidada, entao o pico de memoria nao depende do volume. As leituras terminam na
+        meia-noite de hoje (ver SimuladorSensor.inicio_padrao_ms). No final, os arquivos
+        gravados por esta execucao sao enviados ao S3 como estao, sob o prefixo dos dias cobertos.
+
+        :param tamanho_bloco: Quantidade maxima de leituras por bloco.
+        :param semente: Semente da execucao; sem ela uma nova e sorteada e exibida.
+        :param workers: Quantidade de processos geradores.
+        :param formato: Formato da saida consolidada e do S3: "parquet" (output/parquet) ou "csv" (output/csv/dados.csv).
+        :param detectar: Passa os blocos pelo detector de anomalias (alertas em output/csv/alertas.csv).
+        :param adiar_indices: Remove os indices de sensores durante a carga e os recria no final;
+            None decide pelo tamanho da carga frente a tabela (ver Database.compensa_adiar_indices).
+        :param sites: Gera esses sites correlacionados pelo grafo de influencia (ver gerar_sites)
+            no lugar dos cenarios do registro.
+        :return: Pico de RSS deste processo durante a execucao, em bytes (amostrado; sem os workers).
+        """
+        if semente is None:
+            semente = np.random.SeedSequence().entropy
+        print(f"Semente da execucao: {semente}")
+
+        with MonitorRSS() as memoria, self._linha_do_tempo():
+            blocos, linhas = self._fonte(tamanho_bloco, semente, workers, sites)
+            with self._carga(adiar_indices, linhas):
+                if detectar:
+                    blocos = self.detectar_anomalias(blocos)
+                blocos = self.persistir_no_banco(blocos)
+                arquivos = []
+                if formato == "parquet":
+                    raiz = "output/parquet"
+                    blocos = self.escrever_parquet(blocos, raiz, arquivos=arquivos)
+                else:
+                    raiz = "output/csv"
+                    arquivos.append(os.path.join(raiz, f"dados{self.sufixo}.csv"))
+                    blocos = self.escrever_csv(blocos, arquivos[0])
+                # Falhas de geracao, banco ou escrita local interrompem a execucao; so o envio e tolerado
+                deque(blocos, maxlen=0)
+
+            self.send_to_s3(arquivos, raiz, formato)
+
+        print(f"Pico de RSS da execucao: {memoria.pico / 2**20:.1f} MiB")
 
         print("Simulacao de todos os cenArios concluída!")
+        return memoria.pico
+
+    def run_sobreposto(
+        self,
+        tamanho_bloco: int = 50_000,
+        semente: int | None = None,
+        workers: int = 1,
+        formato: str = "parquet",
+        detectar: bool = False,
+        tamanho_fila: int = 4,
+        linhas_por_arquivo: int = 500_000,
+        adiar_indices: bool | None = None,
+        sites: list[str] | None = None
+    ) -> dict[str, dict]:
+        """
+        Executa a simulacao com geracao, banco, serializacao e envio ao S3 em paralelo.
+
+        Cada etapa roda na sua thread, ligada a seguinte por uma fila de `tamanho_fila` itens
+        (ver PipelineConcorrente). A serializacao fecha um arquivo a cada `linhas_por_arquivo`
+        linhas e o envio comeca assim que o primeiro fica pronto, entao o tempo total tende ao
+        da etapa mais lenta. Os arquivos ficam em output/parquet (ou output/csv, em partes)
+        e vao para o bucket sob o prefixo dos dias cobertos, como no run.
+
+        :param tamanho_bloco: Quantidade maxima de leituras por bloco.
+        :param semente: Semente da execucao; sem ela uma nova e sorteada e exibida.
+        :param workers: Quantidade de processos geradores.
+        :param formato: "parquet" ou "csv".
+        :param detectar: Passa os blocos pelo detector de anomalias antes do banco.
+        :param tamanho_fila: Capacidade de cada fila entre etapas.
+        :param linhas_por_arquivo: Linhas por arquivo antes de liberar o arquivo para envio.
+        :param adiar_indices: Como no run.
+        :param sites: Como no run.
+        :return: Metricas de cada etapa (itens, itens/s, ocupacao e profundidade da fila).
+        """
+        if semente is None:
+            semente = np.random.SeedSequence().entropy
+        print(f"Semente da execucao: {semente}")
+
+        pasta = "output/parquet" if formato == "parquet" else "output/csv"
+        serializar = self.serializar_parquet if formato == "parquet" else self.serializar_csv
+        enviador = self.enviador()
+        resumo_envio = {}
+
+        def banco(lotes):
+            return self.persistir_no_banco(self.detectar_anomalias(lotes) if detectar else lotes)
+
+        def envio(arquivos):
+            return enviador.enviar_fluxo(
+                ((caminho, f"{timestamp}/{os.path.relpath(caminho, pasta).replace(os.sep, '/')}")
+                 for caminho in arquivos),
+                resumo_envio)
+
+        with self._linha_do_tempo():
+            timestamp = self.prefixo_do_periodo()
+            fonte, linhas = self._fonte(tamanho_bloco, semente, workers, sites)
+            with self._carga(adiar_indices, linhas):
+                metricas = PipelineConcorrente(tamanho_fila).executar(
+                    fonte,
+                    [('banco', banco),
+                     ('serializacao', lambda lotes: serializar(lotes, pasta, linhas_por_arquivo)),
+                     ('envio', envio)],
+                    nome_fonte='geracao')
+
+        for nome, etapa in metricas.items():
+            print(f"{nome}: {etapa['itens']} itens ({etapa['itens_por_s']}/s), ocupacao {etapa['ocupacao']:.0%}, "
+                  f"fila media {etapa['fila_media']} (max {etapa['fila_max']})")
+        if resumo_envio.get('falhas'):
+            print(f"\033[31m{resumo_envio['falhas']} arquivo(s) nao enviados ao S3\033[0m")
+        else:
+            print(f"\033[32mArquivos enviados para s3://{enviador.bucket}/{timestamp}/ "
+                  f"({resumo_envio.get('enviados', 0)} enviados, {resumo_envio.get('pulados', 0)} sem mudanca)\033[0m")
+        return metricas
 
 
 if __name__ == "__main__":
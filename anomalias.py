@@ -0,0 +1,218 @@
+import json
+import time
+import argparse
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from cenarios import CENARIOS
+from leituras import LoteLeituras
+from simulador_sensores import SimuladorSensor
+
+TIPOS_ALERTA = ('alto', 'baixo', 'subtensao', 'sobretensao', 'afundamento', 'elevacao')
+CAMPOS_ALERTA = ('tipo', 'sensorModel', 'device', 'location', 'dataType', 'data', 'referencia', 'ts')
+
+# Faixa aceitavel por dataType (leituras fora dela viram subtensao/sobretensao)
+FAIXAS = {'Tensão': (198.0, 242.0)}
+# Valor nominal por dataType, usado para detectar rampas de afundamento/elevacao
+NOMINAIS = {'Tensão': 220.0}
+
+
+@dataclass
+class MetricasDeteccao:
+    leituras: int = 0
+    alertas: int = 0
+    segundos: float = 0.0
+    por_tipo: dict = field(default_factory=lambda: dict.fromkeys(TIPOS_ALERTA, 0))
+
+    def resumo(self) -> dict:
+        segundos = self.segundos or float('nan')
+        return {
+            'leituras': self.leituras,
+            'alertas': self.alertas,
+            'segundos': round(self.segundos, 3),
+            'leituras_por_s': round(self.leituras / segundos, 1),
+            'alertas_por_s': round(self.alertas / segundos, 1),
+            'por_tipo': dict(self.por_tipo),
+        }
+
+
+class DetectorAnomalias:
+    """
+    Detecta anomalias em fluxo, lote a lote, mantendo estado O(1) por (device, dataType):
+    contagem, media e soma dos quadrados dos desvios (Welford) e o evento de tensao em curso.
+
+    Cada leitura e comparada com as estatisticas de todas as leituras anteriores do mesmo
+    device/dataType, inclusive as do proprio lote, sem laco em Python por leitura:
+
+    - alto/baixo: |x - media| acima de `limiar_z` desvios padrao (apos `min_amostras` leituras);
+    - subtensao/sobretensao: leitura fora da faixa do dataType (ex.: 198-242 V);
+    - afundamento/elevacao: inicio de uma rampa que se afasta mais de `desvio_evento` do
+      nominal; um alerta por evento, mesmo que a rampa atravesse varios lotes.
+    """
+
+    def __init__(
+            self,
+            limiar_z: float = 4.0,
+            min_amostras: int = 30,
+            faixas: dict[str, tuple[float, float]] | None = None,
+            nominais: dict[str, float] | None = None,
+            desvio_evento: float = 4.0):
+        self.limiar_z = limiar_z
+        self.min_amostras = min_amostras
+        self.faixas = FAIXAS if faixas is None else faixas
+        self.nominais = NOMINAIS if nominais is None else nominais
+        self.desvio_evento = desvio_evento
+
+        self.chaves: dict[tuple[str, str], int] = {}
+        self.n = np.zeros(0, dtype=np.int64)
+        self.media = np.zeros(0)
+        self.m2 = np.zeros(0)
+        self.evento = np.zeros(0, dtype=np.int8)
+        self.metricas = MetricasDeteccao()
+
+    def _indices(self, lote: LoteLeituras) -> np.ndarray:
+        """
+        Traduz os codigos (device, dataType) do lote para o indice global do estado.
+        """
+        devices, tipos = lote.categorias['device'], lote.categorias['dataType']
+        combinado = lote.codigos['device'].astype(np.int64) * len(tipos) + lote.codigos['dataType']
+        unicos, inversos = np.unique(combinado, return_inverse=True)
+        mapa = np.array([
+            self.chaves.setdefault((devices[c // len(tipos)], tipos[c % len(tipos)]), len(self.chaves))
+            for c in unicos.tolist()], dtype=np.int64)
+
+        faltam = len(self.chaves) - len(self.n)
+        if faltam > 0:
+            self.n = np.concatenate((self.n, np.zeros(faltam, dtype=np.int64)))
+            self.media = np.concatenate((self.media, np.zeros(faltam)))
+            self.m2 = np.concatenate((self.m2, np.zeros(faltam)))
+            self.evento = np.concatenate((self.evento, np.zeros(faltam, dtype=np.int8)))
+        return mapa[inversos.reshape(-1)]
+
+    def _por_tipo(self, lote: LoteLeituras, valores: dict, padrao: float) -> np.ndarray:
+        return np.array([valores.get(tipo, padrao) for tipo in lote.categorias['dataType']],
+                        dtype=np.float64)[lote.codigos['dataType']]
+
+    def processar(self, lote: LoteLeituras) -> list[dict]:
+        """
+        Atualiza o estado com o lote e retorna os alertas encontrados.
+
+        :param lote: Lote de leituras (qualquer mistura de devices e dataTypes).
+        :return: Lista de dicts com os campos de CAMPOS_ALERTA (ts em epoch ms).
+        """
+        inicio = time.perf_counter()
+        if len(lote) == 0:
+            return []
+
+        chaves = self._indices(lote)
+        ordem = np.lexsort((lote.ts, chaves))
+        k, x = chaves[ordem], lote.data[ordem]
+
+        novo = np.ones(len(k), dtype=bool)
+        novo[1:] = k[1:] != k[:-1]
+        inicios = np.flatnonzero(novo)
+        fins = np.append(inicios[1:], len(k)) - 1
+        grupo = np.cumsum(novo) - 1
+        posicao = np.arange(len(k)) - inicios[grupo]
+        chaves_grupo = k[inicios]
+
+        # Somas prefixadas dos desvios em relacao a um deslocamento por grupo (media anterior ou,
+        # para device novo, a primeira leitura), o que mantem a precisao das somas
+        n0 = self.n[chaves_grupo]
+        deslocamento = np.where(n0 > 0, self.media[chaves_grupo], x[inicios])
+        d = x - deslocamento[grupo]
+        soma = np.cumsum(d)
+        soma_q = np.cumsum(d * d)
+        base, base_q = soma[inicios] - d[inicios], soma_q[inicios] - d[inicios] ** 2
+        s = soma - d - base[grupo]
+        q = soma_q - d * d - base_q[grupo]
+
+        # Estatisticas de todas as leituras anteriores (estado + prefixo do lote)
+        anteriores = n0[grupo] + posicao
+        with np.errstate(divide='ignore', invalid='ignore'):
+            media = deslocamento[grupo] + np.where(anteriores > 0, s / anteriores, 0)
+            m2 = self.m2[chaves_grupo][grupo] + q - np.where(anteriores > 0, s * s / anteriores, 0)
+        desvio = np.sqrt(np.maximum(m2, 0) / np.maximum(anteriores - 1, 1))
+        valido = (anteriores >= self.min_amostras) & (desvio > 0)
+        alto = valido & (x - media > self.limiar_z * desvio)
+        baixo = valido & (media - x > self.limiar_z * desvio)
+
+        minimos = self._por_tipo(lote, {t: f[0] for t, f in self.faixas.items()}, -np.inf)[ordem]
+        maximos = self._por_tipo(lote, {t: f[1] for t, f in self.faixas.items()}, np.inf)[ordem]
+        subtensao, sobretensao = x < minimos, x > maximos
+
+        # Evento: -1 abaixo e +1 acima do nominal; alerta so quando o sinal muda para nao zero
+        nominal = self._por_tipo(lote, self.nominais, np.nan)[ordem]
+        sinal = np.where(x < nominal - self.desvio_evento, -1,
+                         np.where(x > nominal + self.desvio_evento, 1, 0)).astype(np.int8)
+        anterior = np.empty_like(sinal)
+        anterior[1:] = sinal[:-1]
+        anterior[inicios] = self.evento[chaves_grupo]
+        inicio_evento = (sinal != 0) & (sinal != anterior)
+
+        # Atualiza o estado com o lote inteiro
+        total = n0 + (fins - inicios + 1)
+        s_total, q_total = s[fins] + d[fins], q[fins] + d[fins] ** 2
+        self.m2[chaves_grupo] = self.m2[chaves_grupo] + q_total - s_total * s_total / total
+        self.media[chaves_grupo] = deslocamento + s_total / total
+        self.n[chaves_grupo] = total
+        self.evento[chaves_grupo] = sinal[fins]
+
+        mascaras = (alto, baixo, subtensao, sobretensao,
+                    inicio_evento & (sinal < 0), inicio_evento & (sinal > 0))
+        referencias = (media, media, minimos, maximos, nominal, nominal)
+        linhas, tipos, valores_ref = [], [], []
+        for tipo, (mascara, referencia) in enumerate(zip(mascaras, referencias)):
+            indices = np.flatnonzero(mascara)
+            linhas.append(ordem[indices])
+            tipos.append(np.full(len(indices), tipo))
+            valores_ref.append(referencia[indices])
+            self.metricas.por_tipo[TIPOS_ALERTA[tipo]] += len(indices)
+
+        linhas, tipos, valores_ref = np.concatenate(linhas), np.concatenate(tipos), np.concatenate(valores_ref)
+        alertas = [
+            dict(zip(CAMPOS_ALERTA, campos))
+            for campos in zip(
+                [TIPOS_ALERTA[t] for t in tipos.tolist()],
+                lote.coluna('sensorModel')[linhas].tolist(),
+                lote.coluna('device')[linhas].tolist(),
+                lote.coluna('location')[linhas].tolist(),
+                lote.coluna('dataType')[linhas].tolist(),
+                lote.data[linhas].tolist(),
+                np.round(valores_ref, 5).tolist(),
+                lote.ts[linhas].tolist())
+        ]
+
+        self.metricas.leituras += len(lote)
+        self.metricas.alertas += len(alertas)
+        self.metricas.segundos += time.perf_counter() - inicio
+        return alertas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mede a vazao do detector de anomalias sobre uma frota simulada.")
+    parser.add_argument('--copias', type=int, default=100, help="Replicas de cada cenario")
+    parser.add_argument('--leituras', type=int, default=1_000, help="Leituras por device")
+    parser.add_argument('--tamanho-bloco', type=int, default=50_000)
+    parser.add_argument('--alerta', default='nenhum', choices=('nenhum', 'alto', 'baixo'))
+    parser.add_argument('--semente', type=int, default=0)
+    args = parser.parse_args()
+
+    simulador = SimuladorSensor(None, n_dados=args.leituras,
+                                intervalo_ms=1000 * 60 * 30, alerta=args.alerta)
+    detector = DetectorAnomalias()
+
+    print(f"Detectando anomalias em {len(CENARIOS) * args.copias} devices...")
+    # As copias de cada cenario sao geradas juntas (gerar_frota), em janelas de ~tamanho_bloco leituras
+    por_janela = max(args.tamanho_bloco // args.copias, 1)
+    for indice, cenario in enumerate(CENARIOS):
+        devices = [f"{cenario['device']} #{copia}" for copia in range(args.copias)]
+        for bloco, (inicio, n) in enumerate(simulador.janelas(por_janela)):
+            detector.processar(simulador.gerar_frota(
+                cenario['sensor'], devices, cenario['location'], inicio, n, args.semente, indice, bloco))
+    print(json.dumps(detector.metricas.resumo(), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+import json
+import time
+import heapq
+import asyncio
+import argparse
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from cenarios import CENARIOS, carregar_registro, fatiar, ler_shard
+from leituras import LoteLeituras
+from simulador_sensores import SimuladorSensor
+
+
+@dataclass
+class DispositivoVirtual:
+    indice: int
+    sensor: str
+    device: str
+    location: str
+    intervalo_ms: int
+    buffer: LoteLeituras | None = None
+    posicao: int = 0
+    blocos_gerados: int = 0
+    # Frota (sensor, intervalo_ms) do dispositivo e sua posicao nela
+    frota: int = 0
+    ordem: int = 0
+
+
+@dataclass
+class MetricasPublicacao:
+    mensagens: int = 0
+    leituras: int = 0
+    # Amostras mais recentes; limitadas para nao crescer em testes longos
+    latencias_ms: deque = field(default_factory=lambda: deque(maxlen=100_000))
+    atrasos_ms: deque = field(default_factory=lambda: deque(maxlen=100_000))
+    inicio: float = field(default_factory=time.perf_counter)
+
+    def resumo(self) -> dict:
+        duracao = time.perf_counter() - self.inicio
+        latencias = np.array(self.latencias_ms) if self.latencias_ms else np.zeros(1)
+        atrasos = np.array(self.atrasos_ms) if self.atrasos_ms else np.zeros(1)
+        return {
+            'duracao_s': round(duracao, 3),
+            'mensagens': self.mensagens,
+            'leituras': self.leituras,
+            'mensagens_por_s': round(self.mensagens / duracao, 1),
+            'leituras_por_s': round(self.leituras / duracao, 1),
+            'latencia_p50_ms': round(float(np.percentile(latencias, 50)), 3),
+            'latencia_p99_ms': round(float(np.percentile(latencias, 99)), 3),
+            'atraso_agenda_p99_ms': round(float(np.percentile(atrasos, 99)), 3),
+        }
+
+
+class PublicadorMemoria:
+    """
+    Substituto do broker MQTT em processo: guarda apenas contagens e, opcionalmente,
+    as ultimas mensagens. Serve para medir o simulador sem rede.
+    """
+
+    def __init__(self, metricas: MetricasPublicacao, guardar: int = 0):
+        self.metricas = metricas
+        self.guardar = guardar
+        self.mensagens: list[tuple[str, bytes]] = []
+
+    def publicar(self, topico: str, payload: bytes):
+        inicio = time.perf_counter()
+        if len(self.mensagens) < self.guardar:
+            self.mensagens.append((topico, payload))
+        self.metricas.latencias_ms.append((time.perf_counter() - inicio) * 1000)
+
+    def fechar(self):
+        pass
+
+
+class PublicadorMQTT:
+    """
+    Publica num broker MQTT com paho-mqtt. A latencia e medida do publish() ate a
+    confirmacao do broker (on_publish).
+    """
+
+    def __init__(self, metricas: MetricasPublicacao, host: str = 'localhost', port: int = 1883, qos: int = 1):
+        import paho.mqtt.client as mqtt
+
+        self.metricas = metricas
+        self.qos = qos
+        self._lock = threading.RLock()
+        self._enviados: dict[int, float] = {}
+        self._confirmados: dict[int, float] = {}
+
+        try:
+            self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        except AttributeError:  # paho-mqtt < 2.0
+            self.client = mqtt.Client()
+        self.client.on_publish = self._on_publish
+        self.client.connect(host, port)
+        self.client.loop_start()
+
+    def _on_publish(self, client, userdata, mid, *args):
+        agora = time.perf_counter()
+        with self._lock:
+            enviado = self._enviados.pop(mid, None)
+            if enviado is None:
+                # Confirmacao chegou antes de publicar() registrar o envio
+                self._confirmados[mid] = agora
+            else:
+                self.metricas.latencias_ms.append((agora - enviado) * 1000)
+
+    def publicar(self, topico: str, payload: bytes):
+        with self._lock:
+            inicio = time.perf_counter()
+            info = self.client.publish(topico, payload, qos=self.qos)
+            confirmado = self._confirmados.pop(info.mid, None)
+            if confirmado is None:
+                self._enviados[info.mid] = inicio
+            else:
+                self.metricas.latencias_ms.append((confirmado - inicio) * 1000)
+
+    def fechar(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+def publicar_leituras(publicador, topico: str, leituras: list[dict], leituras_por_mensagem: int):
+    """
+    Publica as leituras em mensagens JSON de no maximo `leituras_por_mensagem` itens.
+    """
+    for inicio in range(0, len(leituras), leituras_por_mensagem):
+        mensagem = leituras[inicio:inicio + leituras_por_mensagem]
+        publicador.publicar(topico, json.dumps(mensagem).encode())
+        publicador.metricas.mensagens += 1
+        publicador.metricas.leituras += len(mensagem)
+
+
+class FrotaAoVivo:
+    """
+    Agenda uma frota de dispositivos virtuais num unico event loop asyncio e publica
+    cada leitura no intervalo_ms do dispositivo.
+
+    Os dispositivos com o mesmo sensor e intervalo formam uma frota, gerada em blocos de
+    `leituras_por_bloco` leituras por device numa unica chamada a gerar_frota; cada
+    dispositivo consome a sua fatia do bloco uma leitura por vez. As leituras que vencem
+    no mesmo tick sao agrupadas em mensagens de ate `leituras_por_mensagem` leituras, por
+    modelo de sensor.
+    """
+
+    def __init__(
+            self,
+            simulador: SimuladorSensor,
+            publicador,
+            dispositivos: list[DispositivoVirtual],
+            topico: str = 'wattech/sensores',
+            leituras_por_mensagem: int = 50,
+            leituras_por_bloco: int = 256,
+            semente: int = 0):
+        self.simulador = simulador
+        self.publicador = publicador
+        self.dispositivos = dispositivos
+        self.topico = topico
+        self.leituras_por_mensagem = leituras_por_mensagem
+        self.leituras_por_bloco = leituras_por_bloco
+        self.semente = semente
+
+        indices_frota: dict[tuple[str, int], int] = {}
+        self.frotas: list[list[DispositivoVirtual]] = []
+        for dispositivo in dispositivos:
+            chave = (dispositivo.sensor, dispositivo.intervalo_ms)
+            if chave not in indices_frota:
+                indices_frota[chave] = len(self.frotas)
+                self.frotas.append([])
+            dispositivo.frota = indices_frota[chave]
+            dispositivo.ordem = len(self.frotas[dispositivo.frota])
+            self.frotas[dispositivo.frota].append(dispositivo)
+        # Ultimo bloco gerado de cada frota: frota -> (bloco, lote)
+        self._blocos: dict[int, tuple[int, LoteLeituras]] = {}
+        # Linha do tempo das leituras geradas (ts do indice 0); definida ao iniciar a publicacao
+        self.inicio_ms: int | None = None
+
+    @classmethod
+    def de_cenarios(cls, simulador: SimuladorSensor, publicador, cenarios: list[dict] = CENARIOS,
+                    copias: int = 1, **kwargs) -> 'FrotaAoVivo':
+        """
+        Monta a frota replicando os cenarios `copias` vezes (devices com sufixo #n).
+        """
+        dispositivos = []
+        for copia in range(copias):
+            for cenario in cenarios:
+                device = cenario['device'] if copias == 1 else f"{cenario['device']} #{copia}"
+                dispositivos.append(DispositivoVirtual(
+                    indice=len(dispositivos),
+                    sensor=cenario['sensor'],
+                    device=device,
+                    location=cenario['location'],
+                    intervalo_ms=cenario.get('intervalo_ms', simulador.intervalo_ms)))
+        return cls(simulador, publicador, dispositivos, **kwargs)
+
+    def _bloco_da_frota(self, frota: int, bloco: int) -> LoteLeituras:
+        """
+        Retorna o bloco `bloco` da frota, gerando-o para todos os devices de uma vez.
+
+        Os devices de uma frota tem o mesmo intervalo e pedem os blocos na mesma ordem, entao
+        basta guardar o ultimo; um bloco pedido fora de ordem e gerado de novo, igual, a partir
+        de (semente, frota, bloco).
+        """
+        guardado = self._blocos.get(frota)
+        if guardado is None or guardado[0] != bloco:
+            membros = self.frotas[frota]
+            self.simulador.intervalo_ms = membros[0].intervalo_ms
+            self.simulador.inicio_ms = self.inicio_ms
+            lote = self.simulador.gerar_frota(
+                membros[0].sensor, [d.device for d in membros], [d.location for d in membros],
+                inicio=bloco * self.leituras_por_bloco, n=self.leituras_por_bloco,
+                semente=self.semente, indice=frota, bloco=bloco)
+            guardado = self._blocos[frota] = (bloco, lote)
+        return guardado[1]
+
+    def _proxima_leitura(self, dispositivo: DispositivoVirtual) -> tuple:
+        if dispositivo.buffer is None or dispositivo.posicao >= len(dispositivo.buffer):
+            lote = self._bloco_da_frota(dispositivo.frota, dispositivo.blocos_gerados)
+            n = self.leituras_por_bloco
+            dispositivo.buffer = lote.fatiar(dispositivo.ordem * n, (dispositivo.ordem + 1) * n)
+            dispositivo.blocos_gerados += 1
+            dispositivo.posicao = 0
+        lote, i = dispositivo.buffer, dispositivo.posicao
+        dispositivo.posicao += 1
+        return tuple(lote.categorias[nome][lote.codigos[nome][i]]
+                     for nome in ('sensorModel', 'measureUnit', 'device', 'location', 'dataType')) + (
+            float(lote.data[i]),)
+
+    def _publicar_vencidas(self, vencidas: list[DispositivoVirtual], agora_ms: int):
+        por_modelo: dict[str, list[dict]] = {}
+        for dispositivo in vencidas:
+            modelo, unidade, device, location, tipo, valor = self._proxima_leitura(dispositivo)
+            por_modelo.setdefault(modelo, []).append({
+                'sensorModel': modelo, 'measureUnit': unidade, 'device': device,
+                'location': location, 'dataType': tipo, 'data': valor, 'ts': agora_ms})
+
+        for modelo, leituras in por_modelo.items():
+            publicar_leituras(self.publicador, f"{self.topico}/{modelo.replace(' ', '_')}",
+                              leituras, self.leituras_por_mensagem)
+
+    async def executar(self, duracao_s: float) -> dict:
+        """
+        Publica ate `duracao_s` segundos e retorna o resumo das metricas.
+        """
+        metricas = self.publicador.metricas
+        inicio = time.monotonic()
+        if self.inicio_ms is None:
+            self.inicio_ms = int(time.time() * 1000)
+        # Espalha o primeiro disparo de cada dispositivo ao longo do seu intervalo
+        agenda = [(inicio + (d.indice % 997) / 997 * d.intervalo_ms / 1000, d.indice) for d in self.dispositivos]
+        heapq.heapify(agenda)
+
+        while agenda and time.monotonic() - inicio < duracao_s:
+            agora = time.monotonic()
+            vencidas = []
+            while agenda and agenda[0][0] <= agora:
+                previsto, indice = heapq.heappop(agenda)
+                dispositivo = self.dispositivos[indice]
+                metricas.atrasos_ms.append((agora - previsto) * 1000)
+                vencidas.append(dispositivo)
+                heapq.heappush(agenda, (previsto + dispositivo.intervalo_ms / 1000, indice))
+
+            if vencidas:
+                self._publicar_vencidas(vencidas, int(time.time() * 1000))
+
+            espera = agenda[0][0] - time.monotonic() if agenda else 0
+            await asyncio.sleep(max(espera, 0))
+
+        return metricas.resumo()
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Publica leituras simuladas ao vivo via MQTT.")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=1883)
+    parser.add_argument('--memoria', action='store_true', help="Usa o publicador em processo, sem broker")
+    parser.add_argument('--copias', type=int, default=1, help="Replicas de cada cenario")
+    parser.add_argument('--intervalo-ms', type=int, default=1000)
+    parser.add_argument('--duracao', type=float, default=10.0)
+    parser.add_argument('--leituras-por-mensagem', type=int, default=50)
+    parser.add_argument('--semente', type=int, default=0)
+    parser.add_argument('--amplitude-diaria', type=float, default=0.0,
+                        help="Acrescimo relativo do consumo do Shelly nos picos do dia (0 = sem perfil)")
+    parser.add_argument('--registro', help="Registro de devices em JSON/TOML (padrao: cenarios.CENARIOS)")
+    parser.add_argument('--shard', type=ler_shard, help="i/N: publica so a fatia i de N dos devices")
+    args = parser.parse_args(argv)
+
+    simulador = SimuladorSensor(None, n_dados=0, intervalo_ms=args.intervalo_ms,
+                                amplitude_diaria=args.amplitude_diaria)
+    metricas = MetricasPublicacao()
+    publicador = PublicadorMemoria(metricas) if args.memoria else PublicadorMQTT(metricas, args.host, args.port)
+    cenarios = carregar_registro(args.registro) if args.registro else CENARIOS
+    frota = FrotaAoVivo.de_cenarios(
+        simulador, publicador, fatiar(cenarios, args.shard), copias=args.copias,
+        leituras_por_mensagem=args.leituras_por_mensagem, semente=args.semente)
+
+    print(f"Publicando {len(frota.dispositivos)} dispositivos por {args.duracao}s...")
+    try:
+        resumo = asyncio.run(frota.executar(args.duracao))
+    finally:
+        publicador.fechar()
+    print(json.dumps(resumo, indent=2))
+
+
+if __name__ == "__main__":
+    main()
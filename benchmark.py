@@ -0,0 +1,311 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+from collections import deque
+from statistics import median
+
+from memory_profiler import memory_usage
+from sqlalchemy import insert
+
+from algas_sensores import AlgasSimulador, gerar_blocos
+from cenarios import CENARIOS, GERADORES
+from database import Database
+from envio_s3 import ClienteS3Local, EnviadorS3
+from simulador_sensores import SimuladorSensor
+
+# Comandos curtos (cron, containers) cujo tempo de inicializacao acompanhamos
+COMANDOS_INICIALIZACAO = {
+    'ajuda': ['main.py', '--help'],
+    'generate --dry-run': ['main.py', 'generate', '--dry-run'],
+    'import algas_sensores': ['-c', 'import algas_sensores'],
+}
+
+# Executa o comando e, na saida, escreve o pico de RSS (VmHWM) no stderr. O ru_maxrss do filho
+# nao serve: no Linux ele herda o pico do processo pai no fork.
+_SONDA_MEMORIA = """
+import atexit, runpy, sys
+
+def _pico():
+    with open('/proc/self/status') as status:
+        sys.stderr.write(next(linha for linha in status if linha.startswith('VmHWM')))
+
+atexit.register(_pico)
+argumentos = sys.argv[1:]
+sys.argv = argumentos
+if argumentos[0] == '-c':
+    exec(argumentos[1])
+else:
+    runpy.run_path(argumentos[0], run_name='__main__')
+"""
+
+
+def modulos_mais_lentos(comando: list[str], n: int = 10) -> list[tuple[str, float]]:
+    """
+    Roda o comando com `python -X importtime` e retorna os `n` imports mais caros dos dois
+    primeiros niveis (o modulo importado pelo comando e os que ele importa diretamente).
+
+    :return: Pares (modulo, milissegundos cumulativos).
+    """
+    saida = subprocess.run([sys.executable, '-X', 'importtime', *comando], cwd=os.path.dirname(os.path.abspath(__file__)),
+                           capture_output=True, text=True).stderr
+    modulos = []
+    for linha in saida.splitlines():
+        partes = linha.split(' | ')
+        # O nome e indentado com dois espacos por nivel; a linha de cabecalho nao tem numero
+        if len(partes) == 3 and partes[1].strip().isdigit() and not partes[2].startswith('   '):
+            modulos.append((partes[2].strip(), int(partes[1]) / 1000))
+    return sorted(modulos, key=lambda m: m[1], reverse=True)[:n]
+
+
+class Benchmark:
+    """
+    Mede tempo, blocos processados e pico de RSS de cada gerador e de cada etapa
+    (CSV, SQLite, upload) variando volume, quantidade de devices e workers.
+
+    Cada caso vira uma linha da tabela teste_carga e pode ser comparado com um
+    baseline salvo em JSON para apontar regressoes de desempenho.
+    """
+
+    def __init__(self, db: Database, tamanho_bloco: int = 50_000, semente: int = 2025):
+        self.db = db
+        self.db.create_table()
+        self.tamanho_bloco = tamanho_bloco
+        self.semente = semente
+        self.resultados: list[dict] = []
+
+    def _simulador(self, n_dados: int) -> SimuladorSensor:
+        return SimuladorSensor(self.db, n_dados=n_dados, intervalo_ms=1000 * 60 * 30)
+
+    def _tarefas(self, simulador: SimuladorSensor, cenarios: list[dict]) -> list[tuple]:
+        return [
+            (cenario['sensor'], f"{cenario['device']} #{indice}", cenario['location'],
+             inicio, n, self.semente, indice, bloco)
+            for indice, cenario in enumerate(cenarios)
+            for bloco, (inicio, n) in enumerate(simulador.janelas(self.tamanho_bloco))
+        ]
+
+    @staticmethod
+    def _frota(dispositivos: int, sensor: str | None = None) -> list[dict]:
+        base = [c for c in CENARIOS if sensor is None or c['sensor'] == sensor]
+        return [base[i % len(base)] for i in range(dispositivos)]
+
+    def medir(self, cenario: str, funcao, *args) -> dict:
+        """
+        Executa `funcao(*args)` (que retorna a quantidade de blocos processados) medindo
+        o tempo e o pico de RSS, e grava o resultado em teste_carga.
+        """
+        inicio = time.perf_counter()
+        memoria, blocos = memory_usage(
+            (funcao, args), interval=0.01, max_usage=True, retval=True, include_children=True)
+        tempo = time.perf_counter() - inicio
+
+        return self._registrar({'cenario': cenario, 'tempo': tempo, 'blocos': float(blocos), 'memoria': float(memoria)})
+
+    def _registrar(self, resultado: dict) -> dict:
+        self.db.db_execute(insert(self.db.teste_carga()).values(**resultado), commit=True)
+        self.resultados.append(resultado)
+        print(f"{resultado['cenario']}: {resultado['tempo']:.3f}s, {resultado['blocos']:.0f} blocos, "
+              f"pico {resultado['memoria']:.1f} MiB")
+        return resultado
+
+    def medir_inicializacao(self, repeticoes: int = 5) -> list[dict]:
+        """
+        Mede o tempo de parede (mediana) e o pico de RSS de cada comando de COMANDOS_INICIALIZACAO,
+        cada repeticao num processo Python novo, e grava em teste_carga como 'inicializacao <comando>'.
+        """
+        pasta = os.path.dirname(os.path.abspath(__file__))
+        resultados = []
+        for nome, argumentos in COMANDOS_INICIALIZACAO.items():
+            tempos, picos = [], []
+            for _ in range(repeticoes):
+                inicio = time.perf_counter()
+                processo = subprocess.run([sys.executable, '-c', _SONDA_MEMORIA, *argumentos], cwd=pasta,
+                                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+                tempos.append(time.perf_counter() - inicio)
+                picos.append(int(processo.stderr.strip().splitlines()[-1].split()[1]) / 1024)
+            resultados.append(self._registrar({
+                'cenario': f"inicializacao {nome}", 'tempo': median(tempos),
+                'blocos': float(repeticoes), 'memoria': max(picos)}))
+
+        for modulo, ms in modulos_mais_lentos(COMANDOS_INICIALIZACAO['import algas_sensores']):
+            print(f"  {modulo}: {ms:.1f} ms")
+        return resultados
+
+    def gerar(self, simulador: SimuladorSensor, cenarios: list[dict], workers: int = 1) -> int:
+        return sum(1 for _ in gerar_blocos(simulador, self._tarefas(simulador, cenarios), workers))
+
+    def gerar_e_consumir(self, simulador: SimuladorSensor, cenarios: list[dict], etapa) -> int:
+        lotes = gerar_blocos(simulador, self._tarefas(simulador, cenarios))
+        return sum(1 for _ in etapa(lotes))
+
+    def executar(self, volumes: list[int], dispositivos: list[int], workers: list[int]):
+        """
+        Varre os casos de geradores, workers e etapas para cada volume e quantidade de devices.
+        """
+        algas = AlgasSimulador()
+        pasta = tempfile.mkdtemp(prefix='benchmark_')
+        try:
+            banco = Database(db_name=os.path.join(pasta, 'benchmark'))
+            banco.create_table()
+            algas.db = banco
+            enviador = EnviadorS3('benchmark', cliente=ClienteS3Local(os.path.join(pasta, 's3')), manifesto=None)
+
+            for n_dados in volumes:
+                simulador = self._simulador(n_dados)
+                for qtd in dispositivos:
+                    for sensor in GERADORES:
+                        self.medir(f"gerador={sensor} volume={n_dados} devices={qtd}",
+                                   self.gerar, simulador, self._frota(qtd, sensor))
+
+                    frota = self._frota(qtd)
+                    for n_workers in workers:
+                        self.medir(f"geracao volume={n_dados} devices={qtd} workers={n_workers}",
+                                   self.gerar, simulador, frota, n_workers)
+
+                    csv_path = os.path.join(pasta, 'dados.csv')
+                    self.medir(f"etapa=csv volume={n_dados} devices={qtd}",
+                               self.gerar_e_consumir, simulador, frota,
+                               lambda lotes: algas.escrever_csv(lotes, csv_path))
+                    self.medir(f"etapa=sqlite volume={n_dados} devices={qtd}",
+                               self.gerar_e_consumir, simulador, frota, algas.persistir_no_banco)
+
+                    pasta_parquet = os.path.join(pasta, f'parquet_{n_dados}_{qtd}')
+                    deque(algas.escrever_parquet(gerar_blocos(simulador, self._tarefas(simulador, frota)),
+                                                 pasta_parquet), maxlen=0)
+                    self.medir(f"etapa=upload volume={n_dados} devices={qtd}",
+                               lambda: enviador.enviar_pasta(pasta_parquet, f"{n_dados}_{qtd}/")['enviados'])
+        finally:
+            shutil.rmtree(pasta, ignore_errors=True)
+
+    def frota(self, dispositivos: int = 10_000, n_dados: int = 1_000) -> dict[str, float]:
+        """
+        Compara, por gerador, gerar `dispositivos` devices um a um (gerar_bloco em laco) com
+        gerar todos de uma vez (gerar_frota, um array devices x tempo).
+
+        :return: gerador -> quantas vezes gerar_frota foi mais rapido.
+        """
+        simulador = self._simulador(n_dados)
+        devices = [f"Device {i:05d}" for i in range(dispositivos)]
+        ganhos = {}
+        for sensor in GERADORES:
+            def em_laco():
+                for indice, device in enumerate(devices):
+                    simulador.gerar_bloco(sensor, device, 'Frota', 0, n_dados, self.semente, indice, 0)
+                return dispositivos
+
+            def vetorizado():
+                simulador.gerar_frota(sensor, devices, 'Frota', 0, n_dados, self.semente)
+                return 1
+
+            laco = self.medir(f"frota={sensor} devices={dispositivos} volume={n_dados} modo=laco", em_laco)
+            frota = self.medir(f"frota={sensor} devices={dispositivos} volume={n_dados} modo=vetorizado", vetorizado)
+            ganhos[sensor] = laco['tempo'] / frota['tempo']
+            print(f"  {sensor}: {ganhos[sensor]:.0f}x mais rapido em uma chamada")
+        return ganhos
+
+    def bytes_por_leitura(self, n_dados: int = 100_000) -> dict[str, dict[str, float]]:
+        """
+        Mede, com tracemalloc, os bytes por leitura de cada gerador na representacao legada
+        (lista de dicts com ts em texto) e no LoteLeituras colunar.
+
+        :return: gerador -> {'dicts': bytes/leitura, 'lote': bytes/leitura}.
+        """
+        simulador = self._simulador(n_dados)
+        resultado = {}
+        for sensor in GERADORES:
+            medidas = {}
+            for formato, gerar in (('dicts', getattr(simulador, sensor)),
+                                   ('lote', getattr(simulador, f"{sensor}_lote"))):
+                tracemalloc.start()
+                dados = gerar()
+                memoria, _ = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                medidas[formato] = memoria / len(dados)
+                del dados
+            resultado[sensor] = medidas
+            print(f"{sensor}: {medidas['dicts']:.0f} bytes/leitura em dicts, "
+                  f"{medidas['lote']:.1f} bytes/leitura no lote ({medidas['dicts'] / medidas['lote']:.0f}x)")
+        return resultado
+
+    def comparar(self, caminho_baseline: str, tolerancia: float = 0.2, folga_s: float = 0.05) -> list[str]:
+        """
+        Compara os resultados com o baseline; tempo ou memoria acima de (1 + tolerancia)
+        vezes o valor de referencia conta como regressao. Diferencas de tempo menores que
+        `folga_s` sao ignoradas, pois casos muito curtos oscilam mais que a tolerancia.
+
+        :return: Lista de descricoes das regressoes.
+        """
+        if not os.path.exists(caminho_baseline):
+            print(f"Baseline {caminho_baseline} nao encontrado; nada a comparar.")
+            return []
+        with open(caminho_baseline) as arquivo:
+            baseline = json.load(arquivo)
+
+        regressoes = []
+        for resultado in self.resultados:
+            referencia = baseline.get(resultado['cenario'])
+            if referencia is None:
+                continue
+            for metrica in ('tempo', 'memoria'):
+                if metrica == 'tempo' and resultado[metrica] - referencia[metrica] < folga_s:
+                    continue
+                if resultado[metrica] > referencia[metrica] * (1 + tolerancia):
+                    regressoes.append(
+                        f"{resultado['cenario']}: {metrica} {resultado[metrica]:.3f} "
+                        f"(baseline {referencia[metrica]:.3f})")
+        return regressoes
+
+    def salvar_baseline(self, caminho_baseline: str):
+        baseline = {r['cenario']: {'tempo': r['tempo'], 'memoria': r['memoria']} for r in self.resultados}
+        with open(caminho_baseline, 'w') as arquivo:
+            json.dump(baseline, arquivo, indent=1, sort_keys=True)
+        print(f"Baseline salvo em {caminho_baseline}")
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Benchmark de carga dos geradores e etapas do simulador.")
+    parser.add_argument('--volumes', type=int, nargs='+', default=[1_000, 10_000])
+    parser.add_argument('--dispositivos', type=int, nargs='+', default=[24, 96])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--baseline', default='benchmark_baseline.json')
+    parser.add_argument('--tolerancia', type=float, default=0.2)
+    parser.add_argument('--salvar-baseline', action='store_true')
+    parser.add_argument('--bytes-por-leitura', action='store_true',
+                        help="Compara so a memoria por leitura de dicts e LoteLeituras")
+    parser.add_argument('--inicializacao', action='store_true',
+                        help="Mede so o tempo de inicializacao dos comandos curtos do CLI")
+    parser.add_argument('--frota', type=int, metavar='DEVICES',
+                        help="Compara gerar DEVICES devices em laco com uma unica chamada vetorizada")
+    args = parser.parse_args(argv)
+
+    benchmark = Benchmark(Database(db_name="algas"))
+    if args.bytes_por_leitura:
+        benchmark.bytes_por_leitura(max(args.volumes))
+        return
+    if args.inicializacao:
+        benchmark.medir_inicializacao()
+    elif args.frota:
+        benchmark.frota(args.frota, min(args.volumes))
+    else:
+        benchmark.executar(args.volumes, args.dispositivos, args.workers)
+
+    if args.salvar_baseline:
+        benchmark.salvar_baseline(args.baseline)
+        return
+
+    regressoes = benchmark.comparar(args.baseline, args.tolerancia)
+    for regressao in regressoes:
+        print(f"\033[31mRegressao: {regressao}\033[0m")
+    if regressoes:
+        raise SystemExit(1)
+    print("\033[32mSem regressoes em relacao ao baseline.\033[0m")
+
+
+if __name__ == "__main__":
+    main()
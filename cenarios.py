@@ -0,0 +1,138 @@
+import json
+import zlib
+import hashlib
+
+# Cada cenario pareia um gerador do SimuladorSensor com um device e um local
+CENARIOS = [
+    # FLUKE 1735 — medidor trifAsico para cargas grandes
+    {"sensor": "fluke_1735", "device": "Ar-Condicionado 18.000 BTU", "location": "Sala de Reunioes"},
+    {"sensor": "fluke_1735", "device": "Ar-Condicionado 15.000 BTU", "location": "Auditorio"},
+    {"sensor": "fluke_1735", "device": "Ar-Condicionado 12.000 BTU", "location": "Sala de Servidores"},
+    {"sensor": "fluke_1735", "device": "Aquecedor de Ambiente", "location": "Deposito"},
+
+    # SHELLY EM — monitoramento de circuito geral ou setorial
+    {"sensor": "shelly_em", "device": "Disjuntor Geral", "location": "Quadro de Distribuicao"},
+    {"sensor": "shelly_em", "device": "Circuito de Iluminacao", "location": "Corredor Principal"},
+    {"sensor": "shelly_em", "device": "Circuito de Tomadas", "location": "Sala de Engenharia"},
+    {"sensor": "shelly_em", "device": "Painel de Energia", "location": "Subestacao Interna"},
+
+    # SONOFF POW R3 — medicao direta em cargas de tomada
+    {"sensor": "sonoff_pow_r3", "device": "Lâmpada Incandescente - 100 W", "location": "Escritorio"},
+    {"sensor": "sonoff_pow_r3", "device": "Multiprocessador", "location": "Copa"},
+    {"sensor": "sonoff_pow_r3", "device": "Ventilador Pequeno", "location": "Sala de Atendimento"},
+    {"sensor": "sonoff_pow_r3", "device": "Impressora", "location": "Area Administrativa"},
+
+    # PZEM-004T — sensor monofAsico de energia para cargas médias
+    {"sensor": "pzem_004t", "device": "Aquecedor de Ambiente", "location": "Sala Técnica"},
+    {"sensor": "pzem_004t", "device": "Ar-Condicionado 10.000 BTU", "location": "Escritorio"},
+    {"sensor": "pzem_004t", "device": "Circulador de Ar Grande", "location": "Galpao de Producao"},
+    {"sensor": "pzem_004t", "device": "TV em Cores - 20", "location": "Sala de Espera"},
+
+    # HMS M21 — medidor modular de energia, versAtil para cargas diversas
+    {"sensor": "hms_m21", "device": "TV em Cores - 29", "location": "Sala de Descanso"},
+    {"sensor": "hms_m21", "device": "TV em Cores - 14", "location": "Recepcao"},
+    {"sensor": "hms_m21", "device": "Lâmpada Incandescente - 60 W", "location": "Corredor"},
+    {"sensor": "hms_m21", "device": "Multiprocessador", "location": "Copa"},
+
+    # CT CLAMP — transformador de corrente, ideal para monitoramento de ramais e cargas pesadas
+    {"sensor": "ct_clamp", "device": "Ar-Condicionado 12.000 BTU", "location": "Recepcao"},
+    {"sensor": "ct_clamp", "device": "Ar-Condicionado 7.500 BTU", "location": "Sala de Supervisao"},
+    {"sensor": "ct_clamp", "device": "Circulador de Ar Pequeno/Médio", "location": "Oficina"},
+    {"sensor": "ct_clamp", "device": "Ventilador Pequeno", "location": "Area de Producao"}
+]
+
+# Geradores do SimuladorSensor que um cenario pode usar
+GERADORES = ('shelly_em', 'sonoff_pow_r3', 'pzem_004t', 'hms_m21', 'fluke_1735', 'ct_clamp')
+
+
+def chave_checkpoint(cenario: dict) -> str:
+    """
+    Identifica o device de um cenario nos checkpoints (o mesmo nome de device aparece em mais de um cenario).
+    """
+    return f"{cenario['sensor']}|{cenario['device']}|{cenario['location']}"
+
+
+def chave_rng(chave: str) -> int:
+    """
+    Inteiro de 128 bits (blake2b) da chave do device, usado no spawn_key do RNG de cada bloco
+    (o SeedSequence o divide em palavras de 32 bits). Com 32 bits, frotas de dezenas de
+    milhares de devices ja teriam colisoes, e devices colididos teriam o mesmo ruido.
+    """
+    return int.from_bytes(hashlib.blake2b(chave.encode(), digest_size=16).digest(), 'big')
+
+
+def expandir_frota(frota: dict) -> list[dict]:
+    """
+    Expande uma frota declarada por modelo, ex.: 500 Sonoff POW R3 distribuidos em 40 salas:
+
+        {"sensor": "sonoff_pow_r3", "quantidade": 500, "locais": 40,
+         "device": "Sonoff {i:04d}", "location": "Sala {local:02d}"}
+
+    `{i}` e a posicao do device na frota (0..quantidade-1) e `{local}` a do local (1..locais),
+    distribuidos em rodizio. Demais chaves (ex.: intervalo_ms) sao copiadas para cada cenario.
+    """
+    extras = {k: v for k, v in frota.items() if k not in ('sensor', 'quantidade', 'locais', 'device', 'location')}
+    locais = frota.get('locais', 1)
+    return [
+        {"sensor": frota['sensor'],
+         "device": frota['device'].format(i=i, local=i % locais + 1),
+         "location": frota['location'].format(i=i, local=i % locais + 1),
+         **extras}
+        for i in range(frota['quantidade'])
+    ]
+
+
+def carregar_registro(caminho: str) -> list[dict]:
+    """
+    Le o registro de devices de um arquivo JSON ou TOML com as listas `dispositivos`
+    (cenarios avulsos, no formato de CENARIOS) e `frotas` (ver expandir_frota).
+
+    :raises ValueError: Gerador desconhecido ou device repetido.
+    """
+    if caminho.endswith('.toml'):
+        import tomllib  # Python 3.11+
+
+        with open(caminho, 'rb') as arquivo:
+            registro = tomllib.load(arquivo)
+    else:
+        with open(caminho, encoding='utf-8') as arquivo:
+            registro = json.load(arquivo)
+
+    cenarios = list(registro.get('dispositivos', []))
+    for frota in registro.get('frotas', []):
+        cenarios.extend(expandir_frota(frota))
+
+    vistos = set()
+    for cenario in cenarios:
+        if cenario['sensor'] not in GERADORES:
+            raise ValueError(f"Gerador desconhecido no registro: {cenario['sensor']}")
+        chave = chave_checkpoint(cenario)
+        if chave in vistos:
+            raise ValueError(f"Device repetido no registro: {chave}")
+        vistos.add(chave)
+    return cenarios
+
+
+def ler_shard(texto: str) -> tuple[int, int]:
+    """
+    Converte 'i/N' (0 <= i < N) em (i, N); serve de `type` para o argparse.
+    """
+    try:
+        indice, total = (int(parte) for parte in texto.split('/'))
+    except ValueError:
+        raise ValueError(f"Shard invalido: {texto!r} (use i/N)")
+    if not 0 <= indice < total:
+        raise ValueError(f"Shard invalido: {texto!r} (precisa de 0 <= i < N)")
+    return indice, total
+
+
+def fatiar(cenarios: list[dict], shard: tuple[int, int] | None) -> list[dict]:
+    """
+    Retorna a fatia `i` de `N` dos cenarios. A fatia de cada device depende so da sua chave
+    (crc32), entao as N fatias sao disjuntas, cobrem o registro inteiro e nao mudam quando
+    outros devices entram ou saem do registro.
+    """
+    if shard is None:
+        return list(cenarios)
+    indice, total = shard
+    return [c for c in cenarios if zlib.crc32(chave_checkpoint(c).encode()) % total == indice]
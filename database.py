@@ -1,30 +1,200 @@
 import os
-from sqlalchemy import MetaData, Column, Table, create_engine, INTEGER, String, Float, TIMESTAMP, BIGINT
+import numpy as np
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+from sqlalchemy import (MetaData, Column, Index, Table, create_engine, event, select, text,
+                        INTEGER, String, Float, BIGINT)
 from sqlalchemy.orm import sessionmaker
 
+from instrumentacao import span
+from leituras import LoteLeituras
+
+# Tabelas de agregacao por intervalo (buckets alinhados em epoch UTC), da mais grossa para a mais fina
+ROLLUPS = (
+    ('sensores_dia', 86_400_000),
+    ('sensores_hora', 3_600_000),
+    ('sensores_minuto', 60_000),
+)
+
+
+def agregar_lote(lote, tamanho_ms: int) -> list[tuple]:
+    """
+    Agrega um LoteLeituras por (device, dataType, bucket de `tamanho_ms`).
+
+    :return: Tuplas (deviceId, dataType, bucket, count, min, max, sum, last_ts, last_value).
+    """
+    if len(lote) == 0:
+        return []
+    devices = lote.codigos['device']
+    tipos = lote.codigos['dataType']
+    buckets = lote.ts // tamanho_ms * tamanho_ms
+    # Ordena por device, tipo, bucket e ts: o ultimo elemento de cada grupo e a leitura mais recente
+    ordem = np.lexsort((lote.ts, buckets, tipos, devices))
+    devices, tipos, buckets = devices[ordem], tipos[ordem], buckets[ordem]
+    dados, ts = lote.data[ordem], lote.ts[ordem]
+
+    mudou = (np.diff(devices) != 0) | (np.diff(tipos) != 0) | (np.diff(buckets) != 0)
+    inicios = np.concatenate(([0], np.flatnonzero(mudou) + 1))
+    fins = np.append(inicios[1:], len(ordem)) - 1
+
+    return list(zip(
+        [lote.categorias['device'][c] for c in devices[inicios].tolist()],
+        [lote.categorias['dataType'][c] for c in tipos[inicios].tolist()],
+        buckets[inicios].tolist(),
+        (fins - inicios + 1).tolist(),
+        np.minimum.reduceat(dados, inicios).tolist(),
+        np.maximum.reduceat(dados, inicios).tolist(),
+        np.add.reduceat(dados, inicios).tolist(),
+        ts[fins].tolist(),
+        dados[fins].tolist()))
+
+
+# Ordens de leitura de ler_lotes
+ORDENS = {'device': 'deviceId, dataType, ts', 'ts': 'ts'}
+
+
 class Database:
-    def __init__(self, db_name='sensores'):
+    def __init__(self, db_name='sensores', synchronous='NORMAL'):
         self.meta = MetaData()
         db_path = os.path.join(os.path.dirname(__file__), f'{db_name}.db')
         self.engine = create_engine(f"sqlite:///{db_path}")
         self.Session = sessionmaker(bind=self.engine)
+        self.synchronous = synchronous
+        event.listen(self.engine, 'connect', self._configurar_sqlite)
+
+    def _configurar_sqlite(self, dbapi_connection, connection_record):
+        # WAL permite leitura concorrente durante a carga; synchronous=NORMAL evita fsync a cada commit
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={self.synchronous}")
+        cursor.close()
 
     def connect(self):
         return self.Session()
 
     def db_execute(self, query, commit=False):
+        """
+        Executa a query numa sessao propria. As linhas de um SELECT sao lidas antes de a
+        sessao fechar (o Result nao pode ser iterado depois); para leituras grandes use ler_lotes.
+
+        :return: Lista de linhas para consultas que retornam linhas; senao o Result.
+        """
         with self.connect() as session:
             result = session.execute(query)
+            linhas = result.all() if result.returns_rows else result
             if commit:
                 session.commit()
-            return result
+            return linhas
 
     def create_table(self):
         self.sensores()
         self.teste_carga()  # Adiciona a criação da tabela teste_carga
+        for nome, _ in ROLLUPS:
+            self.rollup(nome)
+        self.checkpoints()
         self.meta.create_all(self.engine)
 
+    def inserir_lote(self, lote, tamanho_bloco: int = 50_000, manter_rollups: bool = True,
+                     checkpoint: str | None = None) -> int:
+        """
+        Insere um LoteLeituras na tabela sensores via executemany, uma transacao por bloco.
+
+        Na mesma transacao, os agregados do bloco sao somados as tabelas de rollup
+        (minuto, hora e dia) via UPSERT.
+
+        :param lote: LoteLeituras gerado pelo SimuladorSensor.
+        :param tamanho_bloco: Quantidade de linhas por transacao.
+        :param manter_rollups: Atualiza as tabelas de rollup junto com a insercao.
+        :param checkpoint: Chave do checkpoint cujo ultimo_persistido_ts avanca na mesma transacao.
+        :return: Quantidade de linhas inseridas.
+        """
+        sql = ("INSERT INTO sensores (sensorModel, measureUnit, deviceId, location, dataType, data, ts) "
+               "VALUES (?, ?, ?, ?, ?, ?, ?)")
+        sql_rollup = (
+            "INSERT INTO {tabela} (deviceId, dataType, bucket, count, min, max, sum, last_ts, last_value) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (deviceId, dataType, bucket) DO UPDATE SET "
+            "count = count + excluded.count, "
+            "min = MIN(min, excluded.min), "
+            "max = MAX(max, excluded.max), "
+            "sum = sum + excluded.sum, "
+            "last_value = CASE WHEN excluded.last_ts >= last_ts THEN excluded.last_value ELSE last_value END, "
+            "last_ts = MAX(last_ts, excluded.last_ts)")
+        sql_checkpoint = (
+            "INSERT INTO checkpoints (chave, ultimo_persistido_ts) VALUES (?, ?) "
+            "ON CONFLICT (chave) DO UPDATE SET "
+            "ultimo_persistido_ts = MAX(COALESCE(ultimo_persistido_ts, excluded.ultimo_persistido_ts), "
+            "excluded.ultimo_persistido_ts)")
+        with span('inserir_banco', len(lote), lote.nbytes):
+            conn = self.engine.raw_connection()
+            try:
+                cursor = conn.cursor()
+                for bloco in lote.blocos(tamanho_bloco):
+                    linhas = zip(
+                        bloco.coluna('sensorModel').tolist(),
+                        bloco.coluna('measureUnit').tolist(),
+                        bloco.coluna('device').tolist(),
+                        bloco.coluna('location').tolist(),
+                        bloco.coluna('dataType').tolist(),
+                        bloco.data.tolist(),
+                        bloco.ts.tolist())
+                    cursor.executemany(sql, linhas)
+                    if manter_rollups:
+                        for tabela, tamanho_ms in ROLLUPS:
+                            cursor.executemany(sql_rollup.format(tabela=tabela), agregar_lote(bloco, tamanho_ms))
+                    if checkpoint is not None and len(bloco):
+                        cursor.execute(sql_checkpoint, (checkpoint, int(bloco.ts.max())))
+                    conn.commit()
+                cursor.close()
+            finally:
+                conn.close()
+        return len(lote)
+
+    def inserir_lotes(self, lotes, tamanho_bloco: int = 50_000, adiar_indices: bool = False) -> int:
+        """
+        Insere uma sequencia de lotes, opcionalmente recriando os indices so no final.
+
+        :param lotes: Iteravel de LoteLeituras.
+        :param tamanho_bloco: Quantidade de linhas por transacao.
+        :param adiar_indices: Remove os indices de sensores antes da carga e os recria depois.
+        :return: Quantidade total de linhas inseridas.
+        """
+        if adiar_indices:
+            with self.carga_em_massa():
+                return sum(self.inserir_lote(lote, tamanho_bloco) for lote in lotes)
+        return sum(self.inserir_lote(lote, tamanho_bloco) for lote in lotes)
+
+    def compensa_adiar_indices(self, linhas_novas: int, proporcao: float = 1.0) -> bool:
+        """
+        Recriar os indices custa uma ordenacao da tabela inteira, entao so compensa quando a carga
+        e grande frente ao que ja esta gravado. O total gravado e estimado por MAX(id) (busca
+        na chave primaria), sem o COUNT(*) que percorreria a tabela.
+
+        :param linhas_novas: Linhas que a carga vai inserir.
+        :param proporcao: Adia se linhas_novas >= proporcao * linhas ja gravadas.
+        """
+        with self.engine.connect() as conn:
+            gravadas = conn.execute(text("SELECT MAX(id) FROM sensores")).scalar() or 0
+        return linhas_novas >= proporcao * gravadas
+
+    @contextmanager
+    def carga_em_massa(self):
+        """
+        Remove os indices da tabela sensores durante uma carga em massa e os recria ao sair.
+        """
+        indices = list(self.sensores().indexes)
+        for indice in indices:
+            indice.drop(bind=self.engine, checkfirst=True)
+        try:
+            yield self
+        finally:
+            for indice in indices:
+                indice.create(bind=self.engine, checkfirst=True)
+
     def sensores(self) -> Table:
+        # Reaproveita a tabela ja declarada para nao duplicar os indices no metadata
+        if 'sensores' in self.meta.tables:
+            return self.meta.tables['sensores']
         return Table('sensores', self.meta,
                      Column('id', INTEGER, primary_key=True),
                      Column('sensorModel', String),
@@ -34,9 +204,192 @@ class Database:
                      Column('dataType', String, index=True),
                      Column('data', Float),
                      Column('ts', BIGINT),
+                     Index('ix_sensores_device_tipo_ts', 'deviceId', 'dataType', 'ts'),
+                     extend_existing=True
+                     )
+
+    def rollup(self, nome: str) -> Table:
+        return Table(nome, self.meta,
+                     Column('deviceId', String, primary_key=True),
+                     Column('dataType', String, primary_key=True),
+                     Column('bucket', BIGINT, primary_key=True),
+                     Column('count', INTEGER),
+                     Column('min', Float),
+                     Column('max', Float),
+                     Column('sum', Float),
+                     Column('last_ts', BIGINT),
+                     Column('last_value', Float),
+                     extend_existing=True
+                     )
+
+    def checkpoints(self) -> Table:
+        return Table('checkpoints', self.meta,
+                     Column('chave', String, primary_key=True),
+                     Column('ultimo_gerado_ts', BIGINT),
+                     Column('ultimo_persistido_ts', BIGINT),
                      extend_existing=True
                      )
 
+    def ler_checkpoints(self) -> dict[str, tuple[int | None, int | None]]:
+        """
+        :return: chave -> (ultimo_gerado_ts, ultimo_persistido_ts).
+        """
+        tabela = self.checkpoints()
+        with self.engine.connect() as conn:
+            linhas = conn.execute(select(tabela.c.chave, tabela.c.ultimo_gerado_ts, tabela.c.ultimo_persistido_ts))
+            return {chave: (gerado, persistido) for chave, gerado, persistido in linhas}
+
+    def marcar_gerado(self, ultimos: dict[str, int]):
+        """
+        Registra o ultimo ts gerado (e entregue) de cada chave, numa unica transacao.
+        """
+        if not ultimos:
+            return
+        sql = text(
+            "INSERT INTO checkpoints (chave, ultimo_gerado_ts) VALUES (:chave, :ts) "
+            "ON CONFLICT (chave) DO UPDATE SET ultimo_gerado_ts = excluded.ultimo_gerado_ts")
+        with self.engine.begin() as conn:
+            conn.execute(sql, [{'chave': chave, 'ts': ts} for chave, ts in ultimos.items()])
+
+    def planejar_consulta(self, inicio_ms: int, fim_ms: int, passo_ms: int) -> list[tuple[str, int, int]]:
+        """
+        Divide [inicio_ms, fim_ms) entre as tabelas que o respondem: a parte interna alinhada
+        ao bucket de um rollup sai dele (do mais grosso ao mais fino cujo bucket divide o passo)
+        e so as sobras das bordas, menores que o bucket mais fino, sao lidas de sensores.
+
+        Ex.: ultimos 30 dias com passo de 1 h -> sensores_hora no miolo, sensores_minuto nas
+        horas incompletas das pontas e sensores nos segundos restantes.
+
+        :return: Trechos (tabela, inicio, fim), com fim exclusivo.
+        """
+        trechos, pendentes = [], [(inicio_ms, fim_ms)]
+        for tabela, tamanho_ms in ROLLUPS:
+            if passo_ms % tamanho_ms:
+                continue
+            restantes = []
+            for inicio, fim in pendentes:
+                miolo_inicio, miolo_fim = -(-inicio // tamanho_ms) * tamanho_ms, fim // tamanho_ms * tamanho_ms
+                if miolo_inicio >= miolo_fim:
+                    restantes.append((inicio, fim))
+                    continue
+                trechos.append((tabela, miolo_inicio, miolo_fim))
+                restantes += [(a, b) for a, b in ((inicio, miolo_inicio), (miolo_fim, fim)) if a < b]
+            pendentes = restantes
+        return trechos + [('sensores', inicio, fim) for inicio, fim in pendentes if inicio < fim]
+
+    def consultar_agregado(self, device: str, data_type: str, inicio_ms: int, fim_ms: int,
+                           passo_ms: int) -> list[dict]:
+        """
+        Agrega as leituras de um device/dataType em buckets de `passo_ms` no intervalo [inicio_ms, fim_ms).
+
+        Ex.: media horaria dos ultimos 30 dias -> passo_ms=3_600_000, lida quase toda de
+        sensores_hora (ver planejar_consulta).
+
+        :return: Lista de dicts com bucket, count, min, max, sum, avg e last, ordenada por bucket.
+        """
+        sql_sensores = ("SELECT ts, 1, data, data, data, ts, data FROM sensores "
+                        "WHERE deviceId = ? AND dataType = ? AND ts >= ? AND ts < ?")
+        sql_rollup = ("SELECT bucket, count, min, max, sum, last_ts, last_value FROM {tabela} "
+                      "WHERE deviceId = ? AND dataType = ? AND bucket >= ? AND bucket < ?")
+
+        linhas = []
+        conn = self.engine.raw_connection()
+        try:
+            cursor = conn.cursor()
+            for tabela, inicio, fim in self.planejar_consulta(inicio_ms, fim_ms, passo_ms):
+                sql = sql_sensores if tabela == 'sensores' else sql_rollup.format(tabela=tabela)
+                cursor.execute(sql, (device, data_type, inicio, fim))
+                linhas += cursor.fetchall()
+            cursor.close()
+        finally:
+            conn.close()
+        linhas.sort(key=lambda linha: linha[0])
+
+        resultado: dict[int, dict] = {}
+        for bucket, count, minimo, maximo, soma, last_ts, last_value in linhas:
+            chave = bucket // passo_ms * passo_ms
+            atual = resultado.get(chave)
+            if atual is None:
+                resultado[chave] = {'bucket': chave, 'count': count, 'min': minimo, 'max': maximo,
+                                    'sum': soma, 'last_ts': last_ts, 'last': last_value}
+                continue
+            atual['count'] += count
+            atual['min'] = min(atual['min'], minimo)
+            atual['max'] = max(atual['max'], maximo)
+            atual['sum'] += soma
+            if last_ts >= atual['last_ts']:
+                atual['last_ts'], atual['last'] = last_ts, last_value
+
+        for linha in resultado.values():
+            linha['avg'] = linha['sum'] / linha['count']
+            del linha['last_ts']
+        return list(resultado.values())
+
+    @staticmethod
+    def _filtros(devices: Iterable[str] | None, data_types: Iterable[str] | None,
+                 inicio_ms: int | None, fim_ms: int | None) -> tuple[list[str], list]:
+        """
+        Monta as condicoes (com placeholders ?) e os parametros do filtro de ler_lotes.
+        """
+        condicoes, parametros = [], []
+        for coluna, valores in (('deviceId', devices), ('dataType', data_types)):
+            if valores is not None:
+                valores = list(valores)
+                condicoes.append(f"{coluna} IN ({', '.join('?' * len(valores))})")
+                parametros += valores
+        if inicio_ms is not None:
+            condicoes.append("ts >= ?")
+            parametros.append(int(inicio_ms))
+        if fim_ms is not None:
+            condicoes.append("ts < ?")
+            parametros.append(int(fim_ms))
+        return condicoes, parametros
+
+    def ler_lotes(self, devices: Iterable[str] | None = None, data_types: Iterable[str] | None = None,
+                  inicio_ms: int | None = None, fim_ms: int | None = None, tamanho_lote: int = 50_000,
+                  ordem: str = 'device') -> Iterator[LoteLeituras]:
+        """
+        Le a tabela sensores em lotes de no maximo `tamanho_lote` linhas (cursor.fetchmany), com a
+        conexao aberta so enquanto o gerador e consumido; a memoria depende do lote, nao do resultado.
+
+        :param devices: Filtra pelos deviceId (None = todos).
+        :param data_types: Filtra pelos dataType (None = todos).
+        :param inicio_ms: Inicio do intervalo [inicio_ms, fim_ms), epoch ms (None = sem limite).
+        :param fim_ms: Fim do intervalo, exclusivo.
+        :param tamanho_lote: Linhas por lote.
+        :param ordem: 'device' (deviceId, dataType, ts: segue o indice, sem ordenacao) ou 'ts'
+            (ordem global de tempo; o SQLite ordena em arquivo temporario).
+        :return: Gerador de LoteLeituras.
+        """
+        if ordem not in ORDENS:
+            raise ValueError(f"Ordem {ordem!r} invalida; use um de {tuple(ORDENS)}")
+        condicoes, parametros = self._filtros(devices, data_types, inicio_ms, fim_ms)
+        sql = "SELECT sensorModel, measureUnit, deviceId, location, dataType, data, ts FROM sensores"
+        if condicoes:
+            sql += " WHERE " + " AND ".join(condicoes)
+        sql += f" ORDER BY {ORDENS[ordem]}"
+
+        conn = self.engine.raw_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql, parametros)
+            while True:
+                with span('ler_banco') as medida:
+                    linhas = cursor.fetchmany(tamanho_lote)
+                    if linhas:
+                        modelos, unidades, devices_, locais, tipos, dados, ts = zip(*linhas)
+                        lote = LoteLeituras.constante(
+                            np.array(dados, dtype=np.float64), np.array(ts, dtype=np.int64),
+                            sensorModel=modelos, measureUnit=unidades, device=devices_, location=locais,
+                            dataType=tipos)
+                        medida.linhas, medida.bytes = len(lote), lote.nbytes
+                if not linhas:
+                    break
+                yield lote
+            cursor.close()
+        finally:
+            conn.close()
+
     def teste_carga(self) -> Table:
         return Table('teste_carga', self.meta,
                      Column('id', INTEGER, primary_key=True),
@@ -45,4 +398,4 @@ class Database:
                      Column('memoria', Float),
                      Column('cenario', String),
                      extend_existing=True
-                     )
\ No newline at end of file
+                     )
@@ -0,0 +1,227 @@
+import os
+import json
+import time
+import random
+import shutil
+import hashlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterable
+from urllib.parse import quote
+
+from instrumentacao import span
+
+
+class ClienteS3Local:
+    """
+    Substituto do cliente S3 que grava os objetos em disco (<raiz>/<bucket>/<key>).
+
+    Implementa apenas upload_file e upload_fileobj, o suficiente para testar e medir
+    o envio sem rede. `latencia_s` simula o tempo de ida e volta de cada requisicao.
+    """
+
+    def __init__(self, raiz: str, latencia_s: float = 0.0):
+        self.raiz = raiz
+        self.latencia_s = latencia_s
+
+    def _destino(self, bucket: str, key: str) -> str:
+        destino = os.path.join(self.raiz, bucket, *key.split('/'))
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        return destino
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, Config=None, Callback=None):
+        time.sleep(self.latencia_s)
+        shutil.copyfile(Filename, self._destino(Bucket, Key))
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, Config=None, Callback=None):
+        time.sleep(self.latencia_s)
+        with open(self._destino(Bucket, Key), 'wb') as destino:
+            shutil.copyfileobj(Fileobj, destino)
+
+
+def criar_cliente_s3(max_conexoes: int = 32):
+    """
+    Cria o cliente S3 a partir das variaveis de ambiente.
+
+    Com S3_LOCAL_DIR definido, retorna um ClienteS3Local; com AWS_S3_ENDPOINT_URL,
+    aponta o boto3 para esse endpoint (ex.: MinIO local).
+    """
+    pasta_local = os.getenv("S3_LOCAL_DIR")
+    if pasta_local:
+        return ClienteS3Local(pasta_local)
+
+    import boto3
+    from botocore.config import Config
+
+    return boto3.client(
+        's3',
+        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+        region_name=os.getenv("AWS_REGION", "us-east-1"),
+        endpoint_url=os.getenv("AWS_S3_ENDPOINT_URL"),
+        config=Config(max_pool_connections=max_conexoes)
+    )
+
+
+def hash_arquivo(caminho: str, tamanho_bloco: int = 1 << 20) -> str:
+    """
+    Calcula o sha256 do arquivo lendo em blocos.
+    """
+    h = hashlib.sha256()
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(tamanho_bloco), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+class EnviadorS3:
+    """
+    Envia arquivos ao S3 com um unico cliente, em paralelo e com retomada.
+
+    Um manifesto local por bucket (key -> sha256, ex.: output/manifesto_s3-<bucket>.json)
+    registra o que ja foi enviado; arquivos com o mesmo conteudo sao pulados. Ao salvar, so
+    as keys enviadas por esta instancia sao gravadas sobre o arquivo atual, entao envios a
+    outros prefixos (ou de outra instancia) no mesmo bucket nao perdem as suas entradas.
+    Falhas sao repetidas com backoff exponencial.
+    """
+
+    def __init__(
+            self,
+            bucket: str,
+            cliente=None,
+            max_workers: int = 8,
+            manifesto: str | None = 'output/manifesto_s3.json',
+            tentativas: int = 5,
+            backoff_s: float = 0.5,
+            multipart_mb: int = 8):
+        self.bucket = bucket
+        self.cliente = cliente if cliente is not None else criar_cliente_s3(max_conexoes=max_workers * 4)
+        self.max_workers = max_workers
+        self.caminho_manifesto = self._caminho_do_bucket(manifesto, bucket) if manifesto else None
+        self._enviados: dict[str, str] = {}
+        self.tentativas = tentativas
+        self.backoff_s = backoff_s
+        self.transfer_config = self._transfer_config(multipart_mb)
+        self.manifesto = self._carregar_manifesto()
+
+    @staticmethod
+    def _transfer_config(multipart_mb: int):
+        try:
+            from boto3.s3.transfer import TransferConfig
+        except ImportError:
+            return None
+        return TransferConfig(
+            multipart_threshold=multipart_mb * 1024 * 1024,
+            multipart_chunksize=multipart_mb * 1024 * 1024,
+            max_concurrency=4)
+
+    @staticmethod
+    def _caminho_do_bucket(manifesto: str, bucket: str) -> str:
+        base, extensao = os.path.splitext(manifesto)
+        return f"{base}-{quote(bucket, safe='')}{extensao or '.json'}"
+
+    def _carregar_manifesto(self) -> dict:
+        if self.caminho_manifesto and os.path.exists(self.caminho_manifesto):
+            with open(self.caminho_manifesto) as arquivo:
+                return json.load(arquivo)
+        return {}
+
+    def _salvar_manifesto(self):
+        if not self.caminho_manifesto or not self._enviados:
+            return
+        # Rele o arquivo e aplica so as keys desta instancia, sem apagar as gravadas por outras
+        self.manifesto = {**self._carregar_manifesto(), **self._enviados}
+        os.makedirs(os.path.dirname(self.caminho_manifesto) or '.', exist_ok=True)
+        temporario = f"{self.caminho_manifesto}.{os.getpid()}.tmp"
+        with open(temporario, 'w') as arquivo:
+            json.dump(self.manifesto, arquivo, indent=1, sort_keys=True)
+        os.replace(temporario, self.caminho_manifesto)
+
+    def _enviar_com_retentativa(self, local_path: str, key: str):
+        for tentativa in range(self.tentativas):
+            try:
+                with span('upload_s3', bytes=os.path.getsize(local_path)):
+                    self.cliente.upload_file(local_path, self.bucket, key, Config=self.transfer_config)
+                return
+            except Exception:
+                if tentativa == self.tentativas - 1:
+                    raise
+                time.sleep(self.backoff_s * 2 ** tentativa * random.uniform(0.5, 1.5))
+
+    def enviar_fluxo(self, arquivos: Iterable[tuple[str, str]], resumo: dict | None = None):
+        """
+        Envia os arquivos (caminho local, key) a medida que chegam, pulando os que nao mudaram
+        desde o ultimo envio. No maximo 2 * max_workers envios ficam em andamento; a iteracao
+        de `arquivos` espera enquanto isso (backpressure).
+
+        :param arquivos: Iteravel de pares (caminho local, key no bucket).
+        :param resumo: Dict preenchido com enviados, pulados, falhas, bytes e segundos.
+        :return: Gerador de (key, sucesso) por arquivo concluido.
+        """
+        inicio = time.perf_counter()
+        resumo = resumo if resumo is not None else {}
+        resumo.update({'enviados': 0, 'pulados': 0, 'falhas': 0, 'bytes': 0})
+
+        def concluir(futuros: set, andamento: dict):
+            for futuro in futuros:
+                local_path, key, conteudo = andamento.pop(futuro)
+                try:
+                    futuro.result()
+                except Exception as e:
+                    resumo['falhas'] += 1
+                    print(f"\033[31mErro ao enviar {key} para S3: {e}\033[0m")
+                    yield key, False
+                    continue
+                resumo['enviados'] += 1
+                resumo['bytes'] += os.path.getsize(local_path)
+                self.manifesto[key] = self._enviados[key] = conteudo
+                yield key, True
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                andamento = {}
+                for local_path, key in arquivos:
+                    conteudo = hash_arquivo(local_path)
+                    if self.manifesto.get(key) == conteudo:
+                        resumo['pulados'] += 1
+                        yield key, True
+                        continue
+                    futuro = executor.submit(self._enviar_com_retentativa, local_path, key)
+                    andamento[futuro] = (local_path, key, conteudo)
+                    if len(andamento) >= 2 * self.max_workers:
+                        feitos, _ = wait(andamento, return_when=FIRST_COMPLETED)
+                        yield from concluir(feitos, andamento)
+                yield from concluir(set(andamento), andamento)
+        finally:
+            self._salvar_manifesto()
+            resumo['segundos'] = time.perf_counter() - inicio
+
+    def enviar_arquivos(self, arquivos: Iterable[tuple[str, str]]) -> dict:
+        """
+        Envia os arquivos (caminho local, key), pulando os que nao mudaram desde o ultimo envio.
+
+        :param arquivos: Pares (caminho local, key no bucket).
+        :return: Resumo com enviados, pulados, falhas, bytes e segundos.
+        """
+        resumo = {}
+        for _ in self.enviar_fluxo(arquivos, resumo):
+            pass
+        return resumo
+
+    def enviar_pasta(self, pasta: str, prefixo: str = '', extensoes: tuple[str, ...] | None = None) -> dict:
+        """
+        Envia todos os arquivos de uma pasta (recursivamente) mantendo o caminho relativo na key.
+
+        :param pasta: Pasta local.
+        :param prefixo: Prefixo das keys no bucket (ex.: 'csv/').
+        :param extensoes: Envia apenas arquivos com essas extensoes.
+        :return: Resumo do envio (ver enviar_arquivos).
+        """
+        arquivos = []
+        for raiz, _, nomes in os.walk(pasta):
+            for nome in sorted(nomes):
+                if extensoes and not nome.endswith(extensoes):
+                    continue
+                local_path = os.path.join(raiz, nome)
+                relativo = os.path.relpath(local_path, pasta).replace(os.sep, '/')
+                arquivos.append((local_path, f"{prefixo}{relativo}"))
+        return self.enviar_arquivos(arquivos)
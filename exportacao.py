@@ -0,0 +1,81 @@
+import os
+import csv
+import time
+from typing import Iterable
+
+from instrumentacao import span
+from leituras import CAMPOS, LoteLeituras
+
+FORMATOS = ('csv', 'parquet')
+
+
+def exportar_csv(lotes: Iterable[LoteLeituras], caminho: str, separador: str = ';') -> int:
+    """
+    Grava os lotes num CSV no formato do dados.csv (CAMPOS, ';'), que o ingest le de volta.
+
+    :return: Quantidade de linhas gravadas.
+    """
+    os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+    total = 0
+    with open(caminho, 'w', newline='') as arquivo:
+        writer = csv.writer(arquivo, delimiter=separador)
+        writer.writerow(CAMPOS)
+        for lote in lotes:
+            with span('csv_exportacao', len(lote), lote.nbytes):
+                writer.writerows(lote.linhas())
+            total += len(lote)
+    return total
+
+
+def exportar_parquet(lotes: Iterable[LoteLeituras], raiz: str, prefixo_arquivo: str = 'export') -> tuple[int, list[str]]:
+    """
+    Grava os lotes em Parquet particionado por dia e sensorModel (ver EscritorParquet).
+
+    :return: (quantidade de linhas, arquivos gravados).
+    """
+    from parquet_sensores import EscritorParquet
+
+    total = 0
+    with EscritorParquet(raiz, prefixo_arquivo=prefixo_arquivo) as escritor:
+        for lote in lotes:
+            escritor.escrever(lote)
+            total += len(lote)
+    return total, escritor.arquivos
+
+
+def exportar(db, destino: str, formato: str = 'csv', devices: Iterable[str] | None = None,
+             data_types: Iterable[str] | None = None, inicio_ms: int | None = None, fim_ms: int | None = None,
+             tamanho_lote: int = 50_000) -> dict:
+    """
+    Exporta leituras do banco lote a lote: a memoria usada depende de `tamanho_lote` (e dos
+    buffers do EscritorParquet), nao do intervalo exportado.
+
+    O CSV sai na ordem do indice (device, dataType, ts), sem ordenacao no banco. O Parquet
+    le em ordem de ts, para que cada particao de dia seja preenchida e fechada em sequencia.
+
+    :param db: Database de origem.
+    :param destino: Arquivo CSV ou pasta raiz do Parquet.
+    :param formato: 'csv' ou 'parquet'.
+    :param devices: Filtra pelos deviceId (None = todos).
+    :param data_types: Filtra pelos dataType (None = todos).
+    :param inicio_ms: Inicio do intervalo [inicio_ms, fim_ms), epoch ms.
+    :param fim_ms: Fim do intervalo, exclusivo.
+    :param tamanho_lote: Linhas lidas do banco por vez.
+    :return: Resumo com linhas, arquivos e vazao.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato {formato!r} invalido; use um de {FORMATOS}")
+    inicio = time.perf_counter()
+    lotes = db.ler_lotes(devices, data_types, inicio_ms, fim_ms, tamanho_lote,
+                         ordem='ts' if formato == 'parquet' else 'device')
+    if formato == 'csv':
+        linhas, arquivos = exportar_csv(lotes, destino), [destino]
+    else:
+        linhas, arquivos = exportar_parquet(lotes, destino)
+    segundos = time.perf_counter() - inicio
+    return {
+        'arquivos': len(arquivos),
+        'linhas': linhas,
+        'segundos': round(segundos, 3),
+        'linhas_por_s': round(linhas / segundos, 1) if segundos else 0.0,
+    }
@@ -1,29 +1,95 @@
+import os
+import hashlib
+import argparse
+
+import numpy as np
 import networkx as nx
-import matplotlib.pyplot as plt
-
-G = nx.DiGraph()
-
-G.add_node("Shelly EM\n(Consumo total)")
-G.add_node("Sonoff POW R3\n(Consumo individual)")
-G.add_node("HMS M21\n(Temperatura)")
-G.add_node("CT Clamp\n(Corrente)")
-G.add_node("PZEM-004T\n(Fator de Potência)")
-G.add_node("Fluke 1735\n(Potência)")
-
-G.add_edges_from([
-    ("Shelly EM\n(Consumo total)", "Sonoff POW R3\n(Consumo individual)"),
-    ("HMS M21\n(Temperatura)", "CT Clamp\n(Corrente)"),
-    ("HMS M21\n(Temperatura)", "Shelly EM\n(Consumo total)"),
-    ("CT Clamp\n(Corrente)", "PZEM-004T\n(Fator de Potência)"),
-    ("CT Clamp\n(Corrente)", "Fluke 1735\n(Potência)"),
-    ("CT Clamp\n(Corrente)", "Sonoff POW R3\n(Consumo individual)"),
-    ("PZEM-004T\n(Fator de Potência)", "Fluke 1735\n(Potência)"),
-    ("PZEM-004T\n(Fator de Potência)", "CT Clamp\n(Corrente)"),
-    ("Fluke 1735\n(Potência)", "HMS M21\n(Temperatura)"),
-])
-
-plt.figure(figsize=(12, 8))
-pos = nx.spring_layout(G, seed=42)
-nx.draw(G, pos, with_labels=True, node_color='lightblue', node_size=3500, font_size=10, arrows=True)
-plt.title("Grafo de Comunicação entre Sensores da Rede Elétrica")
-plt.show()
\ No newline at end of file
+
+# Rotulo do no -> gerador do SimuladorSensor que produz as leituras do sensor
+SENSORES = {
+    "Shelly EM\n(Consumo total)": "shelly_em",
+    "Sonoff POW R3\n(Consumo individual)": "sonoff_pow_r3",
+    "HMS M21\n(Temperatura)": "hms_m21",
+    "CT Clamp\n(Corrente)": "ct_clamp",
+    "PZEM-004T\n(Fator de Potência)": "pzem_004t",
+    "Fluke 1735\n(Potência)": "fluke_1735",
+}
+
+# (origem, destino, peso): a origem influencia o destino; peso negativo = relacao inversa
+ARESTAS = [
+    ("Shelly EM\n(Consumo total)", "Sonoff POW R3\n(Consumo individual)", 1.0),
+    ("HMS M21\n(Temperatura)", "CT Clamp\n(Corrente)", 1.0),
+    ("HMS M21\n(Temperatura)", "Shelly EM\n(Consumo total)", 1.0),
+    # Corrente alta derruba a tensao da instalacao
+    ("CT Clamp\n(Corrente)", "PZEM-004T\n(Fator de Potência)", -1.0),
+    ("CT Clamp\n(Corrente)", "Fluke 1735\n(Potência)", 1.0),
+    ("CT Clamp\n(Corrente)", "Sonoff POW R3\n(Consumo individual)", 1.0),
+    ("PZEM-004T\n(Fator de Potência)", "Fluke 1735\n(Potência)", 1.0),
+    ("PZEM-004T\n(Fator de Potência)", "CT Clamp\n(Corrente)", 1.0),
+    ("Fluke 1735\n(Potência)", "HMS M21\n(Temperatura)", 1.0),
+]
+
+
+def criar_grafo() -> nx.DiGraph:
+    """
+    Monta o grafo de influencia entre os sensores; cada no guarda o gerador em 'sensor'
+    e cada aresta o 'peso' da influencia.
+    """
+    G = nx.DiGraph()
+    for rotulo, sensor in SENSORES.items():
+        G.add_node(rotulo, sensor=sensor)
+    G.add_weighted_edges_from(ARESTAS, weight='peso')
+    return G
+
+
+def matriz_dependencias(G: nx.DiGraph) -> tuple[np.ndarray, list[str]]:
+    """
+    Deriva a matriz de dependencias do grafo.
+
+    :return: (A, sensores), onde A[i, j] e o peso com que o sensor j influencia o sensor i
+        e `sensores` e o gerador de cada linha/coluna.
+    """
+    nos = list(G.nodes)
+    A = nx.to_numpy_array(G, nodelist=nos, weight='peso').T
+    return A, [G.nodes[no]['sensor'] for no in nos]
+
+
+def assinatura(G: nx.DiGraph) -> str:
+    conteudo = repr((sorted(G.nodes), sorted(G.edges(data='peso'))))
+    return hashlib.sha1(conteudo.encode()).hexdigest()[:12]
+
+
+def desenhar(G: nx.DiGraph, pasta: str = 'output/plot', mostrar: bool = False) -> str:
+    """
+    Renderiza o grafo num PNG, uma unica vez por versao do grafo (o nome do arquivo
+    leva a assinatura de nos e arestas). Sem `mostrar`, usa o backend Agg e nao abre janela.
+
+    :return: Caminho do PNG.
+    """
+    caminho = os.path.join(pasta, f"grafo_wattech-{assinatura(G)}.png")
+    if os.path.exists(caminho) and not mostrar:
+        return caminho
+
+    import matplotlib
+    if not mostrar:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    os.makedirs(pasta, exist_ok=True)
+    figura = plt.figure(figsize=(12, 8))
+    pos = nx.spring_layout(G, seed=42)
+    nx.draw(G, pos, with_labels=True, node_color='lightblue', node_size=3500, font_size=10, arrows=True)
+    plt.title("Grafo de Comunicação entre Sensores da Rede Elétrica")
+    figura.savefig(caminho)
+    if mostrar:
+        plt.show()
+    plt.close(figura)
+    return caminho
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Renderiza o grafo de influencia entre os sensores.")
+    parser.add_argument('--pasta', default='output/plot')
+    parser.add_argument('--mostrar', action='store_true', help="Abre a janela do matplotlib")
+    args = parser.parse_args()
+    print(desenhar(criar_grafo(), args.pasta, args.mostrar))
@@ -0,0 +1,285 @@
+import os
+import csv
+import time
+import heapq
+import datetime
+from dataclasses import dataclass
+from itertools import islice
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from instrumentacao import span
+from leituras import CAMPOS, CATEGORICOS, LoteLeituras, parsear_ts, unidade_ts
+
+# O dados.csv usa os nomes de CAMPOS; os cenario_*_sensores.csv usam os nomes das colunas do banco
+ALIASES = {'sensor_model': 'sensorModel', 'measure_unit': 'measureUnit', 'data_type': 'dataType', 'created_at': 'ts'}
+INDICE_TS = CAMPOS.index('ts')
+# Bytes lidos do inicio de cada arquivo para estimar o tamanho medio de uma linha
+AMOSTRA_BYTES = 1 << 16
+
+
+@dataclass
+class FormatoCSV:
+    separador: str
+    # Posicao no arquivo de cada campo de CAMPOS
+    indices: list[int]
+    # Unidade do ts ('texto', 'ms' ou 's'), detectada uma vez na primeira linha de dados
+    unidade_ts: str | None = None
+
+    def reordenar(self, campos: list[str]) -> list[str]:
+        return [campos[i] for i in self.indices]
+
+    def detectar_unidade(self, campos: list[str]):
+        """
+        Fixa a unidade do ts pela primeira linha de dados (campos como lidos do arquivo).
+        """
+        if self.unidade_ts is None:
+            self.unidade_ts = unidade_ts(campos[self.indices[INDICE_TS]])
+
+
+def detectar_formato(cabecalho: str) -> FormatoCSV:
+    """
+    Detecta o separador (';' no dados.csv, ',' nos demais) e a ordem das colunas pelo cabecalho.
+
+    :param cabecalho: Primeira linha do arquivo.
+    :return: FormatoCSV.
+    """
+    separador = ';' if cabecalho.count(';') > cabecalho.count(',') else ','
+    nomes = [ALIASES.get(nome.strip(), nome.strip())
+             for nome in next(csv.reader([cabecalho], delimiter=separador))]
+    faltando = [campo for campo in CAMPOS if campo not in nomes]
+    if faltando:
+        raise ValueError(f"Cabecalho sem as colunas {faltando}: {cabecalho.strip()!r}")
+    return FormatoCSV(separador, [nomes.index(campo) for campo in CAMPOS])
+
+
+def _montar_lote(linhas: list[list[str]], formato: FormatoCSV) -> LoteLeituras:
+    colunas = dict(zip(CAMPOS, (list(zip(*linhas))[i] for i in formato.indices)))
+    return LoteLeituras.constante(
+        np.array(colunas['data'], dtype=np.float64), parsear_ts(colunas['ts'], formato.unidade_ts),
+        **{nome: colunas[nome] for nome in CATEGORICOS})
+
+
+def ler_csv_em_blocos(caminho: str, tamanho_bloco: int = 50_000) -> Iterator[LoteLeituras]:
+    """
+    Le um CSV de leituras em lotes de no maximo `tamanho_bloco` linhas; a memoria usada
+    depende so do tamanho do bloco, nao do tamanho do arquivo.
+
+    :param caminho: dados.csv (';') ou cenario_*_sensores.csv (',').
+    :param tamanho_bloco: Quantidade de linhas por lote.
+    :return: Gerador de LoteLeituras, prontos para as etapas do pipeline do AlgasSimulador.
+    """
+    with open(caminho, newline='', encoding='utf-8-sig') as arquivo:
+        formato = detectar_formato(arquivo.readline())
+        leitor = csv.reader(arquivo, delimiter=formato.separador)
+        while True:
+            with span('ler_csv') as medida:
+                linhas = list(islice(leitor, tamanho_bloco))
+                if linhas:
+                    formato.detectar_unidade(linhas[0])
+                lote = _montar_lote(linhas, formato) if linhas else None
+                medida.linhas = len(linhas)
+                medida.bytes = lote.nbytes if lote is not None else 0
+            if lote is None:
+                return
+            yield lote
+
+
+def estimar_linhas(caminho: str) -> int:
+    """
+    Estima as linhas de um CSV pelo tamanho do arquivo e pelo tamanho medio das linhas
+    dos primeiros AMOSTRA_BYTES, sem ler o arquivo inteiro.
+    """
+    tamanho = os.path.getsize(caminho)
+    with open(caminho, 'rb') as arquivo:
+        amostra = arquivo.read(AMOSTRA_BYTES)
+    quebras = amostra.count(b'\n')
+    if quebras == 0:
+        return 1 if amostra else 0
+    return round(tamanho * quebras / len(amostra))
+
+
+def ingerir(db, caminhos: Iterable[str], tamanho_bloco: int = 50_000, adiar_indices: bool | None = None) -> dict:
+    """
+    Carrega CSVs historicos na tabela sensores, bloco a bloco.
+
+    :param db: Database de destino (rollups sao atualizados junto, como na geracao).
+    :param caminhos: Arquivos CSV, em qualquer um dos formatos de ler_csv_em_blocos.
+    :param tamanho_bloco: Linhas lidas e inseridas por vez.
+    :param adiar_indices: Remove os indices de sensores durante a carga e os recria no final;
+        None decide pelas linhas estimadas dos arquivos frente a tabela (ver Database.compensa_adiar_indices).
+    :return: Resumo com arquivos, linhas e vazao.
+    """
+    caminhos = list(caminhos)
+    inicio = time.perf_counter()
+    if adiar_indices is None:
+        adiar_indices = db.compensa_adiar_indices(sum(estimar_linhas(caminho) for caminho in caminhos))
+    lotes = (lote for caminho in caminhos for lote in ler_csv_em_blocos(caminho, tamanho_bloco))
+    linhas = db.inserir_lotes(lotes, tamanho_bloco, adiar_indices=adiar_indices)
+    segundos = time.perf_counter() - inicio
+    return {
+        'arquivos': len(caminhos),
+        'linhas': linhas,
+        'segundos': round(segundos, 3),
+        'linhas_por_s': round(linhas / segundos, 1) if segundos else 0.0,
+    }
+
+
+def _epoch_ms(texto: str, unidade: str) -> int:
+    if unidade == 'ms':
+        return int(texto)
+    if unidade == 's':
+        return int(texto) * 1000
+    return round(datetime.datetime.fromisoformat(texto).timestamp() * 1000)
+
+
+def _trechos(caminho: str) -> tuple[FormatoCSV, list[tuple[int, int]]]:
+    """
+    Divide o arquivo em trechos (offsets em bytes) onde o ts nunca diminui. O dados.csv
+    junta um cenario depois do outro, cada um em ordem, entao tem um trecho por cenario.
+    """
+    trechos = []
+    with open(caminho, 'rb') as arquivo:
+        cabecalho = arquivo.readline()
+        formato = detectar_formato(cabecalho.decode('utf-8-sig'))
+        inicio = posicao = len(cabecalho)
+        anterior = None
+        for linha in arquivo:
+            if formato.unidade_ts is None:
+                formato.detectar_unidade(next(csv.reader([linha.decode()], delimiter=formato.separador)))
+            # Com uma unidade por arquivo, o texto do ts ordena como o tempo
+            ts = formato.reordenar(next(csv.reader([linha.decode()], delimiter=formato.separador)))[INDICE_TS]
+            if anterior is not None and ts < anterior:
+                trechos.append((inicio, posicao))
+                inicio = posicao
+            anterior = ts
+            posicao += len(linha)
+        if posicao > inicio:
+            trechos.append((inicio, posicao))
+    return formato, trechos
+
+
+def _ler_trecho(caminho: str, formato: FormatoCSV, inicio: int, fim: int, buffer: int) -> Iterator[list[str]]:
+    """
+    Le as linhas de um trecho `buffer` por vez, reabrindo o arquivo a cada leitura para nao
+    manter um descritor aberto por trecho. O ts sai convertido para epoch ms (int) com a
+    unidade do arquivo, para intercalar arquivos de formatos diferentes.
+    """
+    posicao = inicio
+    while posicao < fim:
+        linhas = []
+        with open(caminho, 'rb') as arquivo:
+            arquivo.seek(posicao)
+            while posicao < fim and len(linhas) < buffer:
+                linha = arquivo.readline()
+                posicao += len(linha)
+                linhas.append(linha.decode())
+        for campos in csv.reader(linhas, delimiter=formato.separador):
+            campos = formato.reordenar(campos)
+            campos[INDICE_TS] = _epoch_ms(campos[INDICE_TS], formato.unidade_ts)
+            yield campos
+
+
+def linhas_em_ordem(caminhos: Iterable[str], limite_linhas: int = 100_000) -> Iterator[list[str]]:
+    """
+    Percorre as linhas de um ou mais CSVs em ordem de ts, sem carregar os arquivos: cada
+    trecho ordenado e lido aos poucos e os trechos sao intercalados (merge de k vias).
+
+    :param caminhos: Arquivos CSV, em qualquer um dos formatos de ler_csv_em_blocos.
+    :param limite_linhas: Total de linhas em buffer, dividido entre os trechos.
+    :return: Gerador de listas na ordem de CAMPOS (texto, com o ts em epoch ms).
+    """
+    trechos = [(caminho,) + _trechos(caminho) for caminho in caminhos]
+    total = sum(len(partes) for _, _, partes in trechos)
+    buffer = max(limite_linhas // max(total, 1), 1)
+    return heapq.merge(
+        *(_ler_trecho(caminho, formato, inicio, fim, buffer)
+          for caminho, formato, partes in trechos for inicio, fim in partes),
+        key=lambda campos: campos[INDICE_TS])
+
+
+def reemitir(
+        linhas: Iterable[list[str]],
+        velocidade: float = 1.0,
+        ts_atual: bool = False,
+        resolucao_s: float = 0.01,
+        maximo_grupo: int = 10_000,
+        duracao_s: float | None = None,
+        atrasos_ms: list | None = None) -> Iterator[list[dict]]:
+    """
+    Reemite leituras historicas a `velocidade` vezes o tempo real, preservando os intervalos
+    entre chegadas: a leitura com ts t sai (t - t0) / velocidade depois da primeira.
+
+    :param linhas: Linhas em ordem de ts, na ordem de CAMPOS, com o ts em epoch ms (ver linhas_em_ordem).
+    :param velocidade: Fator de aceleracao (60 = uma hora gravada por minuto).
+    :param ts_atual: Troca o ts gravado pelo horario da reemissao (intervalos tambem acelerados).
+    :param resolucao_s: Leituras previstas a menos disso da primeira do grupo saem juntas.
+    :param maximo_grupo: Tamanho maximo de um grupo.
+    :param duracao_s: Para depois desse tempo de parede (padrao: ate o fim do arquivo).
+    :param atrasos_ms: Lista/deque onde anotar o atraso de cada grupo em relacao a agenda.
+    :return: Gerador de grupos de leituras (dicts com CAMPOS, ts em epoch ms).
+    """
+    inicio = time.monotonic()
+    inicio_ms = int(time.time() * 1000)
+    origem = None
+    grupo, previsto_grupo = [], 0.0
+    for campos in linhas:
+        ts = campos[INDICE_TS]
+        if origem is None:
+            origem = ts
+        previsto = inicio + (ts - origem) / 1000 / velocidade
+        if grupo and (previsto - previsto_grupo > resolucao_s or len(grupo) >= maximo_grupo):
+            yield grupo
+            grupo = []
+        if not grupo:
+            if duracao_s is not None and previsto - inicio > duracao_s:
+                return
+            espera = previsto - time.monotonic()
+            if espera > 0:
+                time.sleep(espera)
+            if atrasos_ms is not None:
+                atrasos_ms.append(max(time.monotonic() - previsto, 0.0) * 1000)
+            previsto_grupo = previsto
+        leitura = dict(zip(CAMPOS, campos))
+        leitura['data'] = float(leitura['data'])
+        leitura['ts'] = inicio_ms + round((ts - origem) / velocidade) if ts_atual else ts
+        grupo.append(leitura)
+    if grupo:
+        yield grupo
+
+
+def reproduzir(caminhos: Iterable[str], publicador, velocidade: float = 1.0, topico: str = 'wattech/replay',
+               leituras_por_mensagem: int = 50, **kwargs) -> dict:
+    """
+    Publica CSVs historicos via MQTT (ou PublicadorMemoria) a `velocidade` vezes o tempo real,
+    como teste de carga com um dia real de producao. Memoria constante: os arquivos sao lidos
+    em fluxo por linhas_em_ordem.
+
+    :param kwargs: Repassados a reemitir (ts_atual, resolucao_s, duracao_s...).
+    :return: Resumo das metricas do publicador, com o intervalo gravado coberto e a
+        aceleracao efetivamente atingida.
+    """
+    from ao_vivo import publicar_leituras
+
+    metricas = publicador.metricas
+    linhas = linhas_em_ordem(caminhos)
+    # A varredura dos trechos nao conta no tempo da reproducao
+    metricas.inicio = time.perf_counter()
+    primeiro = ultimo = None
+    for grupo in reemitir(linhas, velocidade, atrasos_ms=metricas.atrasos_ms, **kwargs):
+        por_modelo: dict[str, list[dict]] = {}
+        for leitura in grupo:
+            por_modelo.setdefault(leitura['sensorModel'], []).append(leitura)
+        for modelo, leituras in por_modelo.items():
+            publicar_leituras(publicador, f"{topico}/{modelo.replace(' ', '_')}", leituras, leituras_por_mensagem)
+        primeiro = grupo[0]['ts'] if primeiro is None else primeiro
+        ultimo = grupo[-1]['ts']
+
+    resumo = metricas.resumo()
+    gravado_s = (ultimo - primeiro) / 1000 if primeiro is not None else 0.0
+    if kwargs.get('ts_atual'):
+        gravado_s *= velocidade
+    resumo['gravado_s'] = round(gravado_s, 3)
+    resumo['aceleracao'] = round(gravado_s / resumo['duracao_s'], 1) if resumo['duracao_s'] else 0.0
+    return resumo
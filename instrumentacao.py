@@ -0,0 +1,370 @@
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+# Variaveis de ambiente que ligam a instrumentacao em qualquer ponto de entrada, sem mudar o codigo
+VARIAVEL_PASTA = "WATTECH_METRICAS"
+VARIAVEL_PERFIL = "WATTECH_PERFIL"
+PERFIS = ('cprofile', 'amostragem')
+# Threads da propria instrumentacao, que o amostrador nao conta
+THREADS_INTERNAS = ('amostrador-pilhas', 'exportador-metricas', 'monitor-rss')
+
+
+def rss_bytes() -> int:
+    """
+    Memoria residente (RSS) atual do processo, em bytes.
+    """
+    try:
+        with open('/proc/self/statm') as arquivo:
+            return int(arquivo.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import psutil
+
+        return psutil.Process().memory_info().rss
+
+
+class MonitorRSS:
+    """
+    Context manager que le o RSS do processo a cada `intervalo_s`, numa thread, e guarda o
+    maior valor em `pico`: o pico do trecho medido, e nao o da vida do processo (ru_maxrss),
+    que uma segunda execucao no mesmo processo herdaria da primeira.
+    """
+
+    def __init__(self, intervalo_s: float = 0.05):
+        self.intervalo_s = intervalo_s
+        self.pico = 0
+        self._parar = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _amostrar(self):
+        while not self._parar.wait(self.intervalo_s):
+            self.pico = max(self.pico, rss_bytes())
+
+    def __enter__(self) -> 'MonitorRSS':
+        self.pico = rss_bytes()
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._amostrar, name="monitor-rss", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._thread.join()
+        self.pico = max(self.pico, rss_bytes())
+        return False
+
+
+@dataclass
+class Span:
+    nome: str
+    linhas: int = 0
+    bytes: int = 0
+
+
+@dataclass
+class AgregadoSpan:
+    chamadas: int = 0
+    segundos: float = 0.0
+    segundos_max: float = 0.0
+    linhas: int = 0
+    bytes: int = 0
+    rss_delta_bytes: int = 0
+
+    def resumo(self) -> dict:
+        return {
+            'chamadas': self.chamadas,
+            'segundos': round(self.segundos, 6),
+            'segundos_max': round(self.segundos_max, 6),
+            'linhas': self.linhas,
+            'bytes': self.bytes,
+            'linhas_por_s': round(self.linhas / self.segundos, 1) if self.segundos else 0.0,
+            'rss_delta_bytes': self.rss_delta_bytes,
+        }
+
+
+class AmostradorPilhas:
+    """
+    Profiler por amostragem: uma thread le a pilha de todas as threads a cada `intervalo_s`
+    (sys._current_frames) e conta as pilhas no formato "collapsed" (a;b;c N), que o
+    flamegraph.pl e o speedscope abrem direto. O custo nao depende de quantas funcoes rodam.
+    """
+
+    def __init__(self, intervalo_s: float = 0.01):
+        self.intervalo_s = intervalo_s
+        self.pilhas: Counter = Counter()
+        self._parar = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _amostrar(self):
+        nomes = {}
+        while not self._parar.wait(self.intervalo_s):
+            for thread in threading.enumerate():
+                nomes[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if nomes.get(ident) in THREADS_INTERNAS:
+                    continue
+                pilha = []
+                while frame is not None:
+                    codigo = frame.f_code
+                    pilha.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})")
+                    frame = frame.f_back
+                pilha.append(nomes.get(ident, str(ident)))
+                self.pilhas[';'.join(reversed(pilha))] += 1
+
+    def iniciar(self):
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._amostrar, name="amostrador-pilhas", daemon=True)
+        self._thread.start()
+
+    def parar(self, caminho: str):
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join()
+        with open(caminho, 'w') as arquivo:
+            for pilha, contagem in self.pilhas.most_common():
+                arquivo.write(f"{pilha} {contagem}\n")
+
+
+class Instrumentacao:
+    """
+    Spans nomeados em volta das etapas caras (geracao, CSV, DataFrame/Parquet, banco, S3).
+
+    Cada span mede duracao, linhas, bytes e a variacao do RSS do processo (com etapas em
+    threads, o RSS e do processo inteiro, nao da etapa). Desligada, span() custa uma chamada
+    de funcao. Ligada, cada span vira uma linha em `pasta`/spans.jsonl e os agregados por nome
+    vao para `pasta`/metricas.prom no formato texto do Prometheus (para o textfile collector
+    do node_exporter), regravado a cada `intervalo_exportacao_s` e no fim da execucao. Fora de
+    execucao() (uso como biblioteca, benchmark), o log e aberto no primeiro span e o
+    metricas.prom e gravado na saida do processo (atexit).
+
+    O `perfil` opcional liga um profiler durante execucao(): 'cprofile' (deterministico, so a
+    thread que chamou execucao(); gera perfil.prof e perfil.txt) ou 'amostragem' (todas as
+    threads, custo baixo; gera perfil.folded).
+    """
+
+    def __init__(self, pasta: str | None = None, perfil: str | None = None, prefixo: str = 'wattech',
+                 intervalo_amostragem_s: float = 0.01, intervalo_exportacao_s: float = 10.0):
+        if perfil is not None and perfil not in PERFIS:
+            raise ValueError(f"Perfil {perfil!r} invalido; use um de {PERFIS}")
+        self.pasta = pasta
+        self.perfil = perfil
+        self.prefixo = prefixo
+        self.intervalo_amostragem_s = intervalo_amostragem_s
+        self.intervalo_exportacao_s = intervalo_exportacao_s
+        self.agregados: dict[str, AgregadoSpan] = {}
+        self.rss_pico_bytes = 0
+        self._lock = threading.Lock()
+        self._log = None
+        self._atexit_registrado = False
+
+    @classmethod
+    def do_ambiente(cls) -> 'Instrumentacao':
+        """
+        Instrumentacao configurada por WATTECH_METRICAS (pasta de saida) e WATTECH_PERFIL.
+        """
+        return cls(os.getenv(VARIAVEL_PASTA) or None, os.getenv(VARIAVEL_PERFIL) or None)
+
+    def configurar(self, pasta: str | None = None, perfil: str | None = None):
+        """
+        Sobrepoe a pasta e o perfil (ex.: vindos da linha de comando); None mantem o atual.
+        """
+        if perfil is not None and perfil not in PERFIS:
+            raise ValueError(f"Perfil {perfil!r} invalido; use um de {PERFIS}")
+        self.pasta = pasta if pasta is not None else self.pasta
+        self.perfil = perfil if perfil is not None else self.perfil
+
+    @property
+    def ativo(self) -> bool:
+        return self.pasta is not None
+
+    def span(self, nome: str, linhas: int = 0, bytes: int = 0):
+        """
+        Context manager que mede o bloco; linhas e bytes podem ser ajustados no Span retornado.
+
+        :param nome: Nome do span (vira o label span= no Prometheus).
+        :param linhas: Linhas processadas, se ja conhecidas.
+        :param bytes: Bytes processados, se ja conhecidos.
+        """
+        if not self.ativo:
+            return _SpanInativo(Span(nome, linhas, bytes))
+        return self._medir(Span(nome, linhas, bytes))
+
+    def registrar(self, nome: str, segundos: float, linhas: int = 0, bytes: int = 0):
+        """
+        Registra um span medido fora deste processo (ex.: num worker do ProcessPoolExecutor, que
+        devolve a duracao junto com o resultado). O RSS registrado e o deste processo.
+
+        :param nome: Nome do span.
+        :param segundos: Duracao medida.
+        :param linhas: Linhas processadas.
+        :param bytes: Bytes processados.
+        """
+        if self.ativo:
+            self._registrar(Span(nome, linhas, bytes), segundos, rss_bytes(), 0)
+
+    @contextmanager
+    def _medir(self, span: Span):
+        rss_inicio = rss_bytes()
+        inicio = time.perf_counter()
+        try:
+            yield span
+        finally:
+            segundos = time.perf_counter() - inicio
+            rss_fim = rss_bytes()
+            self._registrar(span, segundos, rss_fim, rss_fim - rss_inicio)
+
+    def _registrar(self, span: Span, segundos: float, rss: int, rss_delta: int):
+        with self._lock:
+            agregado = self.agregados.setdefault(span.nome, AgregadoSpan())
+            agregado.chamadas += 1
+            agregado.segundos += segundos
+            agregado.segundos_max = max(agregado.segundos_max, segundos)
+            agregado.linhas += span.linhas
+            agregado.bytes += span.bytes
+            agregado.rss_delta_bytes += rss_delta
+            self.rss_pico_bytes = max(self.rss_pico_bytes, rss)
+            if self._log is None:
+                self._abrir_log()
+                if not self._atexit_registrado:
+                    atexit.register(self._encerrar_processo)
+                    self._atexit_registrado = True
+            self._log.write(json.dumps({
+                'ts': int(time.time() * 1000), 'span': span.nome, 'segundos': round(segundos, 6),
+                'linhas': span.linhas, 'bytes': span.bytes, 'rss_bytes': rss,
+                'rss_delta_bytes': rss_delta, 'thread': threading.current_thread().name}) + "\n")
+
+    def _abrir_log(self):
+        os.makedirs(self.pasta, exist_ok=True)
+        self._log = open(os.path.join(self.pasta, "spans.jsonl"), 'a', buffering=1)
+
+    def _fechar_log(self):
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+    def _encerrar_processo(self):
+        """
+        Grava as metricas dos spans medidos fora de execucao() quando o processo termina.
+        """
+        if self.ativo and self.agregados:
+            self.exportar_prometheus()
+        self._fechar_log()
+
+    def resumo(self) -> dict[str, dict]:
+        with self._lock:
+            return {nome: agregado.resumo() for nome, agregado in self.agregados.items()}
+
+    def texto_prometheus(self) -> str:
+        """
+        Agregados por span no formato texto de exposicao do Prometheus.
+        """
+        metricas = (
+            ('span_chamadas_total', 'counter', 'Spans concluidos', 'chamadas'),
+            ('span_segundos_total', 'counter', 'Tempo total dentro do span', 'segundos'),
+            ('span_segundos_max', 'gauge', 'Maior duracao de um span', 'segundos_max'),
+            ('span_linhas_total', 'counter', 'Linhas processadas no span', 'linhas'),
+            ('span_bytes_total', 'counter', 'Bytes processados no span', 'bytes'),
+            ('span_rss_delta_bytes', 'gauge', 'Soma da variacao do RSS durante o span', 'rss_delta_bytes'),
+        )
+        with self._lock:
+            agregados = sorted(self.agregados.items())
+            linhas = []
+            for nome, tipo, ajuda, campo in metricas:
+                linhas += [f"# HELP {self.prefixo}_{nome} {ajuda}", f"# TYPE {self.prefixo}_{nome} {tipo}"]
+                linhas += [f'{self.prefixo}_{nome}{{span="{span}"}} {getattr(agregado, campo)}'
+                           for span, agregado in agregados]
+            linhas += [f"# HELP {self.prefixo}_processo_rss_pico_bytes Maior RSS visto ao fim de um span",
+                       f"# TYPE {self.prefixo}_processo_rss_pico_bytes gauge",
+                       f"{self.prefixo}_processo_rss_pico_bytes {self.rss_pico_bytes}"]
+        return "\n".join(linhas) + "\n"
+
+    def exportar_prometheus(self, caminho: str | None = None):
+        """
+        Grava texto_prometheus() de forma atomica (o coletor nunca le um arquivo pela metade).
+        """
+        caminho = caminho or os.path.join(self.pasta, "metricas.prom")
+        temporario = f"{caminho}.tmp"
+        with open(temporario, 'w') as arquivo:
+            arquivo.write(self.texto_prometheus())
+        os.replace(temporario, caminho)
+
+    def _exportar_periodicamente(self, parar: threading.Event):
+        while not parar.wait(self.intervalo_exportacao_s):
+            self.exportar_prometheus()
+
+    @contextmanager
+    def execucao(self, nome: str = 'execucao'):
+        """
+        Abre o log de spans, liga o profiler escolhido e exporta as metricas durante e ao fim
+        do bloco. Sem pasta configurada nao faz nada.
+
+        :param nome: Nome do span que cobre a execucao inteira.
+        """
+        if not self.ativo:
+            yield self
+            return
+
+        with self._lock:
+            if self._log is None:
+                self._abrir_log()
+        parar = threading.Event()
+        exportador = threading.Thread(target=self._exportar_periodicamente, args=(parar,),
+                                      name="exportador-metricas", daemon=True)
+        exportador.start()
+
+        profiler = amostrador = None
+        if self.perfil == 'cprofile':
+            import cProfile
+
+            profiler = cProfile.Profile()
+            profiler.enable()
+        elif self.perfil == 'amostragem':
+            amostrador = AmostradorPilhas(self.intervalo_amostragem_s)
+            amostrador.iniciar()
+
+        try:
+            with self.span(nome):
+                yield self
+        finally:
+            if profiler is not None:
+                import pstats
+
+                profiler.disable()
+                profiler.dump_stats(os.path.join(self.pasta, "perfil.prof"))
+                with open(os.path.join(self.pasta, "perfil.txt"), 'w') as arquivo:
+                    pstats.Stats(profiler, stream=arquivo).sort_stats('cumulative').print_stats(40)
+            if amostrador is not None:
+                amostrador.parar(os.path.join(self.pasta, "perfil.folded"))
+            parar.set()
+            exportador.join()
+            self.exportar_prometheus()
+            self._fechar_log()
+
+
+class _SpanInativo:
+    """
+    Span da instrumentacao desligada: so devolve o Span, sem medir nada.
+    """
+    __slots__ = ('valor',)
+
+    def __init__(self, valor: Span):
+        self.valor = valor
+
+    def __enter__(self) -> Span:
+        return self.valor
+
+    def __exit__(self, *exc):
+        return False
+
+
+# Instancia do processo, usada pelos modulos instrumentados
+instrumentacao = Instrumentacao.do_ambiente()
+span = instrumentacao.span
+registrar_span = instrumentacao.registrar
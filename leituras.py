@@ -0,0 +1,257 @@
+import sys
+import datetime
+import numpy as np
+
+from instrumentacao import span
+
+
+CAMPOS = ('sensorModel', 'measureUnit', 'device', 'location', 'dataType', 'data', 'ts')
+CATEGORICOS = ('sensorModel', 'measureUnit', 'device', 'location', 'dataType')
+
+
+# Mudancas de fuso (horario de verao) caem em multiplos de 15 min UTC em todos os fusos em uso
+BALDE_FUSO_MS = 900_000
+# Duas mudancas de fuso ficam meses afastadas: intervalos menores com o mesmo offset nas pontas nao tem nenhuma
+JANELA_SEM_MUDANCA_MS = 28 * 86_400_000
+
+
+def _offset_local_ms(t: int) -> int:
+    return int(datetime.datetime.fromtimestamp(t / 1000).astimezone().utcoffset().total_seconds() * 1000)
+
+
+def _offsets_locais_ms(ts_ms: np.ndarray) -> np.ndarray | int:
+    """
+    Offset do horario local (ms) de cada timestamp epoch (ms).
+
+    Intervalos curtos com o mesmo offset nas pontas usam um offset unico. Nos demais, o
+    offset e calculado uma vez por balde de 15 min (np.unique) e mapeado de volta, entao um
+    intervalo que atravessa varias mudancas de fuso recebe o offset certo em cada trecho.
+
+    :return: Escalar (offset unico) ou array int64 com o formato de ts_ms.
+    """
+    minimo, maximo = int(ts_ms.min()), int(ts_ms.max())
+    inicio = _offset_local_ms(minimo)
+    if maximo - minimo < JANELA_SEM_MUDANCA_MS and inicio == _offset_local_ms(maximo):
+        return inicio
+    baldes, inversos = np.unique(ts_ms // BALDE_FUSO_MS, return_inverse=True)
+    offsets = np.array([_offset_local_ms(b * BALDE_FUSO_MS) for b in baldes.tolist()], dtype=np.int64)
+    return offsets[inversos.reshape(ts_ms.shape)]
+
+
+def dias_locais(ts_ms: np.ndarray) -> np.ndarray:
+    """
+    Retorna o dia (datetime64[D]) no horario local de cada timestamp epoch (ms).
+    """
+    ts_ms = np.asarray(ts_ms, dtype=np.int64)
+    if ts_ms.size == 0:
+        return np.array([], dtype='datetime64[D]')
+    return (ts_ms + _offsets_locais_ms(ts_ms)).astype('datetime64[ms]').astype('datetime64[D]')
+
+
+def horas_locais(ts_ms: np.ndarray) -> np.ndarray:
+    """
+    Retorna a hora do dia (0 a 24, fracionaria) no horario local de cada timestamp epoch (ms).
+    """
+    ts_ms = np.asarray(ts_ms, dtype=np.int64)
+    if ts_ms.size == 0:
+        return np.array([], dtype=np.float64)
+    return ((ts_ms + _offsets_locais_ms(ts_ms)) % 86_400_000) / 3_600_000
+
+
+def formatar_ts(ts_ms: np.ndarray) -> np.ndarray:
+    """
+    Converte timestamps epoch (ms) para texto no horario local, numa unica chamada vetorizada.
+
+    :param ts_ms: Array int64 de epoch em milissegundos.
+    :return: Array de strings no formato '%Y-%m-%d %H:%M:%S', com '.%f' em milissegundos
+        quando algum timestamp nao cai num segundo cheio (intervalo_ms abaixo de 1 s).
+    """
+    ts_ms = np.asarray(ts_ms, dtype=np.int64)
+    if ts_ms.size == 0:
+        return np.array([], dtype='<U19')
+    milissegundos = bool((ts_ms % 1000).any())
+    locais = (ts_ms + _offsets_locais_ms(ts_ms)).astype('datetime64[ms]')
+    return np.char.replace(np.datetime_as_string(locais, unit='ms' if milissegundos else 's'), 'T', ' ')
+
+
+def unidade_ts(texto: str) -> str:
+    """
+    Unidade de um ts em texto: 'ms' ou 's' para epoch (so digitos; ate 11 digitos sao segundos,
+    o que vale ate o ano 5138) ou 'texto' para '%Y-%m-%d %H:%M:%S[.%f]'. Detecte uma vez por
+    arquivo e repasse a parsear_ts, para que todos os blocos usem a mesma unidade.
+    """
+    texto = texto.strip()
+    if not texto.isdigit():
+        return 'texto'
+    return 's' if len(texto) <= 11 else 'ms'
+
+
+def parsear_ts(textos, unidade: str | None = None) -> np.ndarray:
+    """
+    Inverso de formatar_ts: converte texto no horario local para epoch (ms), vetorizado.
+
+    :param textos: Sequencia de strings '%Y-%m-%d %H:%M:%S' (com ou sem '.%f') ou de epoch em ms ou s.
+    :param unidade: 'texto', 'ms' ou 's' (ver unidade_ts); padrao: detectada pelo primeiro valor.
+    :return: Array int64 de epoch em milissegundos.
+    """
+    textos = np.asarray(textos, dtype=str)
+    if textos.size == 0:
+        return np.array([], dtype=np.int64)
+    unidade = unidade or unidade_ts(textos[0])
+    if unidade == 'ms':
+        return textos.astype(np.int64)
+    if unidade == 's':
+        return textos.astype(np.int64) * 1000
+
+    locais = textos.astype('datetime64[ms]').astype(np.int64)
+    # O offset depende do instante UTC, que ainda nao se conhece: estima com o offset do
+    # horario local lido como UTC e corrige com o offset do instante estimado
+    estimado = locais - _offsets_locais_ms(locais)
+    return locais - _offsets_locais_ms(estimado)
+
+
+class LoteLeituras:
+    """
+    Lote colunar de leituras de um sensor.
+
+    Os valores e timestamps ficam em arrays NumPy e as colunas de texto sao
+    codificadas em dicionario (codigos inteiros + lista de categorias). Linhas
+    em dict ou texto so sao montadas quando um consumidor pede.
+    """
+
+    def __init__(self, data: np.ndarray, ts: np.ndarray,
+                 codigos: dict[str, np.ndarray], categorias: dict[str, list[str]]):
+        self.data = np.asarray(data, dtype=np.float64)
+        self.ts = np.asarray(ts, dtype=np.int64)
+        self.codigos = codigos
+        self.categorias = categorias
+
+    @classmethod
+    def constante(cls, data: np.ndarray, ts: np.ndarray, **colunas):
+        """
+        Monta um lote onde cada coluna de texto e um valor unico ou um array de valores por linha.
+
+        :param data: Valores medidos.
+        :param ts: Timestamps epoch (ms).
+        :param colunas: sensorModel, measureUnit, device, location e dataType.
+        :return: LoteLeituras.
+        """
+        n = len(data)
+        codigos, categorias = {}, {}
+        for nome in CATEGORICOS:
+            valor = colunas[nome]
+            if isinstance(valor, str):
+                codigos[nome] = np.zeros(n, dtype=np.int32)
+                categorias[nome] = [valor]
+            else:
+                unicos, inversos = np.unique(np.asarray(valor), return_inverse=True)
+                codigos[nome] = inversos.astype(np.int32)
+                categorias[nome] = unicos.tolist()
+        return cls(data, ts, codigos, categorias)
+
+    @classmethod
+    def concatenar(cls, lotes: list['LoteLeituras']) -> 'LoteLeituras':
+        """
+        Junta varios lotes, recodificando os dicionarios de texto.
+        """
+        lotes = list(lotes)
+        codigos, categorias = {}, {}
+        for nome in CATEGORICOS:
+            indice: dict[str, int] = {}
+            partes = []
+            for lote in lotes:
+                mapa = np.array([indice.setdefault(c, len(indice)) for c in lote.categorias[nome]],
+                                dtype=np.int32)
+                partes.append(mapa[lote.codigos[nome]] if len(mapa) else lote.codigos[nome])
+            codigos[nome] = np.concatenate(partes) if partes else np.array([], dtype=np.int32)
+            categorias[nome] = list(indice)
+        data = np.concatenate([lote.data for lote in lotes]) if lotes else np.array([])
+        ts = np.concatenate([lote.ts for lote in lotes]) if lotes else np.array([], dtype=np.int64)
+        return cls(data, ts, codigos, categorias)
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Bytes ocupados pelos arrays e pelos dicionarios de texto do lote.
+        """
+        total = self.data.nbytes + self.ts.nbytes + sum(cod.nbytes for cod in self.codigos.values())
+        return total + sum(sys.getsizeof(c) for cats in self.categorias.values() for c in cats)
+
+    def coluna(self, nome: str) -> np.ndarray:
+        """
+        Retorna a coluna decodificada (texto para categoricos).
+        """
+        if nome == 'data':
+            return self.data
+        if nome == 'ts':
+            return self.ts
+        return np.asarray(self.categorias[nome], dtype=object)[self.codigos[nome]]
+
+    def fatiar(self, inicio: int, fim: int) -> 'LoteLeituras':
+        """
+        Retorna uma visao do lote entre as linhas inicio e fim, sem copiar os arrays.
+        """
+        return LoteLeituras(
+            self.data[inicio:fim],
+            self.ts[inicio:fim],
+            {nome: cod[inicio:fim] for nome, cod in self.codigos.items()},
+            self.categorias)
+
+    def selecionar(self, indices: np.ndarray) -> 'LoteLeituras':
+        """
+        Retorna um novo lote com as linhas indicadas, mantendo os dicionarios de texto.
+        """
+        return LoteLeituras(
+            self.data[indices],
+            self.ts[indices],
+            {nome: cod[indices] for nome, cod in self.codigos.items()},
+            self.categorias)
+
+    def blocos(self, tamanho: int):
+        """
+        Itera o lote em fatias de no maximo `tamanho` linhas.
+        """
+        for inicio in range(0, len(self), tamanho):
+            yield self.fatiar(inicio, inicio + tamanho)
+
+    def linhas(self):
+        """
+        Itera o lote como tuplas na ordem de CAMPOS (ts em texto), prontas para csv.writer.
+        """
+        colunas = [self.coluna(nome).tolist() for nome in CATEGORICOS]
+        colunas.append(self.data.tolist())
+        colunas.append(formatar_ts(self.ts).tolist())
+        return zip(*colunas)
+
+    def to_records(self) -> list[dict]:
+        """
+        Materializa o lote como lista de dicts no formato legado (ts em texto).
+        """
+        return [dict(zip(CAMPOS, linha)) for linha in self.linhas()]
+
+    def to_arrow(self):
+        """
+        Converte o lote para pyarrow.Table sem copiar os arrays numericos; as colunas de
+        texto viram DictionaryArray sobre os mesmos codigos.
+        """
+        from parquet_sensores import lote_para_tabela
+
+        return lote_para_tabela(self, CAMPOS)
+
+    def to_dataframe(self):
+        """
+        Converte o lote para DataFrame com colunas categoricas do pandas (sem repetir o texto por linha).
+        """
+        import pandas as pd
+
+        with span('dataframe', len(self), self.nbytes):
+            dados = {
+                nome: pd.Categorical.from_codes(self.codigos[nome], self.categorias[nome])
+                for nome in CATEGORICOS
+            }
+            dados['data'] = self.data
+            dados['ts'] = self.ts
+            return pd.DataFrame(dados, columns=list(CAMPOS))
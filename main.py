@@ -1,6 +1,247 @@
-from algas_sensores import AlgasSimulador
+import sys
+import argparse
+
+# Modulos pesados (numpy, sqlalchemy, pyarrow, boto3, networkx, matplotlib) so sao importados
+# dentro do subcomando que precisa deles, para manter o --help e o dry run rapidos.
+from cenarios import CENARIOS, carregar_registro, fatiar, ler_shard
+
+
+def _cenarios(args) -> list[dict]:
+    return carregar_registro(args.registro) if args.registro else CENARIOS
+
+
+def generate(args):
+    cenarios = _cenarios(args)
+    if args.dry_run:
+        fatia = fatiar(cenarios, args.shard)
+        por_sensor: dict[str, int] = {}
+        for cenario in fatia:
+            por_sensor[cenario['sensor']] = por_sensor.get(cenario['sensor'], 0) + 1
+        shard = f" (shard {args.shard[0]}/{args.shard[1]} de {len(cenarios)})" if args.shard else ""
+        print(f"{len(fatia)} devices{shard}, {len(fatia) * args.leituras} leituras")
+        for sensor, quantidade in sorted(por_sensor.items()):
+            print(f"  {sensor}: {quantidade}")
+        return
+
+    from dotenv import load_dotenv
+    from algas_sensores import AlgasSimulador
+
+    if args.grafo and args.incremental:
+        raise SystemExit("--grafo nao suporta --incremental (os checkpoints sao por device do registro)")
+
+    load_dotenv()
+    simulador = AlgasSimulador(cenarios, shard=args.shard)
+    simulador.simulador.n_dados = args.leituras
+    simulador.simulador.amplitude_diaria = args.amplitude_diaria
+    if args.incremental:
+        simulador.run_incremental(semente=args.semente if args.semente is not None else 2025, workers=args.workers)
+    elif args.sobrepor:
+        simulador.run_sobreposto(semente=args.semente, workers=args.workers, formato=args.formato,
+                                 detectar=args.detectar, adiar_indices=args.adiar_indices, sites=args.grafo)
+    else:
+        simulador.run(semente=args.semente, workers=args.workers, formato=args.formato, detectar=args.detectar,
+                      adiar_indices=args.adiar_indices, sites=args.grafo)
+
+
+def upload(args):
+    import os
+    from dotenv import load_dotenv
+    from envio_s3 import EnviadorS3
+
+    load_dotenv()
+    if not os.path.exists(args.pasta):
+        print(f"Pasta {args.pasta} nao existe.")
+        return
+    enviador = EnviadorS3(args.bucket or os.getenv("AWS_S3_BUCKET_NAME", "raw-wattech10"))
+    extensoes = tuple(args.extensoes) if args.extensoes else None
+    resumo = enviador.enviar_pasta(args.pasta, args.prefixo, extensoes=extensoes)
+    print(f"Arquivos enviados para S3: {resumo['enviados']} enviados, {resumo['pulados']} sem mudanca, "
+          f"{resumo['falhas']} falhas em {resumo['segundos']:.1f}s")
+
+
+def ingest(args):
+    from database import Database
+    from ingestao import ingerir
+
+    db = Database(args.db)
+    db.create_table()
+    resumo = ingerir(db, args.arquivos, args.tamanho_bloco, adiar_indices=args.adiar_indices)
+    print(f"{resumo['linhas']} linhas de {resumo['arquivos']} arquivos carregadas em {resumo['segundos']}s "
+          f"({resumo['linhas_por_s']:.0f} linhas/s)")
+
+
+def _epoch_ms(texto: str | None) -> int | None:
+    if texto is None:
+        return None
+    from leituras import parsear_ts
+
+    return int(parsear_ts([texto])[0])
+
+
+def export(args):
+    from database import Database
+    from exportacao import exportar
+
+    resumo = exportar(Database(args.db), args.saida, args.formato, devices=args.device, data_types=args.tipo,
+                      inicio_ms=_epoch_ms(args.inicio), fim_ms=_epoch_ms(args.fim), tamanho_lote=args.tamanho_lote)
+    print(f"{resumo['linhas']} linhas exportadas em {resumo['arquivos']} arquivos ({args.saida}) em "
+          f"{resumo['segundos']}s ({resumo['linhas_por_s']:.0f} linhas/s)")
+
+
+def replay(args):
+    import json
+    from ao_vivo import MetricasPublicacao, PublicadorMemoria, PublicadorMQTT
+    from ingestao import reproduzir
+
+    metricas = MetricasPublicacao()
+    publicador = PublicadorMemoria(metricas) if args.memoria else PublicadorMQTT(metricas, args.host, args.port)
+    print(f"Reproduzindo {len(args.arquivos)} arquivos a {args.velocidade}x o tempo real...")
+    try:
+        resumo = reproduzir(args.arquivos, publicador, args.velocidade, args.topico, args.leituras_por_mensagem,
+                            ts_atual=args.ts_atual, duracao_s=args.duracao)
+    finally:
+        publicador.fechar()
+    print(json.dumps(resumo, indent=2))
+
+
+def live(args, extras: list[str]):
+    import ao_vivo
+
+    ao_vivo.main(extras)
+
+
+def bench(args, extras: list[str]):
+    import benchmark
+
+    benchmark.main(extras)
+
+
+def grafo(args):
+    from grafo.grafo_wattech import criar_grafo, desenhar
+
+    print(desenhar(criar_grafo(), args.pasta, args.mostrar))
+
+
+def _instrumentavel(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
+    parser.add_argument('--metricas', metavar='PASTA',
+                        help="Grava os spans (spans.jsonl) e as metricas Prometheus (metricas.prom) na pasta "
+                             "(padrao: $WATTECH_METRICAS)")
+    parser.add_argument('--perfil', choices=('cprofile', 'amostragem'),
+                        help="Liga um profiler durante a execucao (padrao: $WATTECH_PERFIL)")
+    return parser
+
+
+def _instrumentado(args, funcao):
+    from instrumentacao import instrumentacao
+
+    instrumentacao.configurar(args.metricas, args.perfil)
+    with instrumentacao.execucao(args.comando):
+        funcao(args)
+    if instrumentacao.ativo:
+        print(f"Spans em {instrumentacao.pasta}:")
+        for nome, span in sorted(instrumentacao.resumo().items(), key=lambda item: -item[1]['segundos']):
+            print(f"  {nome}: {span['chamadas']}x, {span['segundos']:.3f}s, {span['linhas']} linhas "
+                  f"({span['linhas_por_s']:.0f}/s), RSS {span['rss_delta_bytes'] / 2**20:+.1f} MiB")
+
+
+def criar_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Simulador de sensores da WatTech.")
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+
+    gerar = _instrumentavel(subcomandos.add_parser('generate', help="Simula os devices e envia os dados ao S3"))
+    gerar.add_argument('--registro', help="Registro de devices em JSON/TOML (padrao: cenarios.CENARIOS)")
+    gerar.add_argument('--shard', type=ler_shard, help="i/N: processa so a fatia i de N dos devices")
+    gerar.add_argument('--leituras', type=int, default=500, help="Leituras por device")
+    gerar.add_argument('--workers', type=int, default=1)
+    gerar.add_argument('--semente', type=int)
+    gerar.add_argument('--formato', choices=('parquet', 'csv'), default='parquet')
+    gerar.add_argument('--amplitude-diaria', type=float, default=0.0,
+                       help="Acrescimo relativo do consumo do Shelly nos picos do dia (0 = sem perfil)")
+    gerar.add_argument('--detectar', action='store_true', help="Passa as leituras pelo detector de anomalias")
+    gerar.add_argument('--grafo', nargs='+', metavar='SITE',
+                       help="Gera os sites informados com os sensores correlacionados pelo grafo de influencia, "
+                            "no lugar dos devices do registro")
+    gerar.add_argument('--incremental', action='store_true', help="Gera so o intervalo desde o ultimo checkpoint")
+    gerar.add_argument('--sobrepor', action='store_true',
+                       help="Gera, serializa e envia ao S3 em paralelo, ligados por filas limitadas")
+    indices = gerar.add_mutually_exclusive_group()
+    indices.add_argument('--adiar-indices', dest='adiar_indices', action='store_const', const=True,
+                         help="Remove os indices durante a carga e os recria no final")
+    indices.add_argument('--manter-indices', dest='adiar_indices', action='store_const', const=False,
+                         help="Mantem os indices durante a carga (padrao: adia so se a carga for maior que a tabela)")
+    gerar.add_argument('--dry-run', action='store_true', help="So lista os devices que seriam gerados")
+    gerar.set_defaults(funcao=generate)
+
+    enviar = _instrumentavel(
+        subcomandos.add_parser('upload', help="Envia uma pasta local ao S3, pulando arquivos sem mudanca"))
+    enviar.add_argument('--pasta', default='output/csv')
+    enviar.add_argument('--prefixo', default='csv/')
+    enviar.add_argument('--bucket', default='')
+    enviar.add_argument('--extensoes', nargs='*', default=['.csv'])
+    enviar.set_defaults(funcao=upload)
+
+    carregar = _instrumentavel(
+        subcomandos.add_parser('ingest', help="Carrega CSVs historicos (dados.csv, cenario_*) no banco"))
+    carregar.add_argument('arquivos', nargs='+')
+    carregar.add_argument('--db', default='algas', help="Nome do banco SQLite (sem .db)")
+    carregar.add_argument('--tamanho-bloco', type=int, default=50_000, help="Linhas lidas e inseridas por vez")
+    indices = carregar.add_mutually_exclusive_group()
+    indices.add_argument('--adiar-indices', dest='adiar_indices', action='store_const', const=True,
+                         help="Remove os indices durante a carga e os recria no final")
+    indices.add_argument('--manter-indices', dest='adiar_indices', action='store_const', const=False,
+                         help="Mantem os indices durante a carga (padrao: adia so se a carga for maior que a tabela)")
+    carregar.set_defaults(funcao=ingest)
+
+    exportar = _instrumentavel(
+        subcomandos.add_parser('export', help="Exporta leituras do banco para CSV ou Parquet, lote a lote"))
+    exportar.add_argument('saida', help="Arquivo CSV ou pasta raiz do Parquet")
+    exportar.add_argument('--db', default='algas', help="Nome do banco SQLite (sem .db)")
+    exportar.add_argument('--formato', choices=('csv', 'parquet'), default='csv')
+    exportar.add_argument('--device', action='append', help="deviceId a exportar (repetivel; padrao: todos)")
+    exportar.add_argument('--tipo', action='append', help="dataType a exportar (repetivel; padrao: todos)")
+    exportar.add_argument('--inicio', help="Inicio do intervalo: 'AAAA-MM-DD[ HH:MM:SS]' local ou epoch ms")
+    exportar.add_argument('--fim', help="Fim do intervalo (exclusivo), no mesmo formato")
+    exportar.add_argument('--tamanho-lote', type=int, default=50_000, help="Linhas lidas do banco por vez")
+    exportar.set_defaults(funcao=export)
+
+    reproduzir = _instrumentavel(
+        subcomandos.add_parser('replay', help="Republica CSVs historicos via MQTT, N vezes o tempo real"))
+    reproduzir.add_argument('arquivos', nargs='+')
+    reproduzir.add_argument('--velocidade', type=float, default=1.0, help="Fator de aceleracao (60 = 1 h por minuto)")
+    reproduzir.add_argument('--ts-atual', action='store_true', help="Publica com o horario atual no lugar do gravado")
+    reproduzir.add_argument('--duracao', type=float, help="Para apos N segundos (padrao: ate o fim dos arquivos)")
+    reproduzir.add_argument('--topico', default='wattech/replay')
+    reproduzir.add_argument('--leituras-por-mensagem', type=int, default=50)
+    reproduzir.add_argument('--host', default='localhost')
+    reproduzir.add_argument('--port', type=int, default=1883)
+    reproduzir.add_argument('--memoria', action='store_true', help="Usa o publicador em processo, sem broker")
+    reproduzir.set_defaults(funcao=replay)
+
+    # live e bench repassam os argumentos restantes ao parser do proprio modulo
+    subcomandos.add_parser('live', help="Publica leituras ao vivo via MQTT (ver ao_vivo.py --help)",
+                           add_help=False).set_defaults(funcao=live, repassar=True)
+    subcomandos.add_parser('bench', help="Benchmark de carga e de inicializacao (ver benchmark.py --help)",
+                           add_help=False).set_defaults(funcao=bench, repassar=True)
+
+    desenhar = subcomandos.add_parser('grafo', help="Renderiza o grafo de influencia entre os sensores")
+    desenhar.add_argument('--pasta', default='output/plot')
+    desenhar.add_argument('--mostrar', action='store_true')
+    desenhar.set_defaults(funcao=grafo)
+    return parser
+
+
+def main(argv: list[str] | None = None):
+    parser = criar_parser()
+    args, extras = parser.parse_known_args(argv)
+    if getattr(args, 'repassar', False):
+        args.funcao(args, extras)
+    elif extras:
+        parser.error(f"argumentos nao reconhecidos: {' '.join(extras)}")
+    elif hasattr(args, 'metricas') and not getattr(args, 'dry_run', False):
+        _instrumentado(args, args.funcao)
+    else:
+        args.funcao(args)
 
 
 if __name__ == "__main__":
-    benchmark = AlgasSimulador()
-    benchmark.run()
\ No newline at end of file
+    main(sys.argv[1:])
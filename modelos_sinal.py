@@ -0,0 +1,150 @@
+import numpy as np
+
+from leituras import horas_locais
+
+# Gerador -> (sensorModel, measureUnit, dataType), como nos metodos *_lote do SimuladorSensor
+METADADOS = {
+    'shelly_em': ('Shelly EM', 'kWh', 'Consumo de Energia'),
+    'sonoff_pow_r3': ('Sonoff Pow R3', 'W', 'Consumo de Energia'),
+    'pzem_004t': ('PZEM-004T', 'V', 'Tensão'),
+    'hms_m21': ('hms_m21', 'C', 'Temperatura'),
+    'fluke_1735': ('Fluke 1735', '%', 'Fator de Potência'),
+    'ct_clamp': ('ct_clamp', 'A', 'Corrente Elétrica'),
+}
+
+# Casas decimais de cada gerador
+CASAS = {'shelly_em': 2, 'sonoff_pow_r3': 5, 'pzem_004t': 5, 'hms_m21': 2, 'fluke_1735': 5, 'ct_clamp': 5}
+
+
+# Componentes: funcoes vetorizadas sobre arrays (devices, tempo), com o tempo no ultimo eixo
+
+def media_movel(x: np.ndarray, janela: int) -> np.ndarray:
+    """
+    Media movel centrada de `janela` leituras no ultimo eixo, por somas acumuladas: O(n) e
+    independente da janela. Equivale a np.convolve(x, np.ones(janela) / janela, mode='same')
+    em cada linha (bordas completadas com zero).
+    """
+    x = np.asarray(x, dtype=np.float64)
+    n = x.shape[-1]
+    acumulado = np.zeros(x.shape[:-1] + (n + 1,))
+    np.cumsum(x, axis=-1, out=acumulado[..., 1:])
+    i = np.arange(n)
+    fim = np.minimum(i + (janela - 1) // 2 + 1, n)
+    inicio = np.maximum(i - janela // 2, 0)
+    return (acumulado[..., fim] - acumulado[..., inicio]) / janela
+
+
+def curva_diaria(ts_ms: np.ndarray, picos: tuple[tuple[float, float], ...] = ((8.0, 2.0), (19.0, 3.0)),
+                 amplitude: float = 0.5) -> np.ndarray:
+    """
+    Perfil de carga diario multiplicativo: 1 fora dos picos e ate 1 + amplitude neles.
+
+    :param ts_ms: Timestamps epoch (ms) da serie.
+    :param picos: Pares (hora local do pico, largura em horas) de cada pico gaussiano.
+    :param amplitude: Acrescimo relativo no pico.
+    :return: Array com o formato de ts_ms.
+    """
+    horas = horas_locais(ts_ms)
+    perfil = np.zeros_like(horas)
+    for hora, largura in picos:
+        distancia = (horas - hora + 12) % 24 - 12
+        perfil = np.maximum(perfil, np.exp(-0.5 * (distancia / largura) ** 2))
+    return 1 + amplitude * perfil
+
+
+def senoide(indices: np.ndarray, amplitude: float, frequencia: float, fases: np.ndarray | float = 0.0) -> np.ndarray:
+    """
+    amplitude * sin(indice * frequencia + fase), com uma fase por device.
+
+    :param indices: Indices das leituras, formato (n,).
+    :param fases: Escalar ou array (devices,).
+    :return: Array (devices, n) (ou (n,) com fase escalar).
+    """
+    fases = np.asarray(fases, dtype=np.float64)
+    return amplitude * np.sin(indices * frequencia + fases[..., None])
+
+
+def rampas(rng: np.random.Generator, forma: tuple[int, int], nominal: float = 220.0,
+           limites: tuple[float, float] = (198.0, 242.0), probabilidade: float = 0.05,
+           duracao: tuple[int, int] = (5, 15)) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Eventos de afundamento/elevacao para todos os devices de uma vez.
+
+    Cada linha e uma sequencia de segmentos: uma leitura normal ou, com `probabilidade`,
+    uma rampa de `duracao` leituras que vai do nominal ate perto de um dos limites e volta.
+    O segmento de cada posicao sai de uma soma acumulada das marcas de inicio, sem laco.
+
+    :param forma: (devices, n).
+    :return: (valores da rampa, mascara das leituras dentro de uma rampa), ambos (devices, n).
+    """
+    _, n = forma
+    eh_rampa = rng.random(forma) < probabilidade
+    tamanhos = np.where(eh_rampa, rng.integers(duracao[0], duracao[1], forma), 1)
+    inicios = np.cumsum(tamanhos, axis=1) - tamanhos
+
+    # O segmento k de cada linha comeca em inicios[:, k]; marca os inicios dentro da janela
+    marcas = np.zeros(forma, dtype=np.int32)
+    linhas, segmentos = np.nonzero(inicios < n)
+    marcas[linhas, inicios[linhas, segmentos]] = 1
+    segmento = np.cumsum(marcas, axis=1) - 1
+
+    afundamento = rng.random(forma) < 0.5
+    extremos = np.where(afundamento,
+                        limites[0] + rng.uniform(0, 2, forma),
+                        limites[1] - rng.uniform(0, 2, forma))
+
+    tam = np.take_along_axis(tamanhos, segmento, axis=1)
+    pos = np.arange(n) - np.take_along_axis(inicios, segmento, axis=1)
+    fim = np.take_along_axis(extremos, segmento, axis=1)
+    metade = tam // 2
+    # Equivalente a np.linspace(nominal, fim, metade) seguido de np.linspace(fim, nominal, tam - metade)
+    descida = nominal + (fim - nominal) * pos / np.maximum(metade - 1, 1)
+    subida = fim + (nominal - fim) * (pos - metade) / np.maximum(tam - metade - 1, 1)
+    return np.where(pos < metade, descida, subida), np.take_along_axis(eh_rampa, segmento, axis=1)
+
+
+# Modelos: um por gerador, (rng, (devices, n), inicio) -> valores (devices, n) antes do alerta
+
+def shelly_em(rng: np.random.Generator, forma: tuple[int, int], inicio: int = 0,
+              ts_ms: np.ndarray | None = None, amplitude_diaria: float = 0.0) -> np.ndarray:
+    consumo = rng.normal(100, 30, forma)
+    if amplitude_diaria and ts_ms is not None:
+        consumo = consumo * curva_diaria(ts_ms, amplitude=amplitude_diaria)
+    return np.maximum(consumo, 5)
+
+
+def sonoff_pow_r3(rng: np.random.Generator, forma: tuple[int, int], inicio: int = 0,
+                  fases: np.ndarray | float = 0.0) -> np.ndarray:
+    indices = np.arange(inicio, inicio + forma[1])
+    return np.abs(senoide(indices, 100, 1 / 3, fases) + rng.normal(0, 10, forma))
+
+
+def pzem_004t(rng: np.random.Generator, forma: tuple[int, int], inicio: int = 0) -> np.ndarray:
+    rampa, em_rampa = rampas(rng, forma)
+    normal = np.clip(220 + rng.normal(0, 1.2, forma), 218, 222)
+    oscilacao = np.clip(rampa + rng.normal(0, 0.7, forma), 198, 242)
+    return np.where(em_rampa, oscilacao, normal)
+
+
+def hms_m21(rng: np.random.Generator, forma: tuple[int, int], inicio: int = 0) -> np.ndarray:
+    return 25 + rng.normal(0, 2, forma)
+
+
+def fluke_1735(rng: np.random.Generator, forma: tuple[int, int], inicio: int = 0, janela: int = 1) -> np.ndarray:
+    # P / S = V I cos(phi) / V I: o fator de potencia so depende do angulo de fase
+    angulos = 23.07 + media_movel(rng.normal(0, 20, forma), min(janela, forma[1]))
+    return np.cos(np.radians(angulos))
+
+
+def ct_clamp(rng: np.random.Generator, forma: tuple[int, int], inicio: int = 0, janela: int = 1) -> np.ndarray:
+    return 5 + media_movel(rng.normal(0, 30, forma), min(janela, forma[1]))
+
+
+MODELOS = {
+    'shelly_em': shelly_em,
+    'sonoff_pow_r3': sonoff_pow_r3,
+    'pzem_004t': pzem_004t,
+    'hms_m21': hms_m21,
+    'fluke_1735': fluke_1735,
+    'ct_clamp': ct_clamp,
+}
@@ -0,0 +1,162 @@
+import os
+from collections import deque
+from urllib.parse import quote
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from instrumentacao import span
+from leituras import CATEGORICOS, LoteLeituras, dias_locais
+
+# sensorModel vira diretorio de particao (dia=.../sensorModel=...), entao nao e gravado dentro do arquivo
+COLUNAS_ARQUIVO = ('measureUnit', 'device', 'location', 'dataType', 'data', 'ts')
+
+SCHEMA = pa.schema(
+    [(nome, pa.dictionary(pa.int32(), pa.string())) for nome in COLUNAS_ARQUIVO[:4]] +
+    [('data', pa.float64()), ('ts', pa.timestamp('ms', tz='UTC'))]
+)
+
+
+def lote_para_tabela(lote: LoteLeituras, colunas: tuple[str, ...] = COLUNAS_ARQUIVO) -> pa.Table:
+    """
+    Converte um LoteLeituras numa tabela Arrow, com as colunas de texto dictionary-encoded.
+
+    :param lote: Lote de leituras.
+    :param colunas: Colunas a incluir.
+    :return: pyarrow.Table.
+    """
+    arrays = []
+    for nome in colunas:
+        if nome in CATEGORICOS:
+            arrays.append(pa.DictionaryArray.from_arrays(
+                pa.array(lote.codigos[nome], type=pa.int32()),
+                pa.array(lote.categorias[nome], type=pa.string())))
+        elif nome == 'ts':
+            arrays.append(pa.array(lote.ts, type=pa.int64()).cast(pa.timestamp('ms', tz='UTC')))
+        else:
+            arrays.append(pa.array(getattr(lote, nome)))
+    return pa.Table.from_arrays(arrays, names=list(colunas))
+
+
+class EscritorParquet:
+    """
+    Grava lotes em Parquet particionado por dia e modelo de sensor (layout Hive):
+
+        <raiz>/dia=2025-01-31/sensorModel=Shelly EM/part-0000.parquet
+
+    As linhas de cada particao sao acumuladas ate `linhas_por_grupo` antes de virarem
+    um row group, e o total em buffer e limitado por `max_linhas_buffer`. No maximo
+    `max_arquivos_abertos` ParquetWriter ficam abertos; se uma particao fechada receber
+    mais dados, eles vao para o proximo arquivo (part-0001, ...). Com `prefixo_arquivo`
+    distintos, execucoes diferentes acrescentam arquivos a mesma particao sem sobrescrever.
+    Com `linhas_por_arquivo`, o arquivo da particao e fechado ao atingir esse total e os
+    dados seguintes vao para a proxima parte. Os caminhos de arquivos ja fechados (prontos
+    para envio) ficam em `concluidos`. Use como context manager ou chame fechar() ao final.
+    """
+
+    def __init__(
+            self,
+            raiz: str,
+            compressao: str = 'zstd',
+            linhas_por_grupo: int = 128_000,
+            max_linhas_buffer: int = 1_000_000,
+            max_arquivos_abertos: int = 64,
+            prefixo_arquivo: str = 'part',
+            linhas_por_arquivo: int | None = None):
+        self.raiz = raiz
+        self.prefixo_arquivo = prefixo_arquivo
+        self.compressao = compressao
+        self.linhas_por_grupo = linhas_por_grupo
+        self.max_linhas_buffer = max_linhas_buffer
+        self.max_arquivos_abertos = max_arquivos_abertos
+        self.linhas_por_arquivo = linhas_por_arquivo
+
+        self.buffers: dict[tuple[str, str], list[LoteLeituras]] = {}
+        self.linhas_em_buffer: dict[tuple[str, str], int] = {}
+        self.writers: dict[tuple[str, str], pq.ParquetWriter] = {}
+        self.partes: dict[tuple[str, str], int] = {}
+        self.arquivos: list[str] = []
+        self.concluidos: deque[str] = deque()
+        self.linhas_arquivo: dict[tuple[str, str], int] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+    def caminho(self, dia: str, modelo: str, parte: int = 0) -> str:
+        return os.path.join(
+            self.raiz, f"dia={dia}", f"sensorModel={quote(modelo, safe=' ')}", f"{self.prefixo_arquivo}-{parte:04d}.parquet")
+
+    def escrever(self, lote: LoteLeituras):
+        """
+        Distribui as linhas do lote entre as particoes (dia, sensorModel).
+        """
+        if len(lote) == 0:
+            return
+        dias = dias_locais(lote.ts)
+        modelos = lote.codigos['sensorModel']
+        chave = dias.astype(np.int64) * len(lote.categorias['sensorModel']) + modelos
+        ordem = np.argsort(chave, kind='stable')
+        _, inicios = np.unique(chave[ordem], return_index=True)
+        fins = np.append(inicios[1:], len(ordem))
+
+        for inicio, fim in zip(inicios, fins):
+            linhas = ordem[inicio:fim]
+            particao = (str(dias[linhas[0]]), lote.categorias['sensorModel'][modelos[linhas[0]]])
+            parte = lote if len(linhas) == len(lote) else lote.selecionar(linhas)
+            self.buffers.setdefault(particao, []).append(parte)
+            self.linhas_em_buffer[particao] = self.linhas_em_buffer.get(particao, 0) + len(parte)
+            if self.linhas_em_buffer[particao] >= min(self.linhas_por_grupo, self.linhas_por_arquivo or np.inf):
+                self._descarregar(particao)
+
+        while sum(self.linhas_em_buffer.values()) > self.max_linhas_buffer:
+            self._descarregar(max(self.linhas_em_buffer, key=self.linhas_em_buffer.get))
+
+    def _descarregar(self, particao: tuple[str, str]):
+        lotes = self.buffers.pop(particao)
+        self.linhas_em_buffer.pop(particao)
+        with span('parquet_grupo') as medida:
+            tabela = lote_para_tabela(lotes[0] if len(lotes) == 1 else LoteLeituras.concatenar(lotes))
+            self._writer(particao).write_table(tabela)
+            medida.linhas, medida.bytes = tabela.num_rows, tabela.nbytes
+        self.linhas_arquivo[particao] += tabela.num_rows
+        if self.linhas_por_arquivo and self.linhas_arquivo[particao] >= self.linhas_por_arquivo:
+            self._fechar_writer(particao)
+
+    def _fechar_writer(self, particao: tuple[str, str]):
+        self.writers.pop(particao).close()
+        self.concluidos.append(self.caminho(*particao, self.partes[particao]))
+
+    def _writer(self, particao: tuple[str, str]) -> pq.ParquetWriter:
+        if particao in self.writers:
+            # Reinsere no fim do dict para manter a ordem de uso (LRU)
+            self.writers[particao] = self.writers.pop(particao)
+            return self.writers[particao]
+
+        if len(self.writers) >= self.max_arquivos_abertos:
+            self._fechar_writer(next(iter(self.writers)))
+
+        parte = self.partes.get(particao, -1) + 1
+        self.partes[particao] = parte
+        caminho = self.caminho(*particao, parte)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        self.writers[particao] = pq.ParquetWriter(
+            caminho, SCHEMA, compression=self.compressao, use_dictionary=True)
+        self.arquivos.append(caminho)
+        self.linhas_arquivo[particao] = 0
+        return self.writers[particao]
+
+    def fechar(self) -> list[str]:
+        """
+        Descarrega os buffers e fecha todas as particoes abertas.
+
+        :return: Caminhos dos arquivos gravados.
+        """
+        for particao in list(self.buffers):
+            self._descarregar(particao)
+        for particao in list(self.writers):
+            self._fechar_writer(particao)
+        return self.arquivos
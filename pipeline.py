@@ -0,0 +1,146 @@
+import time
+import queue
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Iterable
+
+# Marca o fim do fluxo numa fila
+_FIM = object()
+
+
+@dataclass
+class MetricasEstagio:
+    nome: str
+    itens: int = 0
+    ocupado_s: float = 0.0
+    profundidade_soma: int = 0
+    profundidade_max: int = 0
+    amostras: int = 0
+    inicio: float = field(default_factory=time.perf_counter)
+    fim: float | None = None
+
+    def amostrar(self, fila: queue.Queue):
+        profundidade = fila.qsize()
+        self.profundidade_soma += profundidade
+        self.profundidade_max = max(self.profundidade_max, profundidade)
+        self.amostras += 1
+
+    def resumo(self) -> dict:
+        duracao = (self.fim or time.perf_counter()) - self.inicio
+        return {
+            'itens': self.itens,
+            'itens_por_s': round(self.itens / duracao, 1) if duracao else 0.0,
+            'ocupado_s': round(self.ocupado_s, 3),
+            'ocupacao': round(self.ocupado_s / duracao, 3) if duracao else 0.0,
+            'fila_media': round(self.profundidade_soma / self.amostras, 2) if self.amostras else 0.0,
+            'fila_max': self.profundidade_max,
+        }
+
+
+class PipelineConcorrente:
+    """
+    Executa etapas no formato das etapas do AlgasSimulador (funcao que recebe um iteravel e
+    devolve um gerador) cada uma na sua thread, ligadas por filas de no maximo `tamanho_fila`
+    itens. Uma etapa lenta enche a fila de entrada e bloqueia a anterior (backpressure), entao
+    a memoria fica limitada e o tempo total tende ao da etapa mais lenta, nao a soma de todas.
+
+    Para cada etapa sao medidos os itens produzidos, o tempo ocupado (sem contar a espera
+    por entrada) e a profundidade da fila de entrada. Uma excecao em qualquer etapa cancela
+    as demais e e relancada por executar().
+    """
+
+    def __init__(self, tamanho_fila: int = 4, intervalo_espera_s: float = 0.1):
+        self.tamanho_fila = tamanho_fila
+        self.intervalo_espera_s = intervalo_espera_s
+        self.metricas: dict[str, MetricasEstagio] = {}
+        self._cancelado = threading.Event()
+        self._erros: list[BaseException] = []
+
+    def _colocar(self, fila: queue.Queue, item) -> bool:
+        while not self._cancelado.is_set():
+            try:
+                fila.put(item, timeout=self.intervalo_espera_s)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _consumir(self, fila: queue.Queue, metricas: MetricasEstagio, espera: list[float]):
+        """
+        Itera a fila de entrada ate o fim do fluxo, acumulando em `espera` o tempo bloqueado.
+        """
+        while not self._cancelado.is_set():
+            inicio = time.perf_counter()
+            metricas.amostrar(fila)
+            try:
+                item = fila.get(timeout=self.intervalo_espera_s)
+            except queue.Empty:
+                espera[0] += time.perf_counter() - inicio
+                continue
+            espera[0] += time.perf_counter() - inicio
+            if item is _FIM:
+                return
+            yield item
+
+    def _rodar(self, nome: str, etapa: Callable[[Iterable], Iterable] | None, fonte,
+               entrada: queue.Queue | None, saida: queue.Queue | None):
+        metricas = self.metricas[nome]
+        espera = [0.0]
+        itens = None
+        try:
+            itens = iter(fonte if etapa is None else etapa(self._consumir(entrada, metricas, espera)))
+            while not self._cancelado.is_set():
+                inicio = time.perf_counter()
+                espera_antes = espera[0]
+                try:
+                    item = next(itens)
+                except StopIteration:
+                    break
+                finally:
+                    metricas.ocupado_s += time.perf_counter() - inicio - (espera[0] - espera_antes)
+                metricas.itens += 1
+                if saida is not None and not self._colocar(saida, item):
+                    break
+        except BaseException as e:
+            self._erros.append(e)
+            self._cancelado.set()
+        finally:
+            if hasattr(itens, 'close'):
+                # Fecha o gerador da etapa para liberar arquivos e pools mesmo se o fluxo foi cancelado
+                itens.close()
+            metricas.fim = time.perf_counter()
+            if saida is not None:
+                self._colocar(saida, _FIM)
+
+    def executar(self, fonte: Iterable, etapas: list[tuple[str, Callable[[Iterable], Iterable]]],
+                 nome_fonte: str = 'fonte') -> dict[str, dict]:
+        """
+        Consome `fonte` atraves das etapas, em paralelo, ate o fim do fluxo.
+
+        :param fonte: Iteravel que alimenta a primeira etapa (iterado na sua propria thread).
+        :param etapas: Pares (nome, etapa); a saida da ultima etapa e descartada.
+        :param nome_fonte: Nome da etapa da fonte nas metricas.
+        :return: nome -> resumo das metricas da etapa (ver MetricasEstagio.resumo).
+        """
+        nomes = [nome_fonte] + [nome for nome, _ in etapas]
+        funcoes = [None] + [etapa for _, etapa in etapas]
+        filas = [queue.Queue(maxsize=self.tamanho_fila) for _ in etapas]
+        self.metricas = {nome: MetricasEstagio(nome) for nome in nomes}
+        self._cancelado.clear()
+        self._erros = []
+
+        threads = [
+            threading.Thread(
+                target=self._rodar, name=f"pipeline-{nome}", daemon=True,
+                args=(nome, funcao, fonte if i == 0 else None,
+                      filas[i - 1] if i > 0 else None, filas[i] if i < len(filas) else None))
+            for i, (nome, funcao) in enumerate(zip(nomes, funcoes))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self._erros:
+            raise self._erros[0]
+        return {nome: metricas.resumo() for nome, metricas in self.metricas.items()}
@@ -0,0 +1,125 @@
+import numpy as np
+import networkx as nx
+
+from grafo.grafo_wattech import criar_grafo, matriz_dependencias
+from leituras import CATEGORICOS, LoteLeituras
+from modelos_sinal import METADADOS
+from simulador_sensores import SimuladorSensor
+
+
+class SimuladorGrafo:
+    """
+    Gera todos os sensores de um ou mais sites juntos, correlacionados pelo grafo de influencia.
+
+    Cada sensor tem uma inovacao normal padrao (suavizada no tempo por media movel). As
+    inovacoes sao acopladas de uma vez para todas as leituras resolvendo z = c * W z + e,
+    com W a matriz de dependencias normalizada por linha, ou seja z = (I - c W)^-1 e, e
+    depois reescaladas para variancia 1. Cada z vira a grandeza do sensor (temperatura,
+    corrente, tensao...). O consumo do Shelly EM e a soma exata das cargas dos `ramais`
+    Sonoff do site, que seguem o z do Sonoff com correlacao `correlacao_ramais`.
+    """
+
+    def __init__(
+            self,
+            simulador: SimuladorSensor,
+            grafo: nx.DiGraph | None = None,
+            acoplamento: float = 0.6,
+            ramais: int = 4,
+            correlacao_ramais: float = 0.7,
+            janela: int = 5):
+        self.simulador = simulador
+        self.ramais = ramais
+        self.correlacao_ramais = correlacao_ramais
+        self.janela = max(janela, 1)
+
+        A, self.sensores = matriz_dependencias(grafo if grafo is not None else criar_grafo())
+        pesos = np.abs(A).sum(axis=1, keepdims=True)
+        W = np.divide(A, pesos, out=np.zeros_like(A), where=pesos > 0)
+        M = np.linalg.inv(np.eye(len(W)) - acoplamento * W)
+        # Inovacoes independentes de variancia 1 -> cada linha de M com norma 1 mantem z padronizado
+        self.mistura = M / np.linalg.norm(M, axis=1, keepdims=True)
+
+    @property
+    def series_por_site(self) -> int:
+        """
+        Series geradas por site: uma por sensor do grafo (o Sonoff vira os ramais) e uma por ramal.
+        """
+        return sum(sensor != 'sonoff_pow_r3' for sensor in self.sensores) + self.ramais
+
+    def _inovacoes(self, forma: tuple[int, ...], n: int) -> np.ndarray:
+        """
+        Ruido normal padrao suavizado por media movel de `janela` leituras no eixo do tempo,
+        reescalado para continuar com variancia 1.
+        """
+        e = self.simulador.rng.normal(0, 1, forma[:-2] + (n + self.janela - 1, forma[-1]))
+        if self.janela == 1:
+            return e
+        acumulado = np.cumsum(e, axis=-2)
+        suavizado = acumulado[..., self.janela - 1:, :].copy()
+        suavizado[..., 1:, :] -= acumulado[..., :-self.janela, :]
+        return suavizado / np.sqrt(self.janela)
+
+    def latentes(self, sites: int, n: int) -> np.ndarray:
+        """
+        :return: z acoplado pelo grafo, no formato (sites, n, sensores).
+        """
+        return self._inovacoes((sites, n, len(self.sensores)), n) @ self.mistura.T
+
+    def gerar(self, sites: list[str], inicio: int = 0, n: int | None = None) -> LoteLeituras:
+        """
+        Gera as leituras de todos os sensores dos sites numa unica passada vetorizada.
+
+        :param sites: Nomes dos sites (viram a location das leituras).
+        :param inicio: Indice da primeira leitura da janela.
+        :param n: Quantidade de leituras por sensor (padrao: n_dados do simulador).
+        :return: LoteLeituras com uma serie contigua por (site, sensor).
+        """
+        n = self.simulador.n_dados if n is None else n
+        z = self.latentes(len(sites), n)
+        coluna = {sensor: z[..., i] for i, sensor in enumerate(self.sensores)}
+        alerta = self.simulador._apply_alerta
+
+        rho = self.correlacao_ramais
+        z_ramais = (rho * coluna['sonoff_pow_r3'][..., None]
+                    + np.sqrt(1 - rho ** 2) * self.simulador.rng.normal(0, 1, (len(sites), n, self.ramais)))
+        cargas = np.round(alerta(np.maximum(100 + 30 * z_ramais, 0)), 5)
+
+        series = {
+            'shelly_em': cargas.sum(axis=-1) / 1000 * (self.simulador.intervalo_ms / 3_600_000),
+            'hms_m21': np.round(alerta(25 + 2 * coluna['hms_m21']), 2),
+            'ct_clamp': np.round(alerta(np.maximum(10 + 3 * coluna['ct_clamp'], 0)), 5),
+            'pzem_004t': np.round(alerta(np.clip(220 + 4 * coluna['pzem_004t'], 198, 242)), 5),
+            'fluke_1735': np.round(np.cos(np.radians(23.07 - 10 * coluna['fluke_1735'])), 5),
+        }
+
+        # Uma serie por (site, sensor) e por (site, ramal), no formato (sites, series, n)
+        nomes = [s for s in self.sensores if s in series]
+        valores = np.concatenate(
+            [np.stack([series[s] for s in nomes], axis=1), np.moveaxis(cargas, -1, 1)], axis=1)
+        geradores = nomes + ['sonoff_pow_r3'] * self.ramais
+        devices = [METADADOS[s][0] for s in nomes] + [f"Sonoff Ramal {r + 1}" for r in range(self.ramais)]
+
+        linhas = [
+            METADADOS[gerador] + (f"{site} / {device}", site)
+            for site in sites
+            for gerador, device in zip(geradores, devices)
+        ]
+        codigos, categorias = {}, {}
+        for i, nome in enumerate(('sensorModel', 'measureUnit', 'dataType', 'device', 'location')):
+            unicos, inversos = np.unique([linha[i] for linha in linhas], return_inverse=True)
+            codigos[nome] = np.repeat(inversos.reshape(-1).astype(np.int32), n)
+            categorias[nome] = unicos.tolist()
+
+        ts = np.tile(self.simulador._generate_timestamps(inicio, n), len(linhas))
+        return LoteLeituras(valores.reshape(-1), ts,
+                            {nome: codigos[nome] for nome in CATEGORICOS},
+                            {nome: categorias[nome] for nome in CATEGORICOS})
+
+    def gerar_blocos(self, sites: list[str], tamanho_bloco: int):
+        """
+        Gera os sites em janelas de no maximo `tamanho_bloco` leituras por sensor.
+
+        :return: Gerador de LoteLeituras, prontos para as etapas do pipeline do AlgasSimulador.
+        """
+        for inicio, n in self.simulador.janelas(tamanho_bloco):
+            yield self.gerar(sites, inicio, n)
@@ -1,274 +1,302 @@
 import numpy as np
 import datetime
-from random import randint
-from database import Database
+from typing import TYPE_CHECKING
+from leituras import CATEGORICOS, LoteLeituras
+from modelos_sinal import CASAS, METADADOS, MODELOS
+
+if TYPE_CHECKING:
+    from database import Database
+
+# Valores gerados por chamada ao modelo em _valores (devices * leituras)
+VALORES_POR_PASSADA = 1 << 16
 
 
 class SimuladorSensor:
     def __init__(
             self,
-            db: Database,
+            db: 'Database | None',
             n_dados: int,
             intervalo_ms: int,
-            alerta: str = "nenhum"):
+            alerta: str = "nenhum",
+            rng: np.random.Generator | None = None,
+            amplitude_diaria: float = 0.0):
         self.db = db
-        self.sensores = db.sensores()
+        self.sensores = db.sensores() if db is not None else None
 
-        self.n_dados = 24
+        self.n_dados = n_dados
         self.intervalo_ms = intervalo_ms
         self.alerta = alerta.lower()
+        self.rng = rng if rng is not None else np.random.default_rng()
+        # Acrescimo relativo do consumo do Shelly nos picos do dia (modelos_sinal.curva_diaria); 0 = sem perfil
+        self.amplitude_diaria = amplitude_diaria
+        # Origem da linha do tempo (ts da leitura de indice 0); None = inicio_padrao_ms()
+        self.inicio_ms: int | None = None
+
+    def __getstate__(self):
+        # O banco (engine/metadata) fica no processo principal; workers so precisam dos parametros e do RNG
+        estado = self.__dict__.copy()
+        estado['db'] = None
+        estado['sensores'] = None
+        return estado
+
+    def _generate_timestamps(self, inicio: int = 0, n: int | None = None) -> np.ndarray:
+        """
+        Gera os timestamps (epoch em ms, int64) a partir de inicio_ms (padrao: inicio_padrao_ms()),
+        espacados de intervalo_ms.
+
+        :param inicio: Indice da primeira leitura da janela.
+        :param n: Quantidade de leituras da janela (padrao: n_dados).
+        """
+        n = self.n_dados if n is None else n
+        inicio_ms = self.inicio_ms if self.inicio_ms is not None else self.inicio_padrao_ms()
+        return inicio_ms + np.arange(inicio, inicio + n, dtype=np.int64) * self.intervalo_ms
+
+    def inicio_padrao_ms(self) -> int:
+        """
+        Origem padrao da linha do tempo: as n_dados leituras terminam na meia-noite de hoje (a
+        ultima fica um intervalo antes dela), entao nenhuma leitura cai no futuro.
+        """
+        return self.meia_noite_de_hoje_ms() - self.n_dados * self.intervalo_ms
+
+    def periodo_ms(self) -> tuple[int, int]:
+        """
+        Retorna o ts (epoch ms) da primeira e da ultima das n_dados leituras.
+        """
+        primeiro = int(self._generate_timestamps(0, 1)[0])
+        return primeiro, primeiro + max(self.n_dados - 1, 0) * self.intervalo_ms
 
+    @staticmethod
+    def meia_noite_de_hoje_ms() -> int:
+        start_time = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        return int(start_time.timestamp() * 1000)
 
-    def _generate_timestamps(self):
+    @staticmethod
+    def meia_noite_de_ontem_ms() -> int:
         start_time = datetime.datetime.now().replace(
             hour=0, minute=0, second=0, microsecond=0) - datetime.timedelta(days=1)
-        return [
-            start_time +
-            datetime.timedelta(
-                hours=i) for i in range(
-                self.n_dados)]
+        return int(start_time.timestamp() * 1000)
 
     def _apply_alerta(self, valor_base):
         """
         Aplica o comportamento de alerta ao valor base.
 
-        :param valor_base: Valor base gerado.
+        :param valor_base: Valor base gerado (escalar ou array).
         :return: Valor ajustado com base no tipo de alerta.
         """
+        tamanho = np.shape(valor_base) or None
         if self.alerta == "alto":
-            return valor_base * np.random.uniform(5, 10)
+            return valor_base * self.rng.uniform(5, 10, tamanho)
         elif self.alerta == "baixo":
-            return valor_base * np.random.uniform(0.1, 0.5)
+            return valor_base * self.rng.uniform(0.1, 0.5, tamanho)
         return valor_base
 
-    def shelly_em(self, device: str = 'Disjuntor Geral',
-                  location: str = 'Quadro de Energia'):
-        timestamps = self._generate_timestamps()
-        payload = []
-
-        media_consumo = 100
-        desvio_padrao = 30
-
-        for i in range(self.n_dados):
-            consumo = np.random.normal(media_consumo, desvio_padrao)
-            consumo = max(consumo, 5)
-            consumo = self._apply_alerta(consumo)
-
-            record = {
-                'sensorModel': 'Shelly EM',
-                'measureUnit': 'kWh',
-                'device': device,
-                'location': location,
-                'dataType': 'Consumo de Energia',
-                'data': round(consumo, 2),
-                'ts': timestamps[i].strftime('%Y-%m-%d %H:%M:%S')
-            }
-            payload.append(record)
-
-        return payload
-
-    def sonoff_pow_r3(
+    def _devices_aleatorios(self, prefixo: str, n: int) -> np.ndarray:
+        """
+        Gera um identificador de device aleatorio por leitura (ex.: 'Sonoff_0042').
+        """
+        if n == 0:
+            return np.array([], dtype=str)
+        ids = self.rng.integers(1, 10000, n)
+        return np.char.add(prefixo, np.char.zfill(ids.astype(str), 4))
+
+    def _janela_suavizacao(self, n: int) -> int:
+        return max(min(int(self.n_dados / 10 / 2), n), 1)
+
+    def _valores(self, nome: str, devices: int, inicio: int, n: int,
+                 fases: np.ndarray | None = None) -> np.ndarray:
+        """
+        Gera as leituras de `devices` devices do gerador `nome` com o modelo vetorizado (ver
+        modelos_sinal), ja com o alerta e o arredondamento do gerador.
+
+        Os devices passam pelo modelo em fatias de ~VALORES_POR_PASSADA valores: os temporarios
+        de cada fatia cabem no cache e sao reaproveitados, em vez de alocar dezenas de arrays
+        do tamanho da frota inteira.
+
+        :param fases: Fase de cada device (devices,), so para o sonoff_pow_r3 (padrao: 0 para todos).
+        :return: Array (devices, n).
+        """
+        # Fluke e CT Clamp nao recebem alerta, so a suavizacao
+        suavizado = nome in ('fluke_1735', 'ct_clamp')
+        parametros = {'janela': self._janela_suavizacao(n)} if suavizado else {}
+        if nome == 'shelly_em' and self.amplitude_diaria:
+            parametros = {'ts_ms': self._generate_timestamps(inicio, n), 'amplitude_diaria': self.amplitude_diaria}
+        valores = np.empty((devices, n))
+        por_passada = max(VALORES_POR_PASSADA // max(n, 1), 1)
+        for inicio_fatia in range(0, devices, por_passada):
+            fim_fatia = min(inicio_fatia + por_passada, devices)
+            if fases is not None:
+                parametros = {'fases': fases[inicio_fatia:fim_fatia]}
+            fatia = MODELOS[nome](self.rng, (fim_fatia - inicio_fatia, n), inicio, **parametros)
+            valores[inicio_fatia:fim_fatia] = fatia if suavizado else self._apply_alerta(fatia)
+        return np.round(valores, CASAS[nome], out=valores)
+
+    def _lote(self, nome: str, valores: np.ndarray, device, location: str, inicio: int) -> LoteLeituras:
+        modelo, unidade, tipo = METADADOS[nome]
+        return LoteLeituras.constante(
+            valores, self._generate_timestamps(inicio, len(valores)),
+            sensorModel=modelo, measureUnit=unidade, device=device, location=location, dataType=tipo)
+
+    def shelly_em_lote(self, device: str = 'Disjuntor Geral',
+                       location: str = 'Quadro de Energia',
+                       inicio: int = 0, n: int | None = None) -> LoteLeituras:
+        n = self.n_dados if n is None else n
+        return self._lote('shelly_em', self._valores('shelly_em', 1, inicio, n)[0], device, location, inicio)
+
+    def sonoff_pow_r3_lote(
             self,
             device: str | None = None,
-            location: str = 'Tomada'):
-        timestamps = self._generate_timestamps()
-        payload = []
-
-        for i in range(self.n_dados):
-            power = np.abs(np.sin(i / 3) * 100 + np.random.normal(0, 10))
-            power = self._apply_alerta(power)
-
-            _device = device if device is not None else f'Sonoff_{
-                randint(
-                    1,
-                    9999):04d}'
-
-            record = {
-                'sensorModel': 'Sonoff Pow R3',
-                'measureUnit': 'W',
-                'device': _device,
-                'location': location,
-                'dataType': 'Consumo de Energia',
-                'data': round(power, 5),
-                'ts': timestamps[i].strftime('%Y-%m-%d %H:%M:%S')
-            }
-            payload.append(record)
-
-        return payload
+            location: str = 'Tomada',
+            inicio: int = 0, n: int | None = None) -> LoteLeituras:
+        n = self.n_dados if n is None else n
+        power = self._valores('sonoff_pow_r3', 1, inicio, n)[0]
+        _device = device if device is not None else self._devices_aleatorios('Sonoff_', n)
+        return self._lote('sonoff_pow_r3', power, _device, location, inicio)
+
+    def pzem_004t_lote(self, device: str | None = None,
+                       location: str = 'Instalação',
+                       inicio: int = 0, n: int | None = None) -> LoteLeituras:
+        n = self.n_dados if n is None else n
+        voltage = self._valores('pzem_004t', 1, inicio, n)[0]
+        _device = device if device is not None else self._devices_aleatorios('PZEM_', n)
+        return self._lote('pzem_004t', voltage, _device, location, inicio)
+
+    def hms_m21_lote(
+            self,
+            device: str = 'HMS_{sensor_id:04d}',
+            location: str = 'Quadro de Energia',
+            inicio: int = 0, n: int | None = None) -> LoteLeituras:
+        n = self.n_dados if n is None else n
+        return self._lote('hms_m21', self._valores('hms_m21', 1, inicio, n)[0], device, location, inicio)
+
+    def fluke_1735_lote(self, device: str = 'Fluke_1735',
+                        location: str = 'Sala de reuniões',
+                        inicio: int = 0, n: int | None = None) -> LoteLeituras:
+        n = self.n_dados if n is None else n
+        return self._lote('fluke_1735', self._valores('fluke_1735', 1, inicio, n)[0], device, location, inicio)
+
+    def ct_clamp_lote(self, device: str | None = None,
+                      location: str = 'Quadro de Energia',
+                      inicio: int = 0, n: int | None = None) -> LoteLeituras:
+        n = self.n_dados if n is None else n
+        correntes = self._valores('ct_clamp', 1, inicio, n)[0]
+        _device = device if device is not None else f'CT Clamp {self.rng.integers(1, 10000):04d}'
+        return self._lote('ct_clamp', correntes, _device, location, inicio)
+
+    def gerar_frota(self, nome: str, devices: list[str], location: str | list[str], inicio: int = 0,
+                    n: int | None = None, semente: int | None = None, indice: int = 0,
+                    bloco: int = 0) -> LoteLeituras:
+        """
+        Gera a mesma janela para muitos devices de um gerador numa unica passada: o modelo
+        produz um array (devices, n) e o lote sai com uma serie contigua por device. O custo
+        e o de algumas operacoes NumPy sobre devices * n valores, sem laco por device.
+
+        Os Sonoff da frota recebem fases sorteadas de (semente, indice), iguais em todos os
+        blocos, para que as tomadas nao oscilem em sincronia.
+
+        :param nome: Nome do gerador (ex.: 'ct_clamp').
+        :param devices: Nome de cada device.
+        :param location: Local de todos os devices ou um por device.
+        :param inicio: Indice da primeira leitura da janela.
+        :param n: Quantidade de leituras por device (padrao: n_dados).
+        :param semente: Semente da execucao; com ela o RNG e derivado de (semente, indice, bloco).
+        :param indice: Posicao da frota na execucao.
+        :param bloco: Posicao da janela.
+        :return: LoteLeituras com len(devices) * n leituras.
+        """
+        n = self.n_dados if n is None else n
+        fases = None
+        if nome == 'sonoff_pow_r3':
+            rng_fases = self.rng if semente is None else np.random.default_rng(
+                np.random.SeedSequence(semente, spawn_key=(indice,)))
+            fases = rng_fases.uniform(0, 2 * np.pi, len(devices))
+        if semente is not None:
+            self.rng = np.random.default_rng(np.random.SeedSequence(semente, spawn_key=(indice, bloco)))
+        valores = self._valores(nome, len(devices), inicio, n, fases)
+
+        modelo, unidade, tipo = METADADOS[nome]
+        locations = [location] * len(devices) if isinstance(location, str) else location
+        codigos, categorias = {}, {}
+        for coluna, por_device in (('device', devices), ('location', locations)):
+            unicos, inversos = np.unique(np.asarray(por_device), return_inverse=True)
+            codigos[coluna] = np.repeat(inversos.reshape(-1).astype(np.int32), n)
+            categorias[coluna] = unicos.tolist()
+        for coluna, valor in (('sensorModel', modelo), ('measureUnit', unidade), ('dataType', tipo)):
+            codigos[coluna] = np.zeros(len(devices) * n, dtype=np.int32)
+            categorias[coluna] = [valor]
+
+        ts = np.tile(self._generate_timestamps(inicio, n), len(devices))
+        return LoteLeituras(valores.reshape(-1), ts,
+                            {coluna: codigos[coluna] for coluna in CATEGORICOS},
+                            {coluna: categorias[coluna] for coluna in CATEGORICOS})
+
+    def gerar_bloco(self, nome: str, device: str | None, location: str, inicio: int, n: int,
+                    semente: int | None = None, indice_cenario: int = 0, bloco: int = 0) -> LoteLeituras:
+        """
+        Gera uma janela de leituras de um cenario.
+
+        Com `semente`, o RNG da janela e derivado de (semente, indice_cenario, bloco), entao o
+        resultado nao depende de qual processo ou em que ordem a janela foi gerada.
+
+        :param nome: Nome do gerador (ex.: 'shelly_em').
+        :param device: Device do cenario.
+        :param location: Local do cenario.
+        :param inicio: Indice da primeira leitura da janela.
+        :param n: Quantidade de leituras da janela.
+        :param semente: Semente da execucao.
+        :param indice_cenario: Identificador do cenario na execucao (posicao ou cenarios.chave_rng do device).
+        :param bloco: Posicao da janela dentro do cenario.
+        :return: LoteLeituras.
+        """
+        if semente is not None:
+            self.rng = np.random.default_rng(
+                np.random.SeedSequence(semente, spawn_key=(indice_cenario, bloco)))
+        return getattr(self, f"{nome}_lote")(device, location, inicio=inicio, n=n)
+
+    def janelas(self, tamanho_bloco: int) -> list[tuple[int, int]]:
+        """
+        Divide as n_dados leituras em janelas (inicio, n) de no maximo `tamanho_bloco`.
+        """
+        return [(inicio, min(tamanho_bloco, self.n_dados - inicio))
+                for inicio in range(0, self.n_dados, tamanho_bloco)]
+
+    def gerar_blocos(self, nome: str, device: str | None, location: str, tamanho_bloco: int,
+                     semente: int | None = None, indice_cenario: int = 0):
+        """
+        Gera o cenario de um sensor em janelas de no maximo `tamanho_bloco` leituras.
+
+        :param nome: Nome do gerador (ex.: 'shelly_em').
+        :param device: Device do cenario.
+        :param location: Local do cenario.
+        :param tamanho_bloco: Quantidade maxima de leituras por lote.
+        :param semente: Semente da execucao (ver gerar_bloco).
+        :param indice_cenario: Identificador do cenario na execucao (posicao ou cenarios.chave_rng do device).
+        :return: Gerador de LoteLeituras.
+        """
+        for bloco, (inicio, n) in enumerate(self.janelas(tamanho_bloco)):
+            yield self.gerar_bloco(nome, device, location, inicio, n, semente, indice_cenario, bloco)
+
+    # API legada: lista de dicts com ts formatado, montada a partir do lote colunar.
+
+    def shelly_em(self, device: str = 'Disjuntor Geral',
+                  location: str = 'Quadro de Energia'):
+        return self.shelly_em_lote(device, location).to_records()
+
+    def sonoff_pow_r3(self, device: str | None = None,
+                      location: str = 'Tomada'):
+        return self.sonoff_pow_r3_lote(device, location).to_records()
 
     def pzem_004t(self, device: str | None = None,
                   location: str = 'Instalação'):
-        timestamps = self._generate_timestamps()
-        payload = []
-
-        i = 0
-        while i < self.n_dados:
-
-            if np.random.rand() < 0.95:
-                voltage = 220 + np.random.normal(0, 1.2)
-                voltage = np.clip(voltage, 218, 222)
-                _device = device if device is not None else f'PZEM_{
-                    randint(
-                        1,
-                        9999):04d}'
-                record = {
-                    'sensorModel': 'PZEM-004T',
-                    'measureUnit': 'V',
-                    'device': _device,
-                    'location': location,
-                    'dataType': 'Tensão',
-                    'data': round(self._apply_alerta(voltage), 5),
-                    'ts': timestamps[i].strftime('%Y-%m-%d %H:%M:%S')
-                }
-                payload.append(record)
-                i += 1
-            else:
-                rampa_tam = np.random.randint(5, 15)
-                if np.random.rand() < 0.5:
-                    start = 220
-                    end = 198 + np.random.uniform(0, 2)
-                else:
-                    start = 220
-                    end = 242 - np.random.uniform(0, 2)
-                ramp = np.linspace(
-                    start,
-                    end,
-                    rampa_tam // 2
-                ).tolist() + np.linspace(
-                    end,
-                    start,
-                    rampa_tam - rampa_tam // 2
-                ).tolist()
-                for v in ramp:
-                    if i >= self.n_dados:
-                        break
-                    v_osc = v + np.random.normal(0, 0.7)
-                    v_osc = np.clip(v_osc, min(198, v), max(242, v))
-                    _device = device if device is not None else f'PZEM_{
-                        randint(
-                            1,
-                            9999):04d}'
-                    record = {
-                        'sensorModel': 'PZEM-004T',
-                        'measureUnit': 'V',
-                        'device': _device,
-                        'location': location,
-                        'dataType': 'Tensão',
-                        'data': round(self._apply_alerta(v_osc), 5),
-                        'ts': timestamps[i].strftime('%Y-%m-%d %H:%M:%S')
-                    }
-                    payload.append(record)
-                    i += 1
-
-        return payload
-
-    def hms_m21(
-            self,
-            device: str = 'HMS_{sensor_id:04d}',
-            location: str = 'Quadro de Energia'):
-        payload = []
-
-        timestamps = self._generate_timestamps()
-
-        for i in range(self.n_dados):
-            temperature = 25 + np.random.normal(0, 2)
-            temperature = self._apply_alerta(temperature)
-            record = {
-                'sensorModel': 'hms_m21',
-                'measureUnit': 'C',
-                'device': device,
-                'location': location,
-                'dataType': 'Temperatura',
-                'data': round(temperature, 2),
-                'ts': timestamps[i].strftime('%Y-%m-%d %H:%M:%S')
-            }
-            payload.append(record)
-
-        return payload
+        return self.pzem_004t_lote(device, location).to_records()
+
+    def hms_m21(self, device: str = 'HMS_{sensor_id:04d}',
+                location: str = 'Quadro de Energia'):
+        return self.hms_m21_lote(device, location).to_records()
 
     def fluke_1735(self, device: str = 'Fluke_1735',
                    location: str = 'Sala de reuniões'):
-        def calcular_fator_potencia(tensao, corrente, angulo_fase):
-            angulo_fase_rad = np.radians(angulo_fase)
-            potencia_ativa = tensao * corrente * np.cos(angulo_fase_rad)
-            potencia_aparente = tensao * corrente
-            return potencia_ativa / potencia_aparente
-        timestamps = self._generate_timestamps()
-        payload = []
-        ruido_tensao = np.random.normal(0, 1, self.n_dados)
-        ruido_corrente = np.random.normal(0, 0.5, self.n_dados)
-
-        window = int(self.n_dados / 10 / 2)
-        ruido_tensao = np.convolve(
-            ruido_tensao,
-            np.ones(window) / window,
-            mode='same')
-        ruido_corrente = np.convolve(
-            ruido_corrente,
-            np.ones(window) / window,
-            mode='same')
-
-        tensoes = 220 + ruido_tensao * 5
-        correntes = 10 + ruido_corrente * 2
-
-        angulo_base = 23.07
-        ruido_angulo = np.random.normal(0, 20, self.n_dados)
-        ruido_angulo = np.convolve(
-            ruido_angulo,
-            np.ones(window) / window,
-            mode='same')
-        angulos_fase = angulo_base + ruido_angulo
-
-        fatores_potencia = [
-            round(
-                float(
-                    calcular_fator_potencia(
-                        V, I_, ang)), 5) for V, I_, ang in zip(
-                tensoes, correntes, angulos_fase)]
-        for i in range(self.n_dados):
-            record = {
-                'sensorModel': 'Fluke 1735',
-                'measureUnit': '%',
-                'device': device,
-                'location': location,
-                'dataType': 'Fator de Potência',
-                'data': fatores_potencia[i],
-                'ts': timestamps[i].strftime('%Y-%m-%d %H:%M:%S')
-            }
-            payload.append(record)
-        return payload
+        return self.fluke_1735_lote(device, location).to_records()
 
     def ct_clamp(self, device: str | None = None,
                  location: str = 'Quadro de Energia'):
-        np.random.seed(2025)
-
-        ruido_corrente = np.random.normal(0, 30, self.n_dados)
-        window = int(self.n_dados / 10 / 2)
-        ruido_corrente = np.convolve(
-            ruido_corrente,
-            np.ones(window) / window,
-            mode='same')
-
-        correntes = 5 + ruido_corrente
-        _device = device if device is not None else f'CT Clamp {
-            randint(
-                1,
-                9999):04d}'
-
-        payload = []
-        timestamps = self._generate_timestamps()
-
-        for i in range(len(correntes)):
-            ts = timestamps[i]
-            record = {
-                'sensorModel': 'ct_clamp',
-                'measureUnit': 'A',
-                'device': _device,
-                'location': location,
-                'dataType': 'Corrente Elétrica',
-                'data': round(float(correntes[i]), 5),
-                'ts': ts.strftime('%Y-%m-%d %H:%M:%S')
-            }
-            payload.append(record)
-
-        return payload
+        return self.ct_clamp_lote(device, location).to_records()
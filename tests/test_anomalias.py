@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from anomalias import DetectorAnomalias
+from leituras import LoteLeituras
+
+
+def _leituras(n=6_000, semente=11):
+    rng = np.random.default_rng(semente)
+    devices = rng.choice(['d0', 'd1', 'd2', 'd3'], n)
+    tipos = np.where(np.isin(devices, ['d0', 'd1']), 'Tensão', 'Consumo de Energia')
+    data = np.where(tipos == 'Tensão', 220 + rng.normal(0, 1, n), 100 + rng.normal(0, 10, n))
+    # Picos isolados e rampas de tensao para gerar alertas de todos os tipos
+    data[rng.choice(n, 40, replace=False)] *= rng.choice([0.1, 8.0], 40)
+    for inicio in rng.choice(np.flatnonzero(tipos == 'Tensão')[:-60], 5, replace=False):
+        data[inicio:inicio + 30][tipos[inicio:inicio + 30] == 'Tensão'] = 205.0
+    return LoteLeituras.constante(
+        np.round(data, 5), 1_700_000_000_000 + np.arange(n, dtype=np.int64) * 1_000,
+        sensorModel='PZEM-004T', measureUnit='V', device=devices, location='Lab', dataType=tipos)
+
+
+def _detectar(lote, cortes):
+    detector = DetectorAnomalias(min_amostras=20)
+    alertas = []
+    for inicio, fim in zip([0] + cortes, cortes + [len(lote)]):
+        alertas += detector.processar(lote.fatiar(inicio, fim))
+    return detector, sorted(alertas, key=lambda a: (a['ts'], a['device'], a['tipo']))
+
+
+@pytest.mark.parametrize("cortes", [[1], [500, 501, 2_000], list(range(97, 6_000, 97)), [3_000]])
+def test_alertas_nao_dependem_da_divisao_em_lotes(cortes):
+    lote = _leituras()
+    inteiro, esperado = _detectar(lote, [])
+    dividido, obtido = _detectar(lote, cortes)
+
+    assert {a['tipo'] for a in esperado} >= {'alto', 'baixo', 'subtensao', 'afundamento'}
+    assert [{**a, 'referencia': None} for a in obtido] == [{**a, 'referencia': None} for a in esperado]
+    assert [a['referencia'] for a in obtido] == pytest.approx([a['referencia'] for a in esperado])
+
+    assert dividido.chaves.keys() == inteiro.chaves.keys()
+    for chave, indice in inteiro.chaves.items():
+        outro = dividido.chaves[chave]
+        assert dividido.n[outro] == inteiro.n[indice]
+        assert dividido.media[outro] == pytest.approx(inteiro.media[indice])
+        assert dividido.m2[outro] == pytest.approx(inteiro.m2[indice])
+        assert dividido.evento[outro] == inteiro.evento[indice]
@@ -0,0 +1,45 @@
+from collections import deque
+
+import pytest
+
+from algas_sensores import AlgasSimulador
+from cenarios import CENARIOS
+
+
+def _gerar_csv(pasta, monkeypatch, workers: int) -> bytes:
+    """
+    Gera todos os cenarios com a mesma semente e devolve os bytes do CSV consolidado.
+    """
+    pasta.mkdir()
+    monkeypatch.chdir(pasta)
+    simulador = AlgasSimulador(CENARIOS)
+    simulador.simulador.n_dados = 250
+    cenarios = [
+        {"sensor_func": getattr(simulador.simulador, cenario["sensor"]),
+         "device": cenario["device"],
+         "location": cenario["location"]}
+        for cenario in simulador.cenarios
+    ]
+    blocos = simulador.gerar_cenarios(cenarios, tamanho_bloco=100, semente=2025, workers=workers)
+    deque(simulador.escrever_csv(blocos, str(pasta / "dados.csv")), maxlen=0)
+    return (pasta / "dados.csv").read_bytes()
+
+
+@pytest.mark.parametrize("workers", [2, 3])
+def test_saida_identica_com_qualquer_quantidade_de_workers(tmp_path, monkeypatch, workers):
+    sequencial = _gerar_csv(tmp_path / "sequencial", monkeypatch, workers=1)
+    paralelo = _gerar_csv(tmp_path / "paralelo", monkeypatch, workers=workers)
+
+    assert sequencial.count(b"\n") == 1 + len(CENARIOS) * 250
+    assert paralelo == sequencial
+
+
+def test_sementes_diferentes_geram_saidas_diferentes():
+    simulador = AlgasSimulador(CENARIOS[:1])
+    simulador.simulador.n_dados = 50
+    cenario = simulador.cenarios[0]
+    lotes = [
+        simulador.simulador.gerar_bloco(cenario["sensor"], cenario["device"], cenario["location"], 0, 50, semente, 0, 0)
+        for semente in (1, 2)
+    ]
+    assert (lotes[0].data != lotes[1].data).any()
@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+import envio_s3
+from envio_s3 import ClienteS3Local, EnviadorS3
+
+
+class ClienteInstavel(ClienteS3Local):
+    """
+    Falha as primeiras `falhas` chamadas de upload_file e depois grava como o ClienteS3Local.
+    """
+
+    def __init__(self, raiz: str, falhas: int):
+        super().__init__(raiz)
+        self.falhas = falhas
+        self.chamadas = 0
+
+    def upload_file(self, *args, **kwargs):
+        self.chamadas += 1
+        if self.chamadas <= self.falhas:
+            raise OSError("conexao recusada")
+        super().upload_file(*args, **kwargs)
+
+
+@pytest.fixture
+def arquivos(tmp_path):
+    caminhos = []
+    for nome in ('a.csv', 'b.csv', 'c.csv'):
+        caminho = tmp_path / "local" / nome
+        caminho.parent.mkdir(exist_ok=True)
+        caminho.write_text(f"conteudo de {nome}\n")
+        caminhos.append(caminho)
+    return caminhos
+
+
+def _enviador(tmp_path, bucket='dados', cliente=None, **kwargs) -> EnviadorS3:
+    cliente = cliente if cliente is not None else ClienteS3Local(str(tmp_path / "s3"))
+    return EnviadorS3(bucket, cliente=cliente, manifesto=str(tmp_path / "manifesto.json"), **kwargs)
+
+
+def test_arquivos_sem_mudanca_sao_pulados_em_outra_instancia(tmp_path, arquivos):
+    pares = [(str(caminho), f"dia/{caminho.name}") for caminho in arquivos]
+    assert _enviador(tmp_path).enviar_arquivos(pares)['enviados'] == 3
+
+    arquivos[0].write_text("mudou\n")
+    resumo = _enviador(tmp_path).enviar_arquivos(pares)
+    assert (resumo['enviados'], resumo['pulados'], resumo['falhas']) == (1, 2, 0)
+    assert (tmp_path / "s3" / "dados" / "dia" / "a.csv").read_text() == "mudou\n"
+
+
+def test_instancias_concorrentes_no_mesmo_bucket_somam_as_entradas(tmp_path, arquivos):
+    # As duas carregam o manifesto antes de qualquer envio, como dois processos em paralelo
+    primeira, segunda = _enviador(tmp_path), _enviador(tmp_path)
+    primeira.enviar_arquivos([(str(arquivos[0]), "csv/a.csv")])
+    segunda.enviar_arquivos([(str(arquivos[1]), "parquet/b.csv")])
+
+    with open(tmp_path / "manifesto-dados.json") as arquivo:
+        assert set(json.load(arquivo)) == {"csv/a.csv", "parquet/b.csv"}
+    assert _enviador(tmp_path).enviar_arquivos([(str(arquivos[0]), "csv/a.csv")])['pulados'] == 1
+
+
+def test_manifesto_separado_por_bucket(tmp_path, arquivos):
+    _enviador(tmp_path, 'dados').enviar_arquivos([(str(arquivos[0]), "a.csv")])
+    # Mesma key em outro bucket: nao e pulada pelo manifesto do primeiro
+    assert _enviador(tmp_path, 'backup').enviar_arquivos([(str(arquivos[0]), "a.csv")])['enviados'] == 1
+    assert (tmp_path / "manifesto-dados.json").exists() and (tmp_path / "manifesto-backup.json").exists()
+
+
+def test_falha_temporaria_e_repetida_com_backoff_exponencial(tmp_path, arquivos, monkeypatch):
+    esperas = []
+    # O ClienteS3Local tambem chama time.sleep (com a latencia, 0 aqui); so as esperas do backoff contam
+    monkeypatch.setattr(envio_s3.time, 'sleep', lambda segundos: segundos and esperas.append(segundos))
+    cliente = ClienteInstavel(str(tmp_path / "s3"), falhas=3)
+
+    resumo = _enviador(tmp_path, cliente=cliente, tentativas=4, backoff_s=0.5).enviar_arquivos(
+        [(str(arquivos[0]), "a.csv")])
+
+    assert (resumo['enviados'], resumo['falhas'], cliente.chamadas) == (1, 0, 4)
+    assert len(esperas) == 3
+    for tentativa, espera in enumerate(esperas):
+        assert 0.5 * 2 ** tentativa * 0.5 <= espera <= 0.5 * 2 ** tentativa * 1.5
+
+
+def test_falha_persistente_nao_entra_no_manifesto(tmp_path, arquivos, monkeypatch):
+    monkeypatch.setattr(envio_s3.time, 'sleep', lambda segundos: None)
+    cliente = ClienteInstavel(str(tmp_path / "s3"), falhas=10)
+
+    resumo = _enviador(tmp_path, cliente=cliente, tentativas=3).enviar_arquivos([(str(arquivos[0]), "a.csv")])
+
+    assert (resumo['enviados'], resumo['falhas'], cliente.chamadas) == (0, 1, 3)
+    assert _enviador(tmp_path).enviar_arquivos([(str(arquivos[0]), "a.csv")])['enviados'] == 1
@@ -0,0 +1,71 @@
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pytest
+
+from database import Database
+from exportacao import exportar, exportar_csv
+from ingestao import ingerir
+from leituras import CATEGORICOS, LoteLeituras
+from simulador_sensores import SimuladorSensor
+
+INICIO = 1_700_000_000_000
+HORA_MS = 3_600_000
+
+
+def _lotes() -> list[LoteLeituras]:
+    simulador = SimuladorSensor(None, n_dados=60, intervalo_ms=HORA_MS)
+    simulador.inicio_ms = INICIO
+    return [simulador.gerar_frota(nome, [f'{nome} {i}' for i in range(3)], 'Lab', semente=2, indice=indice)
+            for indice, nome in enumerate(('pzem_004t', 'fluke_1735', 'sonoff_pow_r3'))]
+
+
+def _ordenadas(linhas) -> list[tuple]:
+    return sorted(linhas, key=lambda linha: (linha[2], linha[4], linha[6]))
+
+
+def _tuplas(lotes) -> list[tuple]:
+    linhas = []
+    for lote in lotes:
+        colunas = [lote.coluna(nome).tolist() for nome in CATEGORICOS] + [lote.data.tolist(), lote.ts.tolist()]
+        linhas += zip(*colunas)
+    return _ordenadas(linhas)
+
+
+@pytest.fixture
+def carregado(tmp_path):
+    lotes = _lotes()
+    exportar_csv(lotes, str(tmp_path / "dados.csv"))
+    db = Database(str(tmp_path / "origem"))
+    db.create_table()
+    ingerir(db, [str(tmp_path / "dados.csv")], tamanho_bloco=50)
+    return db, lotes
+
+
+def test_csv_exportado_volta_igual_pelo_ingest(tmp_path, carregado):
+    db, lotes = carregado
+    resumo = exportar(db, str(tmp_path / "export.csv"), tamanho_lote=37)
+    assert resumo['linhas'] == 3 * 3 * 60
+
+    copia = Database(str(tmp_path / "copia"))
+    copia.create_table()
+    ingerir(copia, [str(tmp_path / "export.csv")])
+    assert _tuplas(copia.ler_lotes()) == _tuplas(db.ler_lotes()) == _tuplas(lotes)
+
+
+def test_exportacao_filtrada_e_parquet(tmp_path, carregado):
+    db, lotes = carregado
+    inicio, fim = INICIO + 10 * HORA_MS, INICIO + 20 * HORA_MS
+    exportar(db, str(tmp_path / "filtrado.csv"), devices=['pzem_004t 1', 'sonoff_pow_r3 0'],
+             inicio_ms=inicio, fim_ms=fim)
+    copia = Database(str(tmp_path / "filtrado"))
+    copia.create_table()
+    ingerir(copia, [str(tmp_path / "filtrado.csv")])
+    esperado = [linha for linha in _tuplas(lotes)
+                if linha[2] in ('pzem_004t 1', 'sonoff_pow_r3 0') and inicio <= linha[6] < fim]
+    assert len(esperado) == 2 * 10 and _tuplas(copia.ler_lotes()) == esperado
+
+    resumo = exportar(db, str(tmp_path / "parquet"), formato='parquet', tamanho_lote=100)
+    tabela = ds.dataset(str(tmp_path / "parquet"), format='parquet', partitioning='hive').to_table()
+    assert resumo['linhas'] == tabela.num_rows == 3 * 3 * 60
+    linhas = zip(tabela['device'].to_pylist(), tabela['data'].to_pylist(), tabela['ts'].cast(pa.int64()).to_pylist())
+    assert sorted(linhas) == sorted((linha[2], linha[5], linha[6]) for linha in _tuplas(lotes))
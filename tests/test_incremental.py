@@ -0,0 +1,95 @@
+import os
+
+import pytest
+
+from algas_sensores import AlgasSimulador
+from cenarios import CENARIOS
+from database import Database
+from envio_s3 import ClienteS3Local, EnviadorS3, hash_arquivo
+from simulador_sensores import SimuladorSensor
+
+BUCKET = 'teste'
+HORA_MS = 3_600_000
+
+
+class ClienteFalho:
+    def upload_file(self, *args, **kwargs):
+        raise OSError("sem rede")
+
+
+def _simulador(tmp_path, cliente, nome_db='algas') -> AlgasSimulador:
+    simulador = AlgasSimulador(CENARIOS[:4])
+    simulador.db = Database(str(tmp_path / nome_db))
+    simulador.db.create_table()
+    simulador._enviadores[BUCKET] = EnviadorS3(
+        BUCKET, cliente=cliente, manifesto=str(tmp_path / "manifesto.json"), tentativas=1, backoff_s=0)
+    return simulador
+
+
+def _linhas(db: Database) -> list[tuple]:
+    conn = db.engine.raw_connection()
+    try:
+        return conn.execute("SELECT deviceId, dataType, ts, data FROM sensores ORDER BY deviceId, dataType, ts").fetchall()
+    finally:
+        conn.close()
+
+
+def _arquivos(raiz) -> dict[str, str]:
+    return {os.path.relpath(os.path.join(pasta, nome), raiz): hash_arquivo(os.path.join(pasta, nome))
+            for pasta, _, nomes in os.walk(raiz) for nome in nomes}
+
+
+@pytest.fixture(autouse=True)
+def ambiente(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("AWS_S3_BUCKET_NAME", BUCKET)
+
+
+@pytest.fixture
+def ate_ms():
+    return SimuladorSensor.meia_noite_de_ontem_ms() + 6 * HORA_MS
+
+
+def test_repeticao_apos_falha_no_envio_regera_as_mesmas_keys_sem_duplicar_o_banco(tmp_path, ate_ms):
+    raiz, s3 = tmp_path / "parquet", tmp_path / "s3"
+
+    falhou = _simulador(tmp_path, ClienteFalho())
+    assert falhou.run_incremental(ate_ms, semente=5, raiz=str(raiz)) == {}
+    gravados = _arquivos(raiz)
+    linhas = _linhas(falhou.db)
+    assert gravados and linhas
+    # Sem envio, o checkpoint de geracao nao avanca
+    assert all(gerado is None for gerado, _ in falhou.db.ler_checkpoints().values())
+
+    repetido = _simulador(tmp_path, ClienteS3Local(str(s3)))
+    ultimos = repetido.run_incremental(ate_ms, semente=5, raiz=str(raiz))
+    assert len(ultimos) == 4 and set(ultimos.values()) == {ate_ms - 30 * 60 * 1000}
+    # Mesmos arquivos, com o mesmo conteudo, e cada um enviado com a key do seu caminho
+    assert _arquivos(raiz) == gravados
+    assert _arquivos(s3 / BUCKET / "parquet") == gravados
+    # As leituras ja persistidas na primeira tentativa nao sao gravadas de novo
+    assert _linhas(repetido.db) == linhas
+
+    assert _simulador(tmp_path, ClienteS3Local(str(s3))).run_incremental(ate_ms, semente=5, raiz=str(raiz)) == {}
+    assert _linhas(repetido.db) == linhas
+
+
+def test_retomada_continua_do_checkpoint_sem_lacunas_nem_repeticoes(tmp_path, ate_ms):
+    s3 = str(tmp_path / "s3")
+    em_partes = _simulador(tmp_path, ClienteS3Local(s3), 'partes')
+    primeira = em_partes.run_incremental(ate_ms - 4 * HORA_MS, semente=5, raiz=str(tmp_path / "p1"))
+    antes = _linhas(em_partes.db)
+    segunda = em_partes.run_incremental(ate_ms, semente=5, raiz=str(tmp_path / "p2"))
+
+    unica = _simulador(tmp_path, ClienteS3Local(s3), 'unica')
+    unica.run_incremental(ate_ms, semente=5, raiz=str(tmp_path / "p3"))
+
+    assert set(primeira.values()) == {ate_ms - 4 * HORA_MS - 30 * 60 * 1000}
+    assert segunda.keys() == primeira.keys() and set(segunda.values()) == {ate_ms - 30 * 60 * 1000}
+    # A segunda execucao so acrescenta leituras depois do checkpoint: as da primeira ficam como estavam
+    depois = _linhas(em_partes.db)
+    assert set(antes) <= set(depois)
+    assert all(ts > ate_ms - 4 * HORA_MS - 30 * 60 * 1000 for _, _, ts, _ in set(depois) - set(antes))
+    # Juntas, as duas cobrem exatamente as leituras de uma execucao unica
+    assert len(depois) == len(_linhas(unica.db)) == 4 * 12
+    assert [linha[:3] for linha in depois] == [linha[:3] for linha in _linhas(unica.db)]
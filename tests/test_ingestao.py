@@ -0,0 +1,93 @@
+import csv
+
+import pytest
+
+from database import Database
+from exportacao import exportar_csv
+from ingestao import estimar_linhas, ingerir
+from leituras import CAMPOS, CATEGORICOS, LoteLeituras
+from simulador_sensores import SimuladorSensor
+
+INICIO = 1_700_000_000_000
+HORA_MS = 3_600_000
+
+
+def _lote(nome: str, devices: list[str], inicio_ms: int = INICIO, n: int = 40) -> LoteLeituras:
+    simulador = SimuladorSensor(None, n_dados=n, intervalo_ms=HORA_MS)
+    simulador.inicio_ms = inicio_ms
+    return simulador.gerar_frota(nome, devices, 'Lab', semente=1)
+
+
+def _linhas(db: Database) -> list[tuple]:
+    conn = db.engine.raw_connection()
+    try:
+        return conn.execute(
+            "SELECT sensorModel, measureUnit, deviceId, location, dataType, data, ts FROM sensores "
+            "ORDER BY deviceId, dataType, ts").fetchall()
+    finally:
+        conn.close()
+
+
+def _esperado(*lotes: LoteLeituras) -> list[tuple]:
+    linhas = []
+    for lote in lotes:
+        colunas = [lote.coluna(nome).tolist() for nome in CATEGORICOS] + [lote.data.tolist(), lote.ts.tolist()]
+        linhas += zip(*colunas)
+    return sorted(linhas, key=lambda linha: (linha[2], linha[4], linha[6]))
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / "sensores"))
+    db.create_table()
+    return db
+
+
+def test_ingest_le_os_tres_formatos_de_csv(tmp_path, db):
+    consolidado = _lote('pzem_004t', ['PZEM 1', 'PZEM 2'])
+    cenario = _lote('ct_clamp', ['CT 1'])
+    epoch = _lote('shelly_em', ['Shelly 1'])
+
+    exportar_csv([consolidado], str(tmp_path / "dados.csv"))
+    with open(tmp_path / "cenario_ct_clamp_sensores.csv", 'w', newline='') as arquivo:
+        writer = csv.writer(arquivo)
+        writer.writerow(['sensor_model', 'measure_unit', 'device', 'location', 'data_type', 'data', 'created_at'])
+        writer.writerows(cenario.linhas())
+    # Dump com ts em epoch segundos: a unidade e detectada uma vez para o arquivo
+    with open(tmp_path / "epoch.csv", 'w', newline='') as arquivo:
+        writer = csv.writer(arquivo)
+        writer.writerow(CAMPOS)
+        writer.writerows(linha[:-1] + (ts // 1000,) for linha, ts in zip(epoch.linhas(), epoch.ts.tolist()))
+
+    resumo = ingerir(db, [str(tmp_path / nome) for nome in ("dados.csv", "cenario_ct_clamp_sensores.csv", "epoch.csv")],
+                     tamanho_bloco=7)
+
+    assert resumo['arquivos'] == 3 and resumo['linhas'] == 4 * 40
+    assert _linhas(db) == _esperado(consolidado, cenario, epoch)
+
+
+def test_ingest_so_adia_os_indices_quando_a_carga_e_grande(tmp_path, db, monkeypatch):
+    exportar_csv([_lote('hms_m21', [f'HMS {i}' for i in range(10)])], str(tmp_path / "grande.csv"))
+    exportar_csv([_lote('hms_m21', ['HMS novo'], INICIO + 100 * HORA_MS, n=5)], str(tmp_path / "pequeno.csv"))
+    assert estimar_linhas(str(tmp_path / "grande.csv")) == pytest.approx(400, rel=0.1)
+
+    adiadas = []
+    carga_em_massa = Database.carga_em_massa
+    monkeypatch.setattr(Database, 'carga_em_massa', lambda self: adiadas.append(1) or carga_em_massa(self))
+
+    ingerir(db, [str(tmp_path / "grande.csv")])
+    assert len(adiadas) == 1
+    # Arquivo pequeno numa tabela grande: mantem os indices
+    ingerir(db, [str(tmp_path / "pequeno.csv")])
+    assert len(adiadas) == 1
+    ingerir(db, [str(tmp_path / "pequeno.csv")], adiar_indices=True)
+    assert len(adiadas) == 2
+    assert len(_linhas(db)) == 400 + 2 * 5
+    # Os indices removidos na carga em massa foram recriados
+    conn = db.engine.raw_connection()
+    try:
+        indices = {nome for nome, in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'sensores' AND sql IS NOT NULL")}
+    finally:
+        conn.close()
+    assert indices == {indice.name for indice in db.sensores().indexes}
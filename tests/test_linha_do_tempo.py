@@ -0,0 +1,44 @@
+import csv
+import datetime
+import time
+
+import pytest
+
+from algas_sensores import AlgasSimulador
+from database import Database
+from leituras import parsear_ts
+from simulador_sensores import SimuladorSensor
+
+MEIA_HORA_MS = 30 * 60 * 1000
+
+
+@pytest.mark.parametrize('n_dados', [1, 48, 500, 2_000])
+def test_serie_padrao_termina_antes_da_meia_noite_de_hoje(n_dados):
+    simulador = SimuladorSensor(None, n_dados=n_dados, intervalo_ms=MEIA_HORA_MS)
+    ts = simulador._generate_timestamps()
+
+    assert len(ts) == n_dados
+    assert ts.max() < simulador.meia_noite_de_hoje_ms() <= time.time() * 1000
+    assert ts.max() == simulador.meia_noite_de_hoje_ms() - MEIA_HORA_MS
+    assert simulador.periodo_ms() == (int(ts.min()), int(ts.max()))
+
+
+def test_run_nao_grava_leituras_depois_da_data_da_execucao(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("S3_LOCAL_DIR", str(tmp_path / "s3"))
+    simulador = AlgasSimulador()
+    simulador.db = Database(str(tmp_path / "algas"))
+    simulador.db.create_table()
+    simulador.simulador.n_dados = 300
+
+    simulador.run(semente=3, formato='csv')
+
+    with open(tmp_path / "output" / "csv" / "dados.csv", newline='') as arquivo:
+        ts = parsear_ts([linha[-1] for linha in list(csv.reader(arquivo, delimiter=';'))[1:]])
+    ontem = (datetime.date.today() - datetime.timedelta(days=1)).isoformat()
+    assert ts.max() <= time.time() * 1000
+    assert ts.max() < SimuladorSensor.meia_noite_de_hoje_ms()
+    # O prefixo no S3 cobre os dias dos dados e termina ontem
+    prefixos = [caminho.name for caminho in (tmp_path / "s3").glob("*/*")]
+    assert len(prefixos) == 1 and prefixos[0].endswith(ontem)
+    assert simulador.simulador.inicio_ms is None
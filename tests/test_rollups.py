@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from database import ROLLUPS, Database
+from leituras import LoteLeituras
+
+INICIO = 1_700_000_000_000
+
+
+def _lote(rng, devices, inicio_ms, passo_ms, n):
+    ts = np.tile(inicio_ms + np.arange(n, dtype=np.int64) * passo_ms, len(devices))
+    return LoteLeituras.constante(
+        np.round(rng.normal(100, 15, len(ts)), 3), ts,
+        sensorModel='Shelly EM', measureUnit='kWh', device=np.repeat(devices, n), location='Lab',
+        dataType=np.where(np.arange(len(ts)) % 3 == 0, 'Tensão', 'Consumo de Energia'))
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / "sensores"))
+    db.create_table()
+    return db
+
+
+def _consultar(db, sql):
+    conn = db.engine.raw_connection()
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def test_rollups_batem_com_a_agregacao_da_tabela_bruta(db):
+    rng = np.random.default_rng(7)
+    primeiro = _lote(rng, ['a', 'b'], INICIO, 7_000, 2_000)
+    # Intervalos sobrepostos aos buckets ja gravados, deslocados para nao repetir ts
+    db.inserir_lote(primeiro, tamanho_bloco=700)
+    db.inserir_lote(_lote(rng, ['a', 'c'], INICIO + 3_500, 11_000, 1_500), tamanho_bloco=999)
+    # Reinsercao do mesmo lote: soma de novo ao bruto e aos rollups
+    db.inserir_lote(primeiro, tamanho_bloco=1_300)
+
+    for tabela, tamanho_ms in ROLLUPS:
+        esperado = _consultar(db, (
+            f"SELECT deviceId, dataType, ts / {tamanho_ms} * {tamanho_ms} AS b, COUNT(*), MIN(data), MAX(data), "
+            "SUM(data), MAX(ts) FROM sensores GROUP BY deviceId, dataType, b ORDER BY deviceId, dataType, b"))
+        obtido = _consultar(db, (
+            f"SELECT deviceId, dataType, bucket, count, min, max, sum, last_ts FROM {tabela} "
+            "ORDER BY deviceId, dataType, bucket"))
+        assert [linha[:6] + (linha[7],) for linha in obtido] == [linha[:6] + (linha[7],) for linha in esperado]
+        assert [linha[6] for linha in obtido] == pytest.approx([linha[6] for linha in esperado])
+
+        ultimos = _consultar(db, (
+            f"SELECT r.last_value, s.data FROM {tabela} r JOIN sensores s ON s.deviceId = r.deviceId "
+            "AND s.dataType = r.dataType AND s.ts = r.last_ts"))
+        assert ultimos and all(rollup == bruto for rollup, bruto in ultimos)
+
+
+def test_consulta_desalinhada_combina_rollups_e_bordas(db):
+    rng = np.random.default_rng(3)
+    lote = _lote(rng, ['a'], INICIO, 7_000, 20_000)
+    db.inserir_lote(lote)
+    inicio, fim, passo = INICIO + 12_345, INICIO + 86_400_000 - 77_777, 3_600_000
+
+    tabelas = {tabela for tabela, _, _ in db.planejar_consulta(inicio, fim, passo)}
+    assert {'sensores_hora', 'sensores_minuto', 'sensores'} <= tabelas
+
+    selecionado = (lote.coluna('dataType') == 'Tensão') & (lote.ts >= inicio) & (lote.ts < fim)
+    ts, dados = lote.ts[selecionado], lote.data[selecionado]
+    resultado = db.consultar_agregado('a', 'Tensão', inicio, fim, passo)
+    assert [linha['bucket'] for linha in resultado] == sorted(set((ts // passo * passo).tolist()))
+    for linha in resultado:
+        grupo = dados[ts // passo * passo == linha['bucket']]
+        assert linha['count'] == len(grupo)
+        assert (linha['min'], linha['max'], linha['last']) == (grupo.min(), grupo.max(), grupo[-1])
+        assert linha['sum'] == pytest.approx(grupo.sum())